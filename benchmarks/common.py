@@ -0,0 +1,12 @@
+'''
+Imported first by the benchmark scripts, so that ``python benchmarks/NAME.py`` runs against
+the ``yaxml`` of this checkout without installing it
+'''
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,129 @@
+'''
+Synthetic YAML configs and matching RngYaml schemas for the benchmarks
+
+    python benchmarks/generate.py {wide,deep,large} [--size N] [--schema]
+
+Every shape comes as ``(schema, overlay, config)`` from :data:`SHAPES`: ``overlay`` is a schema
+adding to ``schema`` which ``merge_rngyamls`` takes in the ``DISJOINT`` mode, and ``config`` is
+valid against ``schema``.
+
+* ``wide``: a root with ``N`` distinct child elements
+* ``deep``: a chain of ``N`` (at least 2) nested elements
+* ``large``: ``N`` repeated entries of a few levels each, like a big service config
+'''
+
+import sys
+import argparse
+
+
+def wide(size):
+    '''
+    >>> print(wide(2)[2], end='')
+    Root:
+        E0: {_id: '0', _enabled: true}
+        E1: {_id: '1', _enabled: false}
+    '''
+
+    schema = ['schema:', '    Root:']
+    overlay = ['schema:', '    Root:']
+    config = ['Root:']
+    for i in range(size):
+        schema.extend([
+            '        E{}?:'.format(i),
+            '            _id: true',
+            '            _enabled?: true',
+        ])
+        overlay.append('        X{}?: {{_id: true}}'.format(i))
+        config.append("    E{0}: {{_id: '{0}', _enabled: {1}}}".format(
+            i, 'false' if i % 2 else 'true'))
+    return tuple('\n'.join(lines) + '\n' for lines in (schema, overlay, config))
+
+
+def deep(size):
+    '''
+    >>> print(deep(2)[2], end='')
+    Root:
+        L0:
+            _level: '0'
+            L1:
+                _level: '1'
+    '''
+
+    schema = ['schema:', '    Root:']
+    overlay = ['schema:', '    Root:']
+    config = ['Root:']
+    for i in range(size):
+        indent = '    ' * (i + 2)
+        schema.extend([indent + 'L{}:'.format(i), indent + '    _level: true'])
+        if i < size - 1:
+            overlay.extend([indent + 'L{}:'.format(i), indent + '    _note?: true'])
+        config.extend([indent[4: ] + 'L{}:'.format(i), indent + "_level: '{}'".format(i)])
+    return tuple('\n'.join(lines) + '\n' for lines in (schema, overlay, config))
+
+
+LARGE_SCHEMA = '''schema:
+    Root:
+        Services:
+            Service*:
+                _name: true
+                _enabled?: true
+                Endpoint+:
+                    _host: true
+                    _port: true
+                Limits?:
+                    _cpu?: true
+                    _memory?: true
+'''
+
+LARGE_OVERLAY = '''schema:
+    Root:
+        Services:
+            Service*:
+                Labels?:
+                    _team?: true
+        Owner?:
+            _email: true
+'''
+
+
+def large(size):
+    '''
+    >>> print(large(1)[2], end='')
+    Root:
+        Services:
+            - Service:
+                - {_name: svc0, _enabled: true}
+                - Endpoint: {_host: host0.example.com, _port: 1024}
+                - Limits: {_cpu: '0.5', _memory: 64Mi}
+    '''
+
+    config = ['Root:', '    Services:']
+    for i in range(size):
+        config.extend([
+            '        - Service:',
+            '            - {{_name: svc{}, _enabled: {}}}'.format(i, 'false' if i % 2 else 'true'),
+        ])
+        config.extend(
+            '            - Endpoint: {{_host: host{}.example.com, _port: {}}}'.format(i, 1024 + j)
+            for j in range(i % 3 + 1))
+        config.append("            - Limits: {{_cpu: '{}.5', _memory: {}Mi}}".format(
+            i % 8, 64 * (i % 16 + 1)))
+    return (LARGE_SCHEMA, LARGE_OVERLAY, '\n'.join(config) + '\n')
+
+
+SHAPES = {'wide': wide, 'deep': deep, 'large': large}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('shape', choices=sorted(SHAPES))
+    parser.add_argument('--size', type=int, default=100)
+    parser.add_argument('--schema', action='store_true', help='print the schema, not the config')
+    opts = parser.parse_args(args)
+
+    schema, _, config = SHAPES[opts.shape](opts.size)
+    sys.stdout.write(schema if opts.schema else config)
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
@@ -0,0 +1,58 @@
+'''
+Compare the YAML loaders available to ``yaxml.load_yaml_as_xml`` on a large config
+
+    python benchmarks/loader.py [--entries N] [--repeat R]
+'''
+
+import sys
+import argparse
+import timeit
+
+import yaml as pyyaml
+
+import common  # noqa: F401
+import yaxml
+
+
+def make_config(entries):
+    lines = ['Root:', '    Services:', '        Service:']
+    for i in range(entries):
+        lines.extend([
+            '            - _name: svc{}'.format(i),
+            '              _enabled: {}'.format('true' if i % 2 else 'false'),
+            '              Endpoint:',
+            '                  _host: host{}.example.com'.format(i),
+            '                  _port: {}'.format(1024 + i),
+            '              Limits:',
+            '                  _cpu: {}.5'.format(i % 8),
+            '                  _memory: "{}Mi"'.format(64 * (i % 16 + 1)),
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    source = make_config(opts.entries)
+    loaders = [('SafeLoader', pyyaml.SafeLoader)]
+    if hasattr(pyyaml, 'CSafeLoader'):
+        loaders.append(('CSafeLoader', pyyaml.CSafeLoader))
+    else:
+        sys.stderr.write('libyaml is not available; CSafeLoader is skipped\n')
+
+    print('{} entries, {} KiB of YAML, best of {}'.format(
+        opts.entries, len(source) // 1024, opts.repeat))
+    for name, loader in loaders:
+        parse = min(timeit.repeat(lambda: yaxml.load_yaml(source, loader),
+                                  number=1, repeat=opts.repeat))
+        convert = min(timeit.repeat(lambda: yaxml.load_yaml_as_xml(source, loader=loader),
+                                    number=1, repeat=opts.repeat))
+        print('{:12} load_yaml {:8.3f} s    load_yaml_as_xml {:8.3f} s'.format(
+            name, parse, convert))
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
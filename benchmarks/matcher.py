@@ -0,0 +1,109 @@
+'''
+Compare the ways of validating YAML configs against an RngYaml schema
+
+    python benchmarks/matcher.py [--documents N] [--services S] [--repeat R]
+
+Compile time is the time to get from the RngYaml source to something that validates; the
+per-document time starts from the loaded YAML object (``load_yaml_as_xml`` is counted for the
+XML-based paths).
+'''
+
+import sys
+import argparse
+import shutil
+import timeit
+import xml.etree.ElementTree as ET
+
+import yaml as pyyaml
+
+import common  # noqa: F401
+import yaxml
+
+SCHEMA = '''
+schema:
+    Root:
+        Services:
+            Service*:
+                _name: true
+                _enabled?: true
+                Endpoint+:
+                    _host: true
+                    _port: true
+                Limits?:
+                    _cpu?: true
+                    _memory?: true
+                Tag*: false
+        Owner?:
+            _email: true
+'''
+
+
+def make_config(services, seed):
+    return {'Root': {
+        'Services': [ {'Service': [
+            {'_name': 'svc{}'.format(i), '_enabled': bool((i + seed) % 2)},
+            [ {'Endpoint': {'_host': 'h{}'.format(j), '_port': 1024 + j}}
+              for j in range((i + seed) % 3 + 1) ],
+            {'Limits': {'_cpu': 2, '_memory': '64Mi'}},
+            [ {'Tag': {}} for _ in range(i % 4) ],
+        ]} for i in range(services) ],
+        'Owner': {'_email': 'x@example.com'},
+    }}
+
+
+def best(f, repeat):
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--services', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    configs = [ make_config(opts.services, seed)
+                for seed in range(opts.documents) ]
+    sources = [ pyyaml.safe_dump(c) for c in configs ]
+
+    def compile_rng():
+        return ET.tostring(yaxml.compile_rngyaml_to_rng(yaxml.load_rngyaml(SCHEMA, False)),
+                           'unicode')
+
+    rng = compile_rng()
+    python_rng = yaxml.relaxng.RelaxNG(rng)
+    validator = yaxml.RngYamlValidator(SCHEMA)
+    matcher = yaxml.RngYamlMatcher(SCHEMA)
+
+    def to_xml():
+        return [ ET.tostring(yaxml.load_yaml_as_xml(s, validate='none').getroot(), 'unicode')
+                 for s in sources ]
+
+    rows = [
+        ('load_yaml_as_xml only', best(compile_rng, opts.repeat),
+         best(to_xml, opts.repeat)),
+        ('RELAX NG, Python engine', best(lambda: yaxml.relaxng.RelaxNG(compile_rng()),
+                                         opts.repeat),
+         best(lambda: [ python_rng.validate(yaxml.load_yaml_as_xml(s, validate='none'))
+                        for s in sources ], opts.repeat)),
+        ('RngYamlValidator', best(lambda: yaxml.RngYamlValidator(SCHEMA), opts.repeat),
+         best(lambda: [ validator.validate(c) for c in configs ], opts.repeat)),
+        ('RngYamlMatcher', best(lambda: yaxml.RngYamlMatcher(SCHEMA), opts.repeat),
+         best(lambda: [ matcher.validate(c) for c in configs ], opts.repeat)),
+    ]
+    if shutil.which('xmllint'):
+        rows.insert(1, ('xmllint, one batch', rows[0][1], best(
+            lambda: yaxml.validate_many(to_xml(), rng, 'xmllint'), opts.repeat)))
+    else:
+        sys.stderr.write('xmllint is not available; skipped\n')
+
+    assert all(ok for ok, _ in (matcher.validate(c) for c in configs))
+    print('{} documents of {} services, {} states, best of {}'.format(
+        opts.documents, opts.services, matcher.state_count(), opts.repeat))
+    for name, compile_time, total in rows:
+        print('{:26} compile {:8.2f} ms    per document {:8.3f} ms'.format(
+            name, compile_time * 1000, total * 1000 / opts.documents))
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
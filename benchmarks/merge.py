@@ -0,0 +1,56 @@
+'''
+Time ``yaxml.merge_rngyamls`` on schemas with many sibling elements
+
+    python benchmarks/merge.py [--siblings N] [--overlay K] [--repeat R]
+
+The second schema shares half of its elements with the first, so half of the siblings are
+merged recursively and the other half appended.  ``merged_rngyamls`` is then timed merging a
+``K``-element overlay onto the same base, which it leaves intact.
+'''
+
+import sys
+import copy
+import argparse
+import time
+import timeit
+
+import common  # noqa: F401
+import yaxml
+
+
+def make_schema(siblings, offset):
+    lines = ['schema:', '    Root:']
+    for i in range(offset, offset + siblings):
+        lines.extend([
+            '        Item{}:'.format(i),
+            '            _id{}: true'.format(offset),
+        ])
+    return yaxml.load_rngyaml('\n'.join(lines) + '\n', validate=False)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--siblings', type=int, default=10000)
+    parser.add_argument('--overlay', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    print('best of {}'.format(opts.repeat))
+    for siblings in (opts.siblings // 10, opts.siblings):
+        base = make_schema(siblings, 0)
+        new = make_schema(siblings, siblings // 2)
+        times = []
+        for _ in range(opts.repeat):
+            target = copy.deepcopy(base)
+            start = time.perf_counter()
+            yaxml.merge_rngyamls(target, new)
+            times.append(time.perf_counter() - start)
+        overlay = make_schema(opts.overlay, siblings - opts.overlay // 2)
+        overlaid = min(timeit.repeat(lambda: yaxml.merged_rngyamls(base, overlay),
+                                     number=1, repeat=opts.repeat))
+        print('{:8} siblings  merge_rngyamls {:8.3f} s    merged_rngyamls (overlay) {:8.5f} s'
+              .format(siblings, min(times), overlaid))
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
@@ -0,0 +1,80 @@
+'''
+Compare the dict and the Node forms of a large RngYaml pattern tree
+
+    python benchmarks/pattern.py [--nodes N] [--repeat R]
+
+Reports the memory taken by each tree and the time compile_rngyaml_to_rng takes on it
+and merged_rngyamls takes to merge another tree of the same size half of which overlaps.
+'''
+
+import gc
+import sys
+import argparse
+import timeit
+import tracemalloc
+
+import common  # noqa: F401
+import yaxml
+
+
+def make_schema(nodes, offset=0):
+    # every Group has 2 elements with an optional attribute each: 1 + 2 * 4 + 1 nodes
+    lines = ['schema:', '    Root:']
+    for i in range(offset, offset + nodes // 10):
+        lines.extend([
+            '        Group{}:'.format(i),
+            '            Item:',
+            '                _id?: true',
+            '            Other:',
+            '                _id?: true',
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def count_nodes(pattern):
+    if isinstance(pattern, (list, tuple)):
+        return sum(count_nodes(e) for e in pattern)
+    if isinstance(pattern, yaxml.Node):
+        child = pattern.child
+    else:
+        child = pattern.get('child')
+    return 1 + (0 if child is None else count_nodes(child))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    ret = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return ret, size
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args(args)
+
+    source = make_schema(opts.nodes)
+    dicts = yaxml.load_rngyaml(source, validate=False)
+    # rebuilt so that only the tree itself is traced, not what the YAML loader leaves behind
+    dicts, dicts_size = measure(lambda: yaxml.to_dicts(yaxml.to_nodes(dicts)))
+    nodes, nodes_size = measure(lambda: yaxml.to_nodes(dicts))
+    other = yaxml.load_rngyaml(make_schema(opts.nodes, opts.nodes // 20), validate=False)
+
+    print('{} nodes, best of {}'.format(count_nodes(dicts), opts.repeat))
+    for name, tree, size, other in [('dict', dicts, dicts_size, other),
+                                    ('Node', nodes, nodes_size, yaxml.to_nodes(other))]:
+        compile_time = min(timeit.repeat(lambda: yaxml.compile_rngyaml_to_rng(tree),
+                                         number=1, repeat=opts.repeat))
+        merge_time = min(timeit.repeat(
+            lambda: yaxml.merged_rngyamls(tree, other, yaxml.OVERWRITE_QUIET),
+            number=1, repeat=opts.repeat))
+        print('{:5} {:8.1f} MiB    compile_rngyaml_to_rng {:7.3f} s    '
+              'merged_rngyamls {:7.4f} s'.format(
+                  name, size / 1024 / 1024, compile_time, merge_time))
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
@@ -0,0 +1,163 @@
+'''
+Time each stage of yaxml on synthetic configs and schemas and write the results as JSON
+
+    python benchmarks/suite.py [-k PATTERN] [--output results.json] [--compare old.json]
+
+The stages are timed separately for every shape of :mod:`generate`: ``load_yaml_as_xml`` of the
+config, ``load_rngyaml`` of the schema (without the meta-validation), ``compile_rngyaml_to_rng``
+of the loaded schema, ``merged_rngyamls`` of the loaded overlay onto it (which leaves it intact,
+so every call reuses the same one) and ``run_validator`` of the converted config against the
+compiled schema.
+
+Each benchmark is run ``--rounds`` times, every round calling it as many times as takes about
+``--min-time`` seconds; the JSON has the statistics of the per-call time of the rounds along
+with the commit and the machine, and ``--compare`` prints the ratios to an earlier run.
+'''
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import platform
+import argparse
+import statistics
+import subprocess
+import xml.etree.ElementTree as ET
+
+import common  # noqa: F401
+import yaxml
+
+import generate
+
+
+def make_benchmarks(sizes, backend):
+    '''
+    ``{name: (setup, run)}``: ``setup(n)`` returns the arguments of ``n`` calls of ``run``
+    '''
+
+    benchmarks = {}
+    for shape, size in sorted(sizes.items()):
+        schema, overlay, config = generate.SHAPES[shape](size)
+        pattern = yaxml.load_rngyaml(schema, False)
+        overlay_pattern = yaxml.load_rngyaml(overlay, False)
+        rng = ET.tostring(yaxml.compile_rngyaml_to_rng(pattern), 'unicode')
+        xml = ET.tostring(yaxml.load_yaml_as_xml(config).getroot(), 'unicode')
+        rc, err = yaxml.run_validator(xml, rng, backend)
+        assert 0 == rc, "{}: the config is invalid: {}".format(shape, err)
+
+        def same(n, *args):
+            return [args] * n
+
+        stages = {
+            'load_yaml_as_xml': (lambda n, c=config: same(n, c), yaxml.load_yaml_as_xml),
+            'load_rngyaml': (lambda n, s=schema: same(n, s, False), yaxml.load_rngyaml),
+            'compile_rngyaml_to_rng': (lambda n, p=pattern: same(n, p),
+                                       yaxml.compile_rngyaml_to_rng),
+            'merged_rngyamls': (lambda n, p=pattern, o=overlay_pattern: same(n, p, o),
+                                yaxml.merged_rngyamls),
+            'run_validator': (lambda n, x=xml, r=rng: same(n, x, r, backend),
+                              yaxml.run_validator),
+        }
+        for stage, benchmark in stages.items():
+            benchmarks['{}[{}]'.format(stage, shape)] = benchmark
+    return benchmarks
+
+
+def time_calls(setup, run, n):
+    args = setup(n)
+    t0 = time.perf_counter()
+    for a in args:
+        run(*a)
+    return (time.perf_counter() - t0) / n
+
+
+def measure(setup, run, rounds, min_time):
+    # calibrate the number of calls per round
+    number = 1
+    t = time_calls(setup, run, number)
+    while t * number < min_time / 10 and number < 1 << 20:
+        number *= 10
+        t = time_calls(setup, run, number)
+    number = max(1, int(min_time / t))
+    times = [ time_calls(setup, run, number) for _ in range(rounds) ]
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'rounds': rounds,
+        'number': number,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old):
+    print('{:40} {:>12} {:>12} {:>8}'.format('benchmark', 'old', 'new', 'new/old'))
+    for name, stats in sorted(results.items()):
+        before = old.get(name)
+        if None is before:
+            continue
+        print('{:40} {:10.3f}ms {:10.3f}ms {:8.2f}'.format(
+            name, before['min'] * 1000, stats['min'] * 1000, stats['min'] / before['min']))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-k', '--select', default='*',
+                        help='run the benchmarks whose names match this glob')
+    parser.add_argument('--wide', type=int, default=500, help='elements of the wide config')
+    parser.add_argument('--deep', type=int, default=100,
+                        help='depth of the deep config (libxml2 limits it to about 120)')
+    parser.add_argument('--large', type=int, default=1000, help='entries of the large config')
+    parser.add_argument('--backend', default='auto', choices=yaxml.VALIDATOR_BACKENDS)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds per round (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='print the ratios to the results in this JSON file')
+    opts = parser.parse_args(args)
+
+    sizes = {'wide': opts.wide, 'deep': opts.deep, 'large': opts.large}
+    results = {}
+    for name, (setup, run) in sorted(make_benchmarks(sizes, opts.backend).items()):
+        if not fnmatch.fnmatchcase(name, opts.select):
+            continue
+        results[name] = stats = measure(setup, run, opts.rounds, opts.min_time)
+        sys.stderr.write('{:40} {:10.3f}ms  (median {:.3f}ms, {} x {})\n'.format(
+            name, stats['min'] * 1000, stats['median'] * 1000, stats['rounds'], stats['number']))
+
+    report = {
+        'version': yaxml.__version__,
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'params': dict(sizes, backend=yaxml.select_backend(opts.backend),
+                       rounds=opts.rounds, min_time=opts.min_time),
+        'results': results,
+    }
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump(report, fp, indent=1, sort_keys=True)
+            fp.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    if opts.compare:
+        with open(opts.compare) as fp:
+            compare(results, json.load(fp)['results'])
+
+
+if '__main__' == __name__:
+    main(sys.argv[1: ])
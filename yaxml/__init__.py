@@ -1,3 +1,4 @@
+import re
 import sys
 import os
 import os.path
@@ -5,12 +6,40 @@ import tempfile
 import subprocess
 import numbers
 import pprint
+import hashlib
+import threading
+import contextlib
+import collections
 import xml.etree.ElementTree as ET
+import xml.parsers.expat
 
 import yaml as pyyaml
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 from . import relaxng_in_relaxng
 
+__version__ = '0.1'
+
+YAML_LOADER = getattr(pyyaml, 'CSafeLoader', pyyaml.SafeLoader)
+
+
+def load_yaml(source, loader=None):
+    '''
+    Parse a YAML string or stream with ``loader``, which defaults to :data:`YAML_LOADER`, the
+    libyaml-based ``CSafeLoader`` if available and ``SafeLoader`` otherwise
+
+    >>> load_yaml('a: [1, true]', pyyaml.SafeLoader)
+    {'a': [1, True]}
+    '''
+
+    if isinstance(source, Text):
+        # libyaml only takes exact strings
+        source = str(source)
+    return pyyaml.load(source, Loader=loader or YAML_LOADER)
+
 
 def abbrev(source):
     '''
@@ -38,6 +67,46 @@ class RngYamlParseError(Exc):
         super(RngYamlParseError, self).__init__(fmt, *args)
 
 
+def _format_path(path):
+    '''
+    Materialize a path kept as nested ``(parent, step)`` pairs, whose innermost parent is None
+    or a string prefix, so that walkers only pay for the path when an error message needs it
+
+    >>> _format_path(((None, 'a'), 'b'))
+    '/a/b'
+    >>> _format_path((('/', 'a'), 'b'))
+    '//a/b'
+    >>> _format_path(None)
+    '/'
+    '''
+
+    steps = []
+    while isinstance(path, tuple):
+        path, step = path
+        steps.append(step)
+    return (path or '') + ''.join('/' + step for step in reversed(steps)) or '/'
+
+
+def _trampoline(gen):
+    '''
+    Run the generator ``gen``, which yields generators for the recursive calls it wants to
+    make and receives their return values, on an explicit stack instead of the C stack
+    '''
+
+    stack = [gen]
+    value = None
+    while stack:
+        try:
+            call = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+        stack.append(call)
+        value = None
+    return value
+
+
 MODIFIERS = [ 'zeroOrMore', 'oneOrMore', 'optional' ]
 MODIFIERS_D = dict(p for p in zip(['*', '+', '?'], MODIFIERS))
 
@@ -48,17 +117,24 @@ class RngYamlParser(object):
         self._directive_prefix = directive_prefix
         self._extra_checks = []
 
-    def parse_pattern(self, path, y):  # I know it's very complex # noqa: C901
+    def parse_pattern(self, path, y):
+        return _trampoline(self._parse_pattern(path, y))
+
+    def parse_element(self, path, name, val, element):
+        return _trampoline(self._parse_element(path, name, val, element))
+
+    def _parse_pattern(self, path, y):  # I know it's very complex # noqa: C901
         if isinstance(y, dict):
-            interleave = []
+            interleave = SiblingList()
             for k, v in y.items():
                 if k in (self._directive_prefix + 'attribute', self._directive_prefix + 'element'):
                     element = k[len(self._directive_prefix): ]
                     assert 1 == len(v), \
                         "{}{} at {!r} MUST contain a sinle-element dict, but: {}".format(
-                            self._directive_prefix, element, path, pprint.pformat(v))
+                            self._directive_prefix, element, _format_path(path),
+                            pprint.pformat(v))
                     vk, vv = v.popitem()
-                    e = self.parse_element(path, vk, vv, element)
+                    e = yield self._parse_element(path, vk, vv, element)
                     interleave.append(e)
                 elif self._directive_prefix + 'interleave' == k:
                     raise Exception("not supported")
@@ -85,7 +161,7 @@ class RngYamlParser(object):
                 elif self._directive_prefix + 'grammar' == k:
                     raise Exception("not supported")
                 else:
-                    e = self.parse_element(path, k, v, None)
+                    e = yield self._parse_element(path, k, v, None)
                     interleave.append(e)
             if 1 == len(interleave):
                 return interleave[0]
@@ -93,13 +169,16 @@ class RngYamlParser(object):
                 return interleave
             return { 'element': 'interleave', 'child': interleave }
         elif isinstance(y, list):
-            return [ self.parse_pattern(path, e) for e in y ]
+            ret = SiblingList()
+            for e in y:
+                ret.append((yield self._parse_pattern(path, e)))
+            return ret
         elif is_scalar(y):
             return self.parse_text(path, y)
         else:
-            raise Exception("{}: what is {}".format(path, pprint.pformat(y)))
+            raise Exception("{}: what is {}".format(_format_path(path), pprint.pformat(y)))
 
-    def parse_element(self, path, name, val, element):
+    def _parse_element(self, path, name, val, element):
         mod = MODIFIERS_D.get(name[-1: ])
         if mod:
             realname = name[ :-1]
@@ -113,7 +192,8 @@ class RngYamlParser(object):
             else:
                 element = 'element'
 
-        child = self.parse_pattern(path + '/' + realname, val)
+        step = '@' + realname if 'attribute' == element else realname
+        child = yield self._parse_pattern((path, step), val)
         ret = { 'name': realname, 'element': element, 'child': child }
 
         if mod:
@@ -125,20 +205,25 @@ class RngYamlParser(object):
         if None is y or False is y:
             return { 'element': 'empty' }
         if True is not y:
-            self._extra_checks.append((path, str(y)))
+            self._extra_checks.append((_format_path(path), str(y)))
         return { 'element': 'text' }
 
     def extra_checks(self):
         return self._extra_checks
 
 
-def load_rngyaml(source, validate=True):
+def parse_rngyaml(source, loader=None):
+    '''
+    Parse an RngYaml schema from a path or a string into its pattern tree and the
+    ``(path, value)`` pairs :meth:`RngYamlParser.extra_checks` collected, without validating it
+    '''
+
     source_abr = abbrev(source)
     if is_filepath(source):
-        with open(source) as fp:
-            y = pyyaml.load(fp)
+        with open(source, 'rb') as fp:
+            y = load_yaml(fp, loader)
     else:
-        y = pyyaml.load(source)
+        y = load_yaml(source, loader)
     assert isinstance(y, dict), \
         "RngYaml {!r} MUST have a mapping at the top-level, but: {}".format(
             source_abr, pprint.pformat(y))
@@ -147,7 +232,19 @@ def load_rngyaml(source, validate=True):
     directive_prefix = y.get('directive-prefix', '$')
     schema = y.get('schema')
     parser = RngYamlParser(attr_prefix, directive_prefix)
-    ret = parser.parse_pattern('/', schema)
+    return (parser.parse_pattern('/', schema), parser.extra_checks())
+
+
+def load_rngyaml(source, validate=True, loader=None, cache=None):
+    '''
+    Load an RngYaml schema from a path or a string into its pattern tree
+
+    ``cache`` is an optional :class:`yaxml.cache.RngYamlCache` to look the result up in.
+    '''
+
+    if None is not cache:
+        return cache.load_rngyaml(source, validate, loader)
+    ret = parse_rngyaml(source, loader)[0]
 
     if validate:
         ret_as_xmlstr = ET.tostring(compile_rngyaml_to_rng(ret), 'unicode')
@@ -169,104 +266,216 @@ def merge_mode_to_str(m):
     return MEGE_MODE_S.get(m, "Unknown merge mode " + str(m))
 
 
-def merge_rngyamls(base, new, default_merge_mode=DISJOINT):  # noqa: C901
-    def merge(path, base, new, merge_mode, interleave=False):
+class _DictPatterns(object):
+    '''
+    How :func:`_merge_siblings` reads and builds patterns in the dict form
+    '''
+
+    pattern_type = dict
+    siblings_type = list
+
+    @staticmethod
+    def indexed(siblings):
+        return SiblingList(siblings)
+
+    @staticmethod
+    def key(e):
+        return (e['element'], e['name']) if 'name' in e else None
+
+    @staticmethod
+    def child(e):
+        return e.get('child')
+
+    @staticmethod
+    def with_child(e, child):
+        return dict(e, child=child)
+
+
+def _sibling_index(patterns, base, rebuild=False):
+    '''
+    The :class:`yaxml.pattern.SiblingIndex` of ``base``, built (and kept with it if it can keep
+    one) if it's missing or ``rebuild`` says it's out of date
+    '''
+
+    index = None if rebuild else getattr(base, 'sibling_index', None)
+    if None is index:
+        index = SiblingIndex.of(base, patterns.key)
+        if isinstance(base, (SiblingList, SiblingTuple)):
+            base.sibling_index = index
+    return index
+
+
+def _merge_siblings(patterns, path, base, new, merge_mode):  # noqa: C901
+    '''
+    Merge the patterns ``new`` (a sibling list or a single pattern) into the sibling list
+    ``base`` for :func:`_trampoline` and return the result as a new list
+
+    Siblings are matched by ``(element, name)`` through the index ``base`` keeps (see
+    :class:`yaxml.pattern.SiblingIndex`), and the result keeps one extending it, so only the
+    keys of ``new`` are looked up.  ``patterns`` tells how to read and build the patterns,
+    :class:`_DictPatterns` or :class:`yaxml.pattern.NodePatterns`.
+    '''
+
+    index = _sibling_index(patterns, base)
+    # slicing copies even the subclasses in C, where list() would iterate over them
+    ret = base[:]
+    if not isinstance(ret, list):
+        ret = list(ret)
+    added = {}
+    for ne in new if isinstance(new, patterns.siblings_type) else (new, ):
+        if not isinstance(ne, patterns.pattern_type):
+            raise RngYamlParseError("{}: {}: what is {} of type {}".format(
+                _format_path(path), base, pprint.pformat(ne), type(ne)))
+        key = patterns.key(ne)
+        i = None if key is None else added.get(key, index.get(key))
+        if i is not None and i < len(base) and key != patterns.key(base[i]):
+            # a pattern of base was renamed in place
+            index = _sibling_index(patterns, base, True)
+            i = added.get(key, index.get(key))
+        if i is None:
+            if key is not None:
+                added[key] = len(ret)
+            ret.append(ne)
+            continue
+        be = ret[i]
+        if DISJOINT == merge_mode:
+            assert 'attribute' != key[0], \
+                "{}: {!r} and {!r} have a common attr {!r}, aren't disjoint".format(
+                    _format_path(path), be, ne, key[1])
+            new_child, child = patterns.child(ne), patterns.child(be)
+            if new_child is None:
+                continue
+            if child is not None:
+                if not isinstance(child, patterns.siblings_type):
+                    child = patterns.indexed((child, ))
+                new_child = yield _merge_siblings(
+                    patterns, (path, key[1]), child, new_child, merge_mode)
+            ret[i] = patterns.with_child(be, new_child)
+        else:
+            if OVERWRITE_WARN == merge_mode:
+                sys.stderr.write("WARN: overwriting {}\n".format(key[1]))
+            ret[i] = ne
+    ret = patterns.indexed(ret)
+    ret.sibling_index = index.extended(added)
+    return ret
+
+
+def merged_rngyamls(base, new, default_merge_mode=DISJOINT):  # noqa: C901
+    '''
+    Merge the RngYaml pattern ``new`` into ``base`` and return the result as a new pattern,
+    leaving both untouched
+
+    Only the patterns on the way to a change are copied, and the result shares every other
+    subtree with ``base`` and ``new``, so modifying one of them in place afterwards shows in
+    the others too.  Siblings are matched through the :class:`yaxml.pattern.SiblingIndex` their
+    list keeps, which the result's lists extend, so that after the first merge into a list only
+    the keys of ``new`` are looked up; what's left is copying the lists on the way to a change,
+    which Python does in C.
+
+    Either of them may be a :class:`yaxml.pattern.Node` tree, which makes the result one too.
+    '''
+
+    if isinstance(base, Node) or isinstance(new, Node):
+        return merged_nodes(to_nodes(base), to_nodes(new), default_merge_mode)
+
+    def merge_siblings(path, base, new, merge_mode):
+        return _merge_siblings(_DictPatterns, path, base, new, merge_mode)
+
+    def merge(path, base, new, merge_mode):
         if isinstance(base, dict):
-            assert isinstance(new, dict), "base is a dict but new is: {}".format(
-                pprint.pformat(new))
-
-            if base['element'] == 'interleave':
-                assert new['element'] == 'interleave', "{}: cannot merge {!r} into {!r}".foramt(
-                    path, new, base)
-                merge(path, base['child'], new['child'], merge_mode, True)
-            elif 'attribute' == base['element'] and 'attribute' == new['element']:
-                if DISJOINT == default_merge_mode:
-                    assert base['name'] != new['name'], \
-                        "{} and {} aren't disjoint".format(
-                            pprint.pformat(base), pprint.pformat(new))
-            else:
-                for k, v in new.items():
-                    if DISJOINT == default_merge_mode:
-                        assert 'child' == k or v == base[k] or k not in base, \
-                            "{} and {} has {!r}={!r} (={!r}) in common, aren't disjoint".format(
-                                pprint.pformat(base), pprint.pformat(new), k, base[k], v)
-                        merge(path + '/' + k, base[k], new[k], merge_mode)
+            assert isinstance(new, dict), "{}: base is a dict but new is: {}".format(
+                _format_path(path), pprint.pformat(new))
+
+            if 'interleave' in (base['element'], new['element']):
+                if 'interleave' != base['element']:
+                    base = {'element': 'interleave', 'child': [base]}
+                child = base['child'] if isinstance(base['child'], list) else [base['child']]
+                return dict(base, child=(yield merge_siblings(
+                    path, child, new['child'] if 'interleave' == new['element'] else new,
+                    merge_mode)))
+            if 'attribute' == base['element'] and 'attribute' == new['element']:
+                if DISJOINT == merge_mode:
+                    assert base['name'] != new['name'], "{}: {} and {} aren't disjoint".format(
+                        _format_path(path), pprint.pformat(base), pprint.pformat(new))
+                return base
+
+            ret = base
+            for k, v in new.items():
+                if k in base:
+                    assert 'child' == k or v == base[k] or DISJOINT != merge_mode, \
+                        "{}: {} and {} has {!r}={!r} (={!r}) in common, aren't disjoint".format(
+                            _format_path(path), pprint.pformat(base), pprint.pformat(new),
+                            k, base[k], v)
+                    b = base[k]
+                    if 'child' == k and isinstance(v, list) and not isinstance(b, list):
+                        b = [b]
+                    v = yield merge((path, k), b, v, merge_mode)
+                if v is not base.get(k):
+                    if ret is base:
+                        ret = dict(base)
+                    ret[k] = v
+            return ret
         elif isinstance(base, list):
-            if isinstance(new, list):
-                assert interleave, \
-                    "{}: don't know how to merge lists not under <interleave>".format(path)
-                for ne in new:
-                    for be in base:
-                        if DISJOINT == merge_mode:
-                            if be['name'] == ne['name']:
-                                assert not (be['element'] == 'attribute' and
-                                            ne['element'] == 'attribute'), \
-                                    "{!r} and {!r} have a common attr {!r}, aren't disjoint".format(
-                                        base, new, be['name'])
-                                if not isinstance(be['child'], list):
-                                    be['child'] = [be['child']]
-                                merge(path + '/' + be['name'], be['child'], ne['child'], merge_mode)
-                                break
-                        else:
-                            if be['element'] == ne['element'] and be['name'] == ne['name']:
-                                if OVERWRITE_WARN == merge_mode:
-                                    sys.stderr.write("WARN: overwriting {}\n".format(be['name']))
-                                be.clear()
-                                be.update(ne)
-                                break
-                    else:
-                        base.append(ne)
-            elif isinstance(new, dict):
-                for be in base:
-                    if DISJOINT == merge_mode:
-                        assert not (new['element'] == be['element'] and
-                                    new['name'] == be['name']), \
-                            "{!r} and {!r} have a common attr {!r}, aren't disjoint".format(
-                                be, new, be['name'])
-                else:
-                    base.append(new)
-            else:
-                raise RngYamlParseError("{}: {}: what is {} of type {}".format(
-                    path, base, pprint.pformat(new), type(new)))
+            return (yield merge_siblings(path, base, new, merge_mode))
         elif is_scalar(base):
             if DISJOINT == merge_mode:
-                assert base == new, "{!r} != {!r}: not disjoint".format(base, new)
+                assert base == new, "{}: {!r} != {!r}: not disjoint".format(
+                    _format_path(path), base, new)
+            return base
         else:
-            raise Exception("{}: what is {}".format(path, pprint.pformat(base)))
+            raise Exception("{}: what is {}".format(
+                _format_path(path), pprint.pformat(base)))
+
+    return _trampoline(merge(None, base, new, default_merge_mode))
 
-    merge('/', base, new, default_merge_mode)
+
+def merge_rngyamls(base, new, default_merge_mode=DISJOINT):
+    '''
+    Merge the RngYaml pattern ``new`` into ``base`` in place and return ``base``
+
+    Siblings are matched by ``(element, name)`` through an index, so the merge takes time
+    linear in the size of ``new``, besides copying the sibling lists it changes.  Paths for
+    error messages are only formatted on failure.
+    See :func:`merged_rngyamls` to keep ``base`` intact.
+    '''
+
+    merged = merged_rngyamls(base, new, default_merge_mode)
+    if merged is base:
+        pass
+    elif isinstance(base, Node):
+        base.element, base.name, base.child = merged.element, merged.name, merged.child
+    else:
+        base.clear()
+        base.update(merged)
     return base
 
 
 def compile_rngyaml_to_rng(rngyaml):  # noqa: C901
-    assert isinstance(rngyaml, dict), \
+    assert isinstance(rngyaml, (dict, Node)), \
         "RngYaml MUST have a mapping at its root, but: {}".format(pprint.pformat(rngyaml))
 
-    def parse(path, ry, xml):
-        if isinstance(ry, dict):
-            element = ry['element']
+    dummy_root = ET.Element(None)
+    stack = [('/', rngyaml, dummy_root)]
+    while stack:
+        path, ry, xml = stack.pop()
+        if isinstance(ry, (dict, Node)):
+            if isinstance(ry, Node):
+                element, name, child = ry.element, ry.name, ry.child
+            else:
+                element, name, child = ry['element'], ry.get('name'), ry.get('child')
             if element in ('element', 'attribute'):
-                name = ry['name']
                 sub = ET.SubElement(xml, element)
                 sub.set('name', name)
-                child = ry.get('child')
-                parse(path + '/' + 'element:' + name, child, sub)
-            elif element in MODIFIERS:
-                sub = ET.SubElement(xml, element)
-                child = ry['child']
-                parse(path + '/' + element, child, sub)
-            elif 'interleave' == element:
+                stack.append(((path, 'element:' + name), child, sub))
+            elif element in MODIFIERS or 'interleave' == element:
                 sub = ET.SubElement(xml, element)
-                parse(path + '/' + element, ry['child'], sub)
-            elif 'text' == element:
+                stack.append(((path, element), child, sub))
+            elif element in ('text', 'empty'):
                 sub = ET.SubElement(xml, element)
-        elif isinstance(ry, list):
-            for e in ry:
-                parse(path, e, xml)
+        elif isinstance(ry, (list, tuple)):
+            stack.extend((path, e, xml) for e in reversed(ry))
         else:
-            raise Exception("{}: what is {}".format(path, pprint.pformat(ry)))
-    dummy_root = ET.Element(None)
-    parse('/', rngyaml, dummy_root)
+            raise Exception("{}: what is {}".format(_format_path(path), pprint.pformat(ry)))
     try:
         root = next(child for child in dummy_root)
     except Exception:
@@ -299,9 +508,97 @@ def is_scalar(x):
     return isinstance(x, (str, numbers.Number, bool))
 
 
-def load_yaml_as_xml(source, attribute_prefix='_'):
-    source_abr = source if len(source) <= 13 else source[ :5] + '...' + source[-5: ]
-    y = pyyaml.load(source)
+XML_VALIDATE_MODES = ('none', 'names', 'full')
+
+
+@contextlib.contextmanager
+def open_yaml_source(source):
+    '''
+    Yield the object to hand the YAML loader for ``source`` and a short description of it for
+    error messages
+
+    ``source`` is a path, the document itself (``str`` or ``bytes``), a text or binary file
+    object or an ``mmap``; files are read by the loader in chunks rather than as a whole.
+    '''
+
+    if isinstance(source, str) and is_filepath(source):
+        with open(source, 'rb') as fp:
+            yield (fp, source)
+    else:
+        yield (str(source) if isinstance(source, Text) else source, yaml_source_abbrev(source))
+
+
+def yaml_source_abbrev(source):
+    '''
+    >>> yaml_source_abbrev('Root: {A: {_x: 1}}')
+    'Root:...: 1}}'
+    >>> yaml_source_abbrev(b'0123456789abcdef')
+    b'01234...bcdef'
+    '''
+
+    if isinstance(source, (str, bytes)):
+        if len(source) <= 13:
+            return source
+        dots = '...' if isinstance(source, str) else b'...'
+        return source[ :5] + dots + source[-5: ]
+    return getattr(source, 'name', None) or '<{}>'.format(type(source).__name__)
+
+
+def load_yaml_as_xml(source, attribute_prefix='_', loader=None, validate='names', checks=None):
+    '''
+    Convert the YAML ``source`` (see :func:`open_yaml_source`) into an ``ET.ElementTree``
+
+    ``validate`` is one of :data:`XML_VALIDATE_MODES`: ``'full'`` serializes the result and
+    checks that it parses, ``'names'`` checks the element and attribute names and the
+    characters of the attribute values in process (see :func:`check_xml_names`), which is
+    equivalent for a tree built here, and ``'none'`` skips the check.
+
+    ``checks`` is an RngYaml schema (a path or the document itself) or the
+    :class:`yaxml.ValueChecks` compiled from one, whose attribute values are checked
+    while converting.
+    '''
+
+    assert validate in XML_VALIDATE_MODES, "unknown validate mode {!r}".format(validate)
+    checks = _value_checks(checks, loader)
+    with open_yaml_source(source) as (stream, source_abr):
+        y = load_yaml(stream, loader)
+    return yaml_object_as_xml(y, attribute_prefix, validate, checks, source_abr)
+
+
+def iter_yaml_as_xml(source, attribute_prefix='_', loader=None, validate='names', checks=None,
+                     serialize=False):
+    '''
+    Convert each document of the multi-document YAML ``source`` (see :func:`open_yaml_source`)
+    into an ``ET.ElementTree``, or into UTF-8 bytes if ``serialize``, as it's read
+
+    Only one document is held in memory at a time.  Empty documents (e.g. after a trailing
+    ``---``) are skipped.  The other arguments are the same as :func:`load_yaml_as_xml`'s.
+    '''
+
+    assert validate in XML_VALIDATE_MODES, "unknown validate mode {!r}".format(validate)
+    checks = _value_checks(checks, loader)
+    with open_yaml_source(source) as (stream, source_abr):
+        for i, y in enumerate(pyyaml.load_all(stream, Loader=loader or YAML_LOADER)):
+            if None is y:
+                continue
+            xml = yaml_object_as_xml(y, attribute_prefix, validate, checks,
+                                     '{} document #{}'.format(source_abr, i))
+            yield ET.tostring(xml.getroot(), 'utf-8') if serialize else xml
+
+
+def _value_checks(checks, loader):
+    if None is checks or isinstance(checks, ValueChecks):
+        return checks
+    return compile_value_checks(checks, loader)
+
+
+def yaml_object_as_xml(y, attribute_prefix='_', validate='names', checks=None,  # noqa: C901
+                       source_abr=None):
+    '''
+    Convert the YAML object ``y`` as returned by :func:`load_yaml` into an ``ET.ElementTree``
+    like :func:`load_yaml_as_xml`
+    '''
+
     assert isinstance(y, dict), \
         "invalid YAML {!r}: the top-level datatype must be a mapping (got {})".format(
             source_abr, type(y))
@@ -309,11 +606,17 @@ def load_yaml_as_xml(source, attribute_prefix='_'):
         "invalid YAML {!r}: the top-level mapping must contain a single entry "
         "(got {} entries)".format(source_abr, len(y)))
 
-    k, v = y.popitem()
+    (k, v), = y.items()
     root = ET.Element(str(k))
 
-    def rec_add(path, yaml, xml):
+    # each entry carries the ValueChecks of its element, or None where nothing is checked;
+    # elements with checked attributes are checked once all of their list items are merged
+    checked = {}
+    stack = [('/', v, root, checks.children.get(root.tag) if checks else None)]
+    while stack:
+        path, yaml, xml, values = stack.pop()
         if isinstance(yaml, dict):
+            children = []
             for k, v in yaml.items():
                 if attribute_prefix == k[ :len(attribute_prefix)]:
                     s = str(v)
@@ -321,43 +624,439 @@ def load_yaml_as_xml(source, attribute_prefix='_'):
                         s = s.lower()
                     xml.set(k[len(attribute_prefix): ], s)
                 else:
-                    sub = ET.SubElement(xml, k)
-                    rec_add(path + '/' + k, v, sub)
+                    children.append(((path, k), v, ET.SubElement(xml, k),
+                                     values.children.get(k) if values else None))
+            if values and values.attributes and xml not in checked:
+                checked[xml] = (path, values)
+            stack.extend(reversed(children))
         elif isinstance(yaml, list):
-            for e in yaml:
-                rec_add(path, e, xml)
+            stack.extend((path, e, xml, values) for e in reversed(yaml))
         else:
             raise Exception("unexpected structure at {}: {} (of type {})".format(
-                path, yaml, type(yaml)))
-    rec_add('/', v, root)
+                _format_path(path), yaml, type(yaml)))
 
-    assert validate(ET.tostring(root, 'unicode')), \
-        "YAML {!r} yields an invalid XML".format(source_abr)
+    if 'full' == validate:
+        assert 0 == run_validator(ET.tostring(root, 'unicode'))[0], \
+            "YAML {!r} yields an invalid XML".format(source_abr)
+    elif 'names' == validate:
+        err = check_xml_names(root)
+        assert None is err, "YAML {!r} yields an invalid XML: {}".format(source_abr, err)
 
+    for xml, (path, values) in checked.items():
+        err = values.check_attributes(xml.attrib)
+        assert None is err, "YAML {!r}: /{}{}: {}".format(
+            source_abr, root.tag, _format_path(path)[1: ], err)
     return ET.ElementTree(root)
 
 
+_XML_NAME_START = (
+    'A-Z_a-z\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u02FF\u0370-\u037D\u037F-\u1FFF\u200C-\u200D'
+    '\u2070-\u218F\u2C00-\u2FEF\u3001-\uD7FF\uF900-\uFDCF\uFDF0-\uFFFD\U00010000-\U000EFFFF')
+_XML_NAME_CHAR = _XML_NAME_START + '\\-.0-9\u00B7\u0300-\u036F\u203F-\u2040'
+XML_NCNAME_RE = re.compile('[{}][{}]*'.format(_XML_NAME_START, _XML_NAME_CHAR))
+XML_NAME_RE = re.compile('[{}:][{}:]*'.format(_XML_NAME_START, _XML_NAME_CHAR))
+XML_ILLEGAL_CHAR_RE = re.compile('[^\t\n\r\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]')
+_XML_NAME_CHARS_RE = re.compile('[{}:]*'.format(_XML_NAME_CHAR))
+
+
+def check_xml_name(name):
+    '''
+    Whether ``name`` serializes into a well-formed element or attribute name
+
+    Only the ``Name`` production of XML counts, as for ``xmllint``: a prefix which isn't
+    declared, or isn't one at all, is a namespace error it reports without failing.  A
+    ``{uri}local`` name is serialized as ``ns0:local``.
+
+    >>> check_xml_name('a-b.c'), check_xml_name('p:a'), check_xml_name('p:1a')
+    (True, True, True)
+    >>> check_xml_name('1a'), check_xml_name('a b')
+    (False, False)
+    >>> check_xml_name('{urn:x}a'), check_xml_name('{urn:x}1a'), check_xml_name('{urn:x}a b')
+    (True, True, False)
+    '''
+
+    if name[ :1] == '{':
+        return _XML_NAME_CHARS_RE.fullmatch(name.rpartition('}')[2]) is not None
+    return XML_NAME_RE.fullmatch(name) is not None
+
+
+def check_xml_names(root):  # noqa: C901
+    '''
+    Return a message on the first element or attribute of the tree ``root`` which wouldn't
+    serialize into a well-formed XML, or None
+
+    This finds the same errors as ``xmllint`` does in the serialized tree: illegal names
+    (see :func:`check_xml_name`) and illegal characters in attribute values.  Namespace
+    errors (undeclared prefixes, bad ``xmlns`` declarations...) aren't errors to it.
+    '''
+
+    known = set()
+
+    def check(name):
+        if name in known:
+            return True
+        ok = check_xml_name(name)
+        if ok:
+            known.add(name)
+        return ok
+
+    stack = [root]
+    while stack:
+        e = stack.pop()
+        if len(e.attrib):
+            for k, v in e.items():
+                if not check(k):
+                    return "illegal attribute name {!r} on {!r}".format(k, e.tag)
+                if XML_ILLEGAL_CHAR_RE.search(v):
+                    return "illegal character in the attribute {!r} on {!r}".format(k, e.tag)
+        if not check(e.tag):
+            return "illegal element name {!r}".format(e.tag)
+        if len(e):
+            stack.extend(reversed(e))
+    return None
+
+
+class Path(str):
+    '''
+    A string which the functions taking either a path or a document read as a path
+    '''
+
+    __slots__ = ()
+
+
+class Text(str):
+    '''
+    A string which the functions taking either a path or a document read as the document
+    itself, without looking it up in the filesystem
+    '''
+
+    __slots__ = ()
+
+
+# longer strings are never probed; PATH_MAX on Linux
+PATH_LENGTH_MAX = 4096
+
+
 def is_filepath(s):
     '''
+    Whether ``s`` is a path rather than a document
+
+    :class:`Path` and :class:`Text` say so explicitly.  Otherwise strings with a newline, strings
+    starting with ``<`` (XML) and strings longer than :data:`PATH_LENGTH_MAX` are documents, and
+    the rest are paths if they exist, which is the only case asking the filesystem.
+
     >>> is_filepath('a')
     False
     >>> is_filepath('/xyzzy')
     False
     >>> is_filepath(__file__)
     True
+    >>> is_filepath(Text(__file__)), is_filepath(Path('/xyzzy'))
+    (False, True)
     '''
 
+    if isinstance(s, Path):
+        return True
+    if isinstance(s, Text):
+        return False
     assert isinstance(s, str), "invalid input {!r} of type {}".format(s, type(s))
-    if os.linesep in s:
+    if '<' == s[ :1] or len(s) > PATH_LENGTH_MAX or '\n' in s:
         return False
     return os.path.exists(s)
 
 
-def validate(data, schema=None):
-    return 0 == run_validator(data, schema)[0]
+XMLLINT_OK, XMLLINT_INVALID, XMLLINT_NOT_WELLFORMED, XMLLINT_BAD_SCHEMA = 0, 3, 4, 5
+
+# the deepest nesting of elements xmllint parses without --huge
+XMLLINT_DEPTH_MAX = 257
+
+VALIDATOR_BACKENDS = ('auto', 'python', 'lxml', 'xmllint', 'pool')
+
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class SchemaCache(object):
+    '''
+    A thread-safe LRU cache of compiled schemas
+
+    Inline schemas are keyed by the SHA-1 of their content and files by their path, mtime and
+    size, so that an edited file gets recompiled.
+    '''
 
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(schema):
+        if is_filepath(schema):
+            st = os.stat(schema)
+            return ('path', os.path.abspath(schema), st.st_mtime_ns, st.st_size)
+        return ('text', hashlib.sha1(schema.encode('utf-8')).hexdigest())
+
+    def get(self, kind, schema, compile_schema):
+        '''
+        Return the compiled ``schema`` for the backend ``kind``, calling
+        ``compile_schema(schema)`` on a miss.  Exceptions from the latter aren't cached.
+        '''
+
+        key = (kind, ) + self.key(schema)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        compiled = compile_schema(schema)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.maxsize, 0):
+                self._entries.popitem(last=False)
+        return compiled
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+schema_cache = SchemaCache()
+
+
+def validate(data, schema=None, backend='auto'):
+    return 0 == run_validator(data, schema, backend)[0]
+
+
+def run_validator(data, schema=None, backend='auto'):
+    '''
+    Validate the XML ``data`` against the RELAX NG ``schema`` (both either a path or the
+    document itself) and return ``(rc, error_text)`` where ``rc`` follows ``xmllint``
+
+    ``backend`` is one of :data:`VALIDATOR_BACKENDS`.  ``'auto'`` uses the worker pool of
+    :mod:`yaxml.pool` if it's been configured, ``lxml`` if it's installed, or else the
+    pure-Python engine, falling back to ``xmllint`` for schemas the latter doesn't support.
+    '''
+
+    backend = select_backend(backend, schema)
+    if 'pool' == backend:
+        from . import pool
+        return pool.get_pool().run_validator(data, schema)
+    elif 'python' == backend:
+        return run_python_validator(data, schema)
+    elif 'lxml' == backend:
+        return run_lxml_validator(data, schema)
+    return run_xmllint_validator(data, schema)
+
+
+def validate_many(documents, schema=None, backend='auto'):
+    '''
+    Validate each of ``documents`` against ``schema``, paying the per-schema costs once, and
+    return a list of ``(rc, error_text)`` in the input order
+
+    With the ``xmllint`` backend all documents are passed to a single command line (in chunks
+    of :data:`XMLLINT_BATCH_SIZE`) and its output is split per document.
+    '''
+
+    documents = list(documents)
+    backend = select_backend(backend, schema)
+    if 'xmllint' == backend:
+        return run_xmllint_validator_many(documents, schema)
+    elif 'pool' == backend:
+        from . import pool
+        return pool.get_pool().map(documents, schema)
+    return [ run_validator(d, schema, backend) for d in documents ]
+
+
+def select_backend(backend, schema=None, use_pool=True):
+    '''
+    Resolve ``'auto'`` into the concrete backend to be used for ``schema``, which is never
+    ``'pool'`` unless ``use_pool``
+    '''
+
+    assert backend in VALIDATOR_BACKENDS, "unknown validator backend {!r}".format(backend)
+    if 'lxml' == backend:
+        assert None is not lxml_etree, "the lxml backend requires lxml to be installed"
+    if 'auto' != backend:
+        return backend
+    from . import pool
+    if use_pool and pool.active():
+        return 'pool'
+    if None is not lxml_etree:
+        return 'lxml'
+    if None is not schema:
+        from . import relaxng
+        try:
+            compile_python_schema(schema)
+        except relaxng.RelaxNGNotSupported:
+            return 'xmllint'
+        except relaxng.RelaxNGSchemaError:
+            pass
+    return 'python'
+
+
+def read_source(source):
+    if is_filepath(source):
+        with open(source, 'rb') as fp:
+            return fp.read()
+    return source
 
-def run_validator(data, schema=None):
+
+def compile_python_schema(schema):
+    from . import relaxng
+
+    return schema_cache.get('python', schema, lambda s: relaxng.RelaxNG(read_source(s)))
+
+
+def run_python_validator(data, schema=None):  # noqa: C901
+    from . import relaxng
+
+    rng = None
+    if None is not schema:
+        try:
+            rng = compile_python_schema(schema)
+        except relaxng.RelaxNGNotSupported:
+            raise
+        except relaxng.RelaxNGSchemaError as e:
+            return (XMLLINT_BAD_SCHEMA, "Relax-NG schema failed to compile: {}\n".format(e))
+
+    try:
+        if None is not rng and rng.uses_qnames:
+            root, nsmaps = relaxng.parse_with_nsmaps(read_source(data))
+        else:
+            root, nsmaps = ET.fromstring(read_source(data)), None
+    except ET.ParseError as e:
+        try:
+            depth = _depth_without_namespaces(read_source(data))
+        except xml.parsers.expat.ExpatError:
+            return (XMLLINT_NOT_WELLFORMED, "parser error : {}\n".format(e))
+        # only a namespace error, which xmllint reports but doesn't fail on
+        if depth > XMLLINT_DEPTH_MAX:
+            return _excessive_depth()
+        if None is schema:
+            return (XMLLINT_OK, '')
+        return run_xmllint_validator(data, schema)
+    if _exceeds_depth(root, XMLLINT_DEPTH_MAX):
+        return _excessive_depth()
+    if None is rng:
+        return (XMLLINT_OK, '')
+    ok, err = rng.validate(root, nsmaps)
+    if ok:
+        return (XMLLINT_OK, '')
+    return (XMLLINT_INVALID, err + '\n')
+
+
+def _excessive_depth():
+    return (XMLLINT_NOT_WELLFORMED, "parser error : Excessive depth in document: {}\n".format(
+        XMLLINT_DEPTH_MAX))
+
+
+def _exceeds_depth(root, depth_max):
+    stack = [(root, 1)]
+    while stack:
+        e, depth = stack.pop()
+        if depth > depth_max:
+            return True
+        stack.extend((c, depth + 1) for c in e if isinstance(c.tag, str))
+    return False
+
+
+def _depth_without_namespaces(data):
+    '''
+    The nesting depth of the XML ``data``, parsed without namespace processing; raises
+    ``ExpatError`` if it isn't well-formed even so
+
+    >>> _depth_without_namespaces('<p:a><b/></p:a>')
+    2
+    '''
+
+    parser = xml.parsers.expat.ParserCreate()
+    depth = [0, 0]
+
+    def start(name, attrs):
+        depth[0] += 1
+        depth[1] = max(depth)
+
+    def end(name):
+        depth[0] -= 1
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.Parse(data, True)
+    return depth[1]
+
+
+def _lxml_parse(source):
+    '''
+    Parse ``source`` with lxml the way xmllint does: namespace errors are reported but don't
+    fail the document, and only the depth of :data:`XMLLINT_DEPTH_MAX` is allowed
+    '''
+
+    path = is_filepath(source)
+    if not path and isinstance(source, str):
+        source = source.encode('utf-8')
+    for recover in (False, True):
+        parser = lxml_etree.XMLParser(huge_tree=True, recover=recover)
+        try:
+            if path:
+                doc = lxml_etree.parse(source, parser)
+            else:
+                doc = lxml_etree.fromstring(source, parser).getroottree()
+            break
+        except lxml_etree.XMLSyntaxError:
+            namespace = lxml_etree.ErrorDomains.NAMESPACE
+            if recover or any( namespace != e.domain for e in parser.error_log ):
+                raise
+    if _exceeds_depth(doc.getroot(), XMLLINT_DEPTH_MAX):
+        raise lxml_etree.XMLSyntaxError(
+            "Excessive depth in document: {}".format(XMLLINT_DEPTH_MAX), None, 0, 0)
+    return doc
+
+
+def run_lxml_validator(data, schema=None):
+    rng = None
+    if None is not schema:
+        try:
+            rng = schema_cache.get('lxml', schema, lambda s: lxml_etree.RelaxNG(_lxml_parse(s)))
+        except (lxml_etree.XMLSyntaxError, lxml_etree.RelaxNGParseError) as e:
+            return (XMLLINT_BAD_SCHEMA, "Relax-NG schema failed to compile: {}\n".format(e))
+
+    try:
+        doc = _lxml_parse(data)
+    except lxml_etree.XMLSyntaxError as e:
+        return (XMLLINT_NOT_WELLFORMED, "parser error : {}\n".format(e))
+    if None is rng or rng.validate(doc):
+        return (XMLLINT_OK, '')
+    return (XMLLINT_INVALID, str(rng.error_log) + '\n')
+
+
+class SchemaFile(object):
+    '''
+    A schema as a file path for ``xmllint``; inline schemas are written to a temporary file
+    which lives as long as this object
+    '''
+
+    def __init__(self, schema):
+        if is_filepath(schema):
+            self._fp = None
+            self.path = schema
+        else:
+            self._fp = tempfile.NamedTemporaryFile(mode='w', suffix='.rng.xml')
+            self._fp.write(schema)
+            self._fp.flush()
+            self.path = self._fp.name
+
+
+def run_xmllint_validator(data, schema=None):
 
     def with_temp_file(suf, data, fun):
         with tempfile.NamedTemporaryFile(mode='w', suffix=".{}.xml".format(suf)) as fp:
@@ -366,25 +1065,111 @@ def run_validator(data, schema=None):
             fp.flush()
             return fun(path)
 
-    def with_prepared_input(source, tmp_sfx, fun):
-        if is_filepath(source):
-            with open(source) as fp:
-                return fun(fp)
-        else:
-            return with_temp_file(tmp_sfx, source, fun)
-
-    def validate1(schema_path):
-        def validate0(data_path):
-            cmdline = ['xmllint', '--noout']
-            if schema_path:
-                cmdline.extend(['--relaxng', schema_path])
-            cmdline.append(data_path)
-            p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = p.communicate()
-            return (p.returncode, stderr.decode('utf-8'))
-
-        return with_prepared_input(data, 'data', validate0)
-
-    if None is schema:
-        return validate1(schema)
-    return with_prepared_input(schema, 'rng', validate1)
+    def validate0(schema_path, data_path):
+        cmdline = ['xmllint', '--noout']
+        if schema_path:
+            cmdline.extend(['--relaxng', schema_path])
+        cmdline.append(data_path)
+        p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = p.communicate()
+        return (p.returncode, stderr.decode('utf-8'))
+
+    schema_file = None if None is schema else schema_cache.get('xmllint', schema, SchemaFile)
+    schema_path = schema_file and schema_file.path
+    if is_filepath(data):
+        return validate0(schema_path, data)
+    return with_temp_file('data', data, lambda data_path: validate0(schema_path, data_path))
+
+
+XMLLINT_BATCH_SIZE = 500
+
+
+def run_xmllint_validator_many(documents, schema=None):
+    schema_file = None if None is schema else schema_cache.get('xmllint', schema, SchemaFile)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for i, d in enumerate(documents):
+            if is_filepath(d):
+                paths.append(d)
+                continue
+            path = os.path.join(tmpdir, '{}.data.xml'.format(i))
+            with open(path, 'w') as fp:
+                fp.write(d)
+            paths.append(path)
+
+        unique_paths = list(collections.OrderedDict.fromkeys(paths))
+        by_path = {}
+        for start in range(0, len(unique_paths), XMLLINT_BATCH_SIZE):
+            batch = unique_paths[start:start + XMLLINT_BATCH_SIZE]
+            by_path.update(zip(batch, run_xmllint_batch(batch, schema_file and schema_file.path)))
+    return [ by_path[path] for path in paths ]
+
+
+# an error which keeps xmllint from parsing a document; namespace errors and warnings don't
+_XMLLINT_FATAL_RE = re.compile(r':[0-9]+: (?!namespace )[A-Za-z/ -]*error : ')
+
+
+def run_xmllint_batch(paths, schema_path):
+    cmdline = ['xmllint', '--noout']
+    if schema_path:
+        cmdline.extend(['--relaxng', schema_path])
+    cmdline.extend(paths)
+    p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = p.communicate()
+    stderr = stderr.decode('utf-8')
+    if schema_path and 'Relax-NG schema {} failed to compile'.format(schema_path) in stderr:
+        return [ (XMLLINT_BAD_SCHEMA, stderr) ] * len(paths)
+
+    # xmllint reports on the files in order, starting each message with the file path (or
+    # naming it, for a file it can't read); lines which don't (e.g. the caret under a parser
+    # error) belong to the previous message
+    outputs = [ [] for _ in paths ]
+    unreadable = [ False ] * len(paths)
+    cur = 0
+    for line in stderr.splitlines(True):
+        for j in range(cur, len(paths)):
+            if line.startswith(paths[j]) and line[len(paths[j]): len(paths[j]) + 1] in ': ':
+                cur = j
+                break
+            if line.startswith('warning: failed to load external entity "{}"'.format(paths[j])):
+                cur = j
+                unreadable[j] = True
+                break
+        outputs[cur].append(line)
+
+    return [ _xmllint_batch_result(path, output, failed, schema_path)
+             for path, output, failed in zip(paths, outputs, unreadable) ]
+
+
+def _xmllint_batch_result(path, output, unreadable, schema_path):
+    '''
+    ``(rc, error_text)`` for ``path`` from its share of the messages of a batch
+    '''
+
+    # with a schema, xmllint reports on the validity of every document it could parse;
+    # otherwise the severity of its errors tells whether it could
+    if path + ' validates\n' in output:
+        output.remove(path + ' validates\n')
+        rc = XMLLINT_OK
+    elif path + ' fails to validate\n' in output:
+        rc = XMLLINT_INVALID
+    elif unreadable or schema_path or any(
+            _XMLLINT_FATAL_RE.match(line[len(path): ]) for line in output
+            if line.startswith(path)):
+        rc = XMLLINT_NOT_WELLFORMED
+    else:
+        rc = XMLLINT_OK
+    return (rc, ''.join(output))
+
+
+from .pattern import (  # noqa: E402,F401
+    Node, SiblingIndex, SiblingList, SiblingTuple, to_nodes, to_dicts, merged_nodes)
+from .validator import RngYamlValidator  # noqa: E402,F401
+from .matcher import RngYamlMatcher  # noqa: E402,F401
+from .checks import ValueChecks, compile_value_checks  # noqa: E402,F401
+from .stream import stream_yaml_as_xml, dump_yaml_as_xml  # noqa: E402,F401
+from .tree import convert_tree  # noqa: E402,F401
+from .watch import TreeWatcher, watch_tree  # noqa: E402,F401
+from .reverse import dump_xml_as_yaml  # noqa: E402,F401
+from .cache import RngYamlCache  # noqa: E402,F401
+from .aio import aload_yaml_as_xml, avalidate, arun_validator  # noqa: E402,F401
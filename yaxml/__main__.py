@@ -1,15 +1,231 @@
+'''
+The ``python -m yaxml`` command
+
+Every subcommand takes any number of inputs, so that the schema is loaded once per invocation,
+and ``-`` (the default) stands for stdin.  Inputs may hold several ``---``-separated documents.
+The exit status is :data:`EXIT_OK` when every input went through, :data:`EXIT_FAILED` when
+some failed to convert or validate and :data:`EXIT_USAGE` for bad arguments or a bad schema.
+'''
+
+import os
+import os.path
 import sys
 import argparse
+import xml.etree.ElementTree as ET
 
 import yaxml
 
+EXIT_OK, EXIT_FAILED, EXIT_USAGE = range(3)
+
+
+def open_input(path):
+    '''
+    A binary file object for ``path``, so that the YAML loader detects the encoding rather than
+    the locale deciding it, or stdin for ``-``
+    '''
+
+    if '-' == path:
+        return getattr(sys.stdin, 'buffer', sys.stdin)
+    return open(path, 'rb')
+
+
+def read_input(path):
+    fp = open_input(path)
+    try:
+        data = fp.read()
+    finally:
+        if '-' != path:
+            fp.close()
+    return data.decode('utf-8') if isinstance(data, bytes) else data
+
+
+def report(path, err):
+    sys.stderr.write("{}: {}\n".format('<stdin>' if '-' == path else path, err.rstrip()))
+
+
+def load_schema(opts):
+    '''
+    ``(rng, checks)`` for ``--schema``, or ``(None, None)`` without one
+    '''
+
+    if not opts.schema:
+        return (None, None)
+    return (yaxml.tree.compile_schema(opts.schema), yaxml.compile_value_checks(opts.schema))
+
+
+def convert_inputs(opts, rng, checks):
+    '''
+    Yield ``(path, index, xml_string)`` for each document of each input which converts (and
+    validates), reporting the others on stderr; ``opts.failed`` tells whether any of them didn't
+    '''
+
+    opts.failed = False
+    for path in opts.inputs:
+        fp = None
+        try:
+            fp = open_input(path)
+            documents = yaxml.iter_yaml_as_xml(fp, opts.attribute_prefix, checks=checks)
+            for i, xml in enumerate(documents):
+                data = ET.tostring(xml.getroot(), 'unicode')
+                if rng:
+                    rc, err = yaxml.run_validator(data, rng, opts.backend)
+                    if 0 != rc:
+                        opts.failed = True
+                        report(path, err)
+                        continue
+                yield (path, i, data)
+        except Exception as e:
+            opts.failed = True
+            report(path, '{}: {}'.format(type(e).__name__, e))
+        finally:
+            if None is not fp and '-' != path:
+                fp.close()
+
+
+def output_path(path, index, output_dir):
+    '''
+    ``output_dir/NAME.xml`` for the first document of ``path``, ``NAME-1.xml`` for the second...
+
+    Different documents can get the same path (``a/x.yaml`` and ``b/x.yaml``, or the second
+    document of ``x.yaml`` and ``x-1.yaml``); :func:`convert` refuses to write one twice.
+    '''
+
+    name = 'stdin' if '-' == path else os.path.splitext(os.path.basename(path))[0]
+    if index:
+        name += '-{}'.format(index)
+    return os.path.join(output_dir, name + '.xml')
+
+
+def convert(opts):
+    rng, checks = load_schema(opts)
+    written = {}
+    for path, i, data in convert_inputs(opts, rng, checks):
+        if opts.output_dir:
+            dst = output_path(path, i, opts.output_dir)
+            first = written.setdefault(os.path.normcase(os.path.abspath(dst)), (path, i))
+            if (path, i) != first:
+                opts.failed = True
+                report(path, 'document {} would overwrite {}, written for document {} of {}'.format(
+                    i + 1, dst, first[1] + 1, first[0]))
+                continue
+            if yaxml.tree.write_if_changed(dst, data.encode('utf-8')):
+                sys.stdout.write(dst + '\n')
+        else:
+            sys.stdout.write(data + '\n')
+            sys.stdout.flush()
+    return EXIT_FAILED if opts.failed else EXIT_OK
+
+
+def validate(opts):
+    rng, checks = load_schema(opts)
+    for path, _, _ in convert_inputs(opts, rng, checks):
+        if opts.verbose:
+            sys.stderr.write("{} validates\n".format('<stdin>' if '-' == path else path))
+    return EXIT_FAILED if opts.failed else EXIT_OK
+
+
+def compile_schema(opts):
+    rc = EXIT_OK
+    for path in opts.inputs:
+        try:
+            pattern = yaxml.load_rngyaml(yaxml.Text(read_input(path)), not opts.no_check)
+            data = ET.tostring(yaxml.compile_rngyaml_to_rng(pattern), 'unicode')
+        except Exception as e:
+            rc = EXIT_FAILED
+            report(path, '{}: {}'.format(type(e).__name__, e))
+            continue
+        sys.stdout.write(data + '\n')
+    return rc
+
+
+def tree(opts):
+    rc = EXIT_OK
+    for result in yaxml.convert_tree(opts.src_dir, opts.dst_dir, opts.schema, opts.jobs,
+                                     opts.attribute_prefix):
+        if result.error:
+            rc = EXIT_FAILED
+            sys.stderr.write("{}: {}\n".format(result.src, result.error.rstrip()))
+        elif result.changed:
+            sys.stdout.write(result.dst + '\n')
+    return rc
+
+
+def watch(opts):
+    watcher = yaxml.TreeWatcher(opts.src_dir, opts.dst_dir, opts.schema, opts.attribute_prefix)
+    results = watcher.scan() if opts.once else watcher.watch(opts.interval)
+    rc = EXIT_OK
+    try:
+        for result in results:
+            if result.error:
+                rc = EXIT_FAILED
+                sys.stderr.write("{}: {}\n".format(result.src, result.error.rstrip()))
+            elif result.changed:
+                sys.stdout.write(result.dst + '\n')
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    return rc
+
 
 def main(args):
-    parser = argparse.ArgumentParser(description='')
-    parser.add_argument('input', required=True)
-    parser.add_argument('schema', required=True)
+    parser = argparse.ArgumentParser(prog='python -m yaxml', description='YAML-to-XML converter')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_document_options(p):
+        p.add_argument('inputs', nargs='*', default=['-'], metavar='yaml',
+                       help='YAML files, - for stdin (default)')
+        p.add_argument('-s', '--schema', help='RngYaml schema to validate against')
+        p.add_argument('-b', '--backend', default='auto', choices=yaxml.VALIDATOR_BACKENDS)
+        p.add_argument('--attribute-prefix', default='_')
+
+    p = subparsers.add_parser('convert', help='convert YAML files into XML')
+    add_document_options(p)
+    p.add_argument('-d', '--output-dir',
+                   help='write NAME.xml here for each input instead of printing it')
+    p.set_defaults(func=convert)
+
+    p = subparsers.add_parser('validate', help='validate YAML files against an RngYaml schema')
+    add_document_options(p)
+    p.add_argument('-v', '--verbose', action='store_true', help='report valid inputs as well')
+    p.set_defaults(func=validate)
+
+    p = subparsers.add_parser('compile-schema', help='compile RngYaml schemas into RELAX NG')
+    p.add_argument('inputs', nargs='*', default=['-'], metavar='rngyaml',
+                   help='RngYaml files, - for stdin (default)')
+    p.add_argument('--no-check', action='store_true',
+                   help="don't validate the result against the RELAX NG schema for RELAX NG")
+    p.set_defaults(func=compile_schema)
+
+    p = subparsers.add_parser('tree', help='convert a directory tree of YAML files into XML')
+    p.add_argument('src_dir')
+    p.add_argument('dst_dir')
+    p.add_argument('-s', '--schema', help='RngYaml schema to validate against')
+    p.add_argument('-j', '--jobs', type=int, help='number of worker processes')
+    p.add_argument('--attribute-prefix', default='_')
+    p.set_defaults(func=tree)
+
+    p = subparsers.add_parser(
+        'watch', help='keep a directory tree of XML files up to date with one of YAML files')
+    p.add_argument('src_dir')
+    p.add_argument('dst_dir')
+    p.add_argument('-s', '--schema', help='RngYaml schema to validate against')
+    p.add_argument('-i', '--interval', type=float, default=1.0,
+                   help='seconds between polls (default: %(default)s)')
+    p.add_argument('--once', action='store_true', help='convert what changed and exit')
+    p.add_argument('--attribute-prefix', default='_')
+    p.set_defaults(func=watch)
+
+    opts = parser.parse_args(args)
+    if getattr(opts, 'schema', None):
+        opts.schema = yaxml.Path(opts.schema)
+    if 'validate' == opts.command and not opts.schema:
+        parser.error('validate needs --schema')
+    try:
+        return opts.func(opts)
+    except Exception as e:
+        sys.stderr.write("{}: {}: {}\n".format(parser.prog, type(e).__name__, e))
+        return EXIT_USAGE
 
-    opts = parser.parse_args(sys.argv[1: ])
 
 if '__main__' == __name__:
-    main(sys.argv[1: ])
+    sys.exit(main(sys.argv[1: ]))
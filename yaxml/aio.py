@@ -0,0 +1,94 @@
+'''
+asyncio variants of the conversion and validation functions
+
+The in-process work runs on an executor (the loop's default one unless given), ``xmllint`` runs
+through ``asyncio.create_subprocess_exec`` with the document on its stdin, and the number of
+validations in flight is limited by :func:`set_validation_concurrency`.
+'''
+
+import os
+import asyncio
+import weakref
+import functools
+import xml.etree.ElementTree as ET
+
+from . import (
+    load_yaml_as_xml, run_validator, select_backend, schema_cache, is_filepath, SchemaFile,
+    XML_VALIDATE_MODES, yaml_source_abbrev)
+
+validation_concurrency = os.cpu_count() or 4
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_validation_concurrency(n):
+    '''
+    Limit the number of concurrent validations per event loop to ``n``
+    '''
+
+    global validation_concurrency
+    assert n > 0, "invalid concurrency {!r}".format(n)
+    validation_concurrency = n
+    _semaphores.clear()
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if None is sem:
+        sem = _semaphores[loop] = asyncio.Semaphore(validation_concurrency)
+    return sem
+
+
+async def _run_xmllint(data, schema, executor):
+    loop = asyncio.get_running_loop()
+    cmdline = ['xmllint', '--noout']
+    if None is not schema:
+        schema_file = await loop.run_in_executor(
+            executor, schema_cache.get, 'xmllint', schema, SchemaFile)
+        cmdline.extend(['--relaxng', schema_file.path])
+    if is_filepath(data):
+        cmdline.append(data)
+        stdin = None
+    else:
+        cmdline.append('-')
+        stdin = data.encode('utf-8')
+    p = await asyncio.create_subprocess_exec(
+        *cmdline, stdin=asyncio.subprocess.PIPE if stdin else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await p.communicate(stdin)
+    return (p.returncode, stderr.decode('utf-8'))
+
+
+async def arun_validator(data, schema=None, backend='auto', executor=None):
+    '''
+    Same as :func:`yaxml.run_validator`
+    '''
+
+    loop = asyncio.get_running_loop()
+    async with _semaphore():
+        backend = await loop.run_in_executor(executor, select_backend, backend, schema)
+        if 'xmllint' == backend:
+            return await _run_xmllint(data, schema, executor)
+        return await loop.run_in_executor(executor, run_validator, data, schema, backend)
+
+
+async def avalidate(data, schema=None, backend='auto', executor=None):
+    return 0 == (await arun_validator(data, schema, backend, executor))[0]
+
+
+async def aload_yaml_as_xml(source, attribute_prefix='_', loader=None, validate='names',
+                            executor=None, checks=None):
+    '''
+    Same as :func:`yaxml.load_yaml_as_xml`
+    '''
+
+    assert validate in XML_VALIDATE_MODES, "unknown validate mode {!r}".format(validate)
+    loop = asyncio.get_running_loop()
+    xml = await loop.run_in_executor(executor, functools.partial(
+        load_yaml_as_xml, source, attribute_prefix, loader,
+        'none' if 'full' == validate else validate, checks))
+    if 'full' == validate:
+        assert await avalidate(ET.tostring(xml.getroot(), 'unicode'), executor=executor), \
+            "YAML {!r} yields an invalid XML".format(yaml_source_abbrev(source))
+    return xml
@@ -0,0 +1,185 @@
+'''
+A persistent cache of loaded RngYaml schemas
+
+Entries are pickles, so the cache directory must only be writable by trusted users.
+'''
+
+import os
+import os.path
+import pickle
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+
+from . import __version__, YAML_LOADER
+from . import is_filepath, load_rngyaml, compile_rngyaml_to_rng, run_validator
+from . import relaxng_in_relaxng
+
+# the version of what the entries hold: bump it whenever the pattern trees load_rngyaml returns,
+# the RELAX NG compile_rngyaml_to_rng makes of them or the entries themselves change, so that
+# entries written by an older yaxml are never read back.  Keys also hash yaxml.__version__ and
+# the YAML loader, which decide the result as much as the source does
+CACHE_FORMAT = 2
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'yaxml')
+
+
+class RngYamlCache(object):
+    '''
+    Caches the result of :func:`yaxml.load_rngyaml` (the pattern tree and the RELAX NG it
+    compiles to) in memory and in ``directory``, keyed by the hash of the source, the qualified
+    name of the YAML loader, ``yaxml.__version__`` and :data:`CACHE_FORMAT`, so that warm starts
+    skip parsing, compilation and meta-validation
+
+    The directory is pruned down to ``max_entries`` files and ``max_bytes`` bytes, least
+    recently used first.  An instance may be shared between threads; ``hits`` and ``misses``
+    are updated under its lock, but concurrent misses on one source may each load it.
+    '''
+
+    SUFFIX = '.rngyaml.pickle'
+
+    def __init__(self, directory=None, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def key(self, source, loader=None):
+        if is_filepath(source):
+            with open(source, 'rb') as fp:
+                data = fp.read()
+        else:
+            data = source.encode('utf-8')
+        loader = loader or YAML_LOADER
+        header = [ str(CACHE_FORMAT), __version__, loader.__module__ + '.' + loader.__qualname__ ]
+        h = hashlib.sha256('\0'.join(header + [ '' ]).encode('utf-8') + data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _read(self, key):
+        with self._lock:
+            blob = self._memory.get(key)
+        if None is blob:
+            try:
+                with open(self._path(key), 'rb') as fp:
+                    blob = fp.read()
+                os.utime(self._path(key))
+            except OSError:
+                return None
+        try:
+            entry = pickle.loads(blob)
+        except Exception:
+            return None
+        if (CACHE_FORMAT, __version__) != (entry.get('format'), entry.get('version')):
+            return None
+        self._remember(key, blob)
+        return entry
+
+    def _remember(self, key, blob):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = blob
+            while len(self._memory) > max(self.max_entries, 0):
+                del self._memory[next(iter(self._memory))]
+
+    def _write(self, key, entry):
+        blob = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(self._path(key), os.getpid())
+        with open(tmp, 'wb') as fp:
+            fp.write(blob)
+        os.replace(tmp, self._path(key))
+        self.prune()
+
+    def _entry(self, source, validate, loader):
+        key = self.key(source, loader)
+        entry = self._read(key)
+        if None is not entry and (entry['validated'] or not validate):
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            self.misses += 1
+        if None is entry:
+            pattern = load_rngyaml(source, False, loader)
+            rng = ET.tostring(compile_rngyaml_to_rng(pattern), 'unicode')
+            entry = {
+                'format': CACHE_FORMAT, 'version': __version__,
+                'pattern': pattern, 'rng': rng, 'validated': False,
+            }
+        if validate:
+            rc, err = run_validator(entry['rng'], relaxng_in_relaxng.DATA)
+            assert 0 == rc, err + entry['rng']
+            entry['validated'] = True
+        self._write(key, entry)
+        return entry
+
+    def load_rngyaml(self, source, validate=True, loader=None):
+        '''
+        Same as :func:`yaxml.load_rngyaml`; every call returns a fresh copy of the pattern
+        '''
+
+        return self._entry(source, validate, loader)['pattern']
+
+    def load_rng(self, source, validate=True, loader=None):
+        '''
+        The RELAX NG string :func:`yaxml.compile_rngyaml_to_rng` makes out of ``source``
+        '''
+
+        return self._entry(source, validate, loader)['rng']
+
+    def entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ret = []
+        for name in names:
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                ret.append((st.st_mtime, st.st_size, path))
+        return sorted(ret)
+
+    def prune(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            total -= size
+            self._remove(path)
+
+    def _remove(self, path):
+        key = os.path.basename(path)[ :-len(self.SUFFIX)]
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, source=None, loader=None):
+        '''
+        Drop the entry for ``source`` loaded with ``loader``, or every entry if it's None
+        '''
+
+        if None is source:
+            with self._lock:
+                self._memory.clear()
+            for _, _, path in self.entries():
+                self._remove(path)
+        else:
+            self._remove(self._path(self.key(source, loader)))
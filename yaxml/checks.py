@@ -0,0 +1,135 @@
+'''
+Enforce the values an RngYaml schema gives instead of ``true`` or ``false``
+
+A schema like ``{Root: {Port: {_number: 're:[0-9]+'}, Mode: {_kind: fast}}}`` leaves
+``('//Root/Port/@number', 're:[0-9]+')`` and ``('//Root/Mode/@kind', 'fast')`` in the extra
+checks of :func:`yaxml.parse_rngyaml`.  :class:`ValueChecks` turns them into a tree indexed by
+the element names along the path, whose leaves are either the exact value or, when the value
+starts with :data:`REGEX_PREFIX`, the compiled expression after it; :func:`yaxml.load_yaml_as_xml`
+descends the tree while it converts, so a document is checked in the same pass.
+'''
+
+import re
+
+from . import parse_rngyaml, schema_cache, _format_path
+
+REGEX_PREFIX = 're:'
+
+
+def value_matcher(value):
+    '''
+    The compiled regular expression after :data:`REGEX_PREFIX` if ``value`` starts with it, or
+    ``value`` itself
+
+    >>> value_matcher('What?')
+    'What?'
+    >>> value_matcher('re:[0-9]+').pattern
+    '[0-9]+'
+    '''
+
+    if not value.startswith(REGEX_PREFIX):
+        return value
+    try:
+        return re.compile(value[len(REGEX_PREFIX): ])
+    except re.error as e:
+        raise Exception("invalid regular expression {!r}: {}".format(value, e))
+
+
+def value_matches(matcher, value):
+    if isinstance(matcher, str):
+        return matcher == value
+    return None is not matcher.fullmatch(value)
+
+
+def describe(matcher):
+    return repr(matcher if isinstance(matcher, str) else REGEX_PREFIX + matcher.pattern)
+
+
+class ValueChecks(object):
+    '''
+    The value constraints of one element path: ``children`` and ``attributes`` map the names of
+    the child elements to their :class:`ValueChecks` and the names of the attributes to the
+    tuples of allowed value matchers, and ``text`` is the tuple for the element's text
+
+    Build the root with :meth:`from_extra_checks`.
+    '''
+
+    __slots__ = ('children', 'attributes', 'text')
+
+    def __init__(self):
+        self.children = {}
+        self.attributes = {}
+        self.text = ()
+
+    @classmethod
+    def from_extra_checks(cls, extra_checks):
+        '''
+        Index the ``(path, value)`` pairs of :func:`yaxml.parse_rngyaml`
+
+        A path may come with several values (``[{a?: {_x: '1'}}, {a*: {_x: '2'}}]``), in which
+        case any of them is accepted.
+        '''
+
+        root = cls()
+        for path, value in extra_checks:
+            steps = [ s for s in path.split('/') if s ]
+            attribute = steps.pop() if steps and steps[-1].startswith('@') else None
+            node = root
+            for step in steps:
+                node = node.children.get(step) or node.children.setdefault(step, cls())
+            if None is attribute:
+                node.text += (value_matcher(value), )
+            else:
+                name = attribute[1: ]
+                node.attributes[name] = node.attributes.get(name, ()) + (value_matcher(value), )
+        return root
+
+    def __bool__(self):
+        return bool(self.children or self.attributes or self.text)
+
+    def check_attributes(self, attrib):
+        '''
+        Return a message on the first attribute in ``attrib`` with a disallowed value, or None
+        '''
+
+        for name, matchers in self.attributes.items():
+            value = attrib.get(name)
+            if None is not value and not any(value_matches(m, value) for m in matchers):
+                return "attribute {}={!r} doesn't match {}".format(
+                    name, value, ' or '.join(describe(m) for m in matchers))
+        return None
+
+    def check_text(self, text):
+        if text and self.text and not any(value_matches(m, text) for m in self.text):
+            return "text {!r} doesn't match {}".format(
+                text, ' or '.join(describe(m) for m in self.text))
+        return None
+
+    def check_tree(self, root):
+        '''
+        Check the attributes and the non-empty text of the ``ET.Element`` ``root`` and its
+        descendants; returns a message on the first violation or None
+        '''
+
+        stack = [(None, root, self.children.get(root.tag))]
+        while stack:
+            path, e, node = stack.pop()
+            if None is node:
+                continue
+            path = (path, e.tag)
+            err = node.check_attributes(e.attrib) or node.check_text(e.text)
+            if None is not err:
+                return "{}: {}".format(_format_path(path), err)
+            if node.children:
+                stack.extend((path, c, node.children.get(c.tag)) for c in reversed(e))
+        return None
+
+
+def compile_value_checks(schema, loader=None):
+    '''
+    The :class:`ValueChecks` of the RngYaml ``schema`` (a path or the document itself), cached
+    in :data:`yaxml.schema_cache` so the regular expressions are compiled once per schema
+    '''
+
+    return schema_cache.get('values', schema, lambda s: ValueChecks.from_extra_checks(
+        parse_rngyaml(s, loader)[1]))
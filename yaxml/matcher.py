@@ -0,0 +1,234 @@
+'''
+A precompiled matcher for RngYaml patterns based on James Clark's derivative algorithm
+
+The content of every element pattern is compiled once with
+:class:`yaxml.relaxng.PatternBuilder` into a hash-consed start state.  The derivatives of a
+state by the child elements it allows are memoized into a transition table
+(``state -> {name: ((element, next state), ...)}``), so a document is checked in a single walk
+with a dict lookup per element.  Each distinct ``interleave`` or ``zeroOrMore`` content model
+thus becomes a small state table shared by every document.
+'''
+
+from . import _format_path, _trampoline
+from .relaxng import PatternBuilder
+from .validator import RngYamlValidator, _Element
+
+EAGER_STATES = 4096
+
+
+class _ElementDef(object):
+    __slots__ = ('node', 'name', 'start')
+
+    def __init__(self, node):
+        self.node = node
+        self.name = node.name
+        self.start = None
+
+    def __repr__(self):
+        return '<element {}>'.format(self.name)
+
+
+class RngYamlMatcher(RngYamlValidator):
+    '''
+    Same as :class:`yaxml.RngYamlValidator`, but compiled into state tables
+
+    Up to ``eager_states`` states are explored when the matcher is built; the rest of the
+    table is filled in as documents reach them.
+
+    >>> m = RngYamlMatcher('schema: {r: {a*: {_x: true}, b?: false}}')
+    >>> m.validate({'r': [{'a': {'_x': 1}}, {'b': {}}, {'a': {'_x': 2}}]})
+    (True, '')
+    >>> m.validate({'r': {'b': {}, 'c': {}}})
+    (False, '/r: unexpected element c')
+    '''
+
+    def __init__(self, schema, attribute_prefix='_', loader=None, eager_states=EAGER_STATES):
+        super(RngYamlMatcher, self).__init__(schema, attribute_prefix, loader)
+        self._b = PatternBuilder()
+        self._defs = {}
+        self._pending = []
+        self._deriv_memo = {}
+        self._first_memo = {}
+        self._table = {}
+        self.start = _trampoline(self._compile(self.pattern))
+        while self._pending:
+            d = self._pending.pop()
+            d.start = _trampoline(self._compile(d.node.child))
+        self._explore(eager_states)
+
+    def state_count(self):
+        return len(self._table)
+
+    def _define(self, node):
+        d = self._defs.get(id(node))
+        if d is None:
+            d = self._defs[id(node)] = _ElementDef(node)
+            self._pending.append(d)
+        return d
+
+    def _compile(self, p):
+        b = self._b
+        if isinstance(p, tuple):
+            ps = []
+            for q in p:
+                ps.append((yield self._compile(q)))
+            return b.fold(b.group, ps)
+
+        kind = p.element
+        if 'element' == kind:
+            return b.element(('name', '', p.name), self._define(p))
+        elif kind in ('attribute', 'text', 'empty'):
+            return b.empty
+        elif 'interleave' == kind:
+            ps = []
+            for q in p.child if isinstance(p.child, tuple) else (p.child, ):
+                ps.append((yield self._compile(q)))
+            return b.fold(b.interleave, ps)
+        c = yield self._compile(p.child)
+        if 'optional' == kind:
+            return b.choice(c, b.empty)
+        elif 'zeroOrMore' == kind:
+            return b.choice(b.one_or_more(c), b.empty)
+        elif 'oneOrMore' == kind:
+            return b.one_or_more(c)
+        raise Exception("unsupported pattern {!r}".format(kind))
+
+    def _first(self, p):
+        '''
+        The element definitions that may come first in ``p``
+        '''
+
+        first = self._first_memo.get(p)
+        if first is None:
+            kind = p.kind
+            if 'element' == kind:
+                first = frozenset([p.p2])
+            elif kind in ('choice', 'interleave'):
+                first = self._first(p.p1) | self._first(p.p2)
+            elif 'group' == kind:
+                first = self._first(p.p1)
+                if p.p1.nullable:
+                    first |= self._first(p.p2)
+            elif 'oneOrMore' == kind:
+                first = self._first(p.p1)
+            else:
+                first = frozenset()
+            self._first_memo[p] = first
+        return first
+
+    def _deriv(self, p, d):
+        '''
+        The derivative of ``p`` by a valid element of the definition ``d``
+        '''
+
+        key = (p, d)
+        q = self._deriv_memo.get(key)
+        if q is not None:
+            return q
+        b = self._b
+        kind = p.kind
+        if 'element' == kind:
+            q = b.empty if p.p2 is d else b.not_allowed
+        elif 'choice' == kind:
+            q = b.choice(self._deriv(p.p1, d), self._deriv(p.p2, d))
+        elif 'group' == kind:
+            q = b.group(self._deriv(p.p1, d), p.p2)
+            if p.p1.nullable:
+                q = b.choice(q, self._deriv(p.p2, d))
+        elif 'interleave' == kind:
+            q = b.choice(b.interleave(self._deriv(p.p1, d), p.p2),
+                         b.interleave(p.p1, self._deriv(p.p2, d)))
+        elif 'oneOrMore' == kind:
+            q = b.group(self._deriv(p.p1, d), b.choice(p, b.empty))
+        else:
+            q = b.not_allowed
+        self._deriv_memo[key] = q
+        return q
+
+    def _transitions(self, state):
+        table = self._table.get(state)
+        if table is None:
+            table = {}
+            for d in self._first(state):
+                q = self._deriv(state, d)
+                if q is not self._b.not_allowed:
+                    table.setdefault(d.name, []).append((d, q))
+            table = self._table[state] = dict((k, tuple(v)) for k, v in table.items())
+        return table
+
+    def _explore(self, limit):
+        queue = [self.start] + [ d.start for d in self._defs.values() ]
+        seen = set(queue)
+        while queue and len(self._table) < limit:
+            for entries in self._transitions(queue.pop()).values():
+                for _, q in entries:
+                    if q not in seen:
+                        seen.add(q)
+                        queue.append(q)
+
+    def validate(self, obj):
+        if not isinstance(obj, dict) or 1 != len(obj):
+            return (False, "/: the top-level datatype must be a mapping with a single entry")
+        (name, value), = obj.items()
+        error = self._run(self.start, [(str(name), value)], None)
+        return (None is error, error or '')
+
+    def _element(self, d, value, path):
+        '''
+        The children of ``value`` if it's valid against ``d`` as far as its attributes go
+        '''
+
+        element = _Element(value, self.attribute_prefix)
+        error = element.error or self._check_attributes(d.node, element)
+        if error is not None:
+            return (None, "{}: {}".format(_format_path(path), error))
+        return (element.children, None)
+
+    def _valid(self, d, value, path):
+        children, error = self._element(d, value, path)
+        return error or self._run(d.start, children, path)
+
+    def _run(self, state, children, path):
+        '''
+        Walk ``children`` from ``state``; returns an error message or None
+        '''
+
+        b = self._b
+        stack = [[state, children, 0, path]]
+        while stack:
+            frame = stack[-1]
+            state, children, i, path = frame
+            if len(children) == i:
+                if not state.nullable:
+                    return "{}: missing child elements after {}".format(
+                        _format_path(path), [ n for n, _ in children ])
+                stack.pop()
+                continue
+
+            name, value = children[i]
+            entries = self._transitions(state).get(name)
+            if not entries:
+                return "{}: unexpected element {}".format(_format_path(path), name)
+            frame[2] = i + 1
+            child_path = (path, name)
+            if 1 == len(entries):
+                d, frame[0] = entries[0]
+                grandchildren, error = self._element(d, value, child_path)
+                if error is not None:
+                    return error
+                stack.append([d.start, grandchildren, 0, child_path])
+                continue
+
+            # the same name may match several element patterns, e.g. in [a, a*]
+            errors = []
+            states = []
+            for d, q in entries:
+                error = self._valid(d, value, child_path)
+                if error is None:
+                    states.append(q)
+                else:
+                    errors.append(error)
+            if not states:
+                return errors[0]
+            frame[0] = b.fold(b.choice, states)
+        return None
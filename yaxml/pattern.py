@@ -0,0 +1,277 @@
+'''
+A compact representation of the RngYaml pattern tree
+
+:class:`Node` holds the ``element`` (an interned kind), ``name`` and ``child`` of a pattern in
+slots instead of a dict, and sibling lists become tuples.  :func:`to_nodes` and
+:func:`to_dicts` convert from and to the dict form :func:`yaxml.load_rngyaml` returns;
+:func:`yaxml.compile_rngyaml_to_rng` and :func:`yaxml.merged_rngyamls` take either form.
+
+Sibling lists are :class:`SiblingList` and sibling tuples :class:`SiblingTuple`, which keep
+the :class:`SiblingIndex` a merge builds for them, so that merging an overlay into them again
+(or into what a merge derived from them) only looks up the keys of the overlay.
+'''
+
+import sys
+import pprint
+
+from . import (
+    MODIFIERS, DISJOINT, RngYamlParseError, _format_path, _trampoline, _merge_siblings)
+
+ELEMENT = sys.intern('element')
+ATTRIBUTE = sys.intern('attribute')
+INTERLEAVE = sys.intern('interleave')
+TEXT = sys.intern('text')
+EMPTY = sys.intern('empty')
+
+KINDS = dict((k, k) for k in [ELEMENT, ATTRIBUTE, INTERLEAVE, TEXT, EMPTY] +
+             [ sys.intern(m) for m in MODIFIERS ])
+
+
+class SiblingIndex(object):
+    '''
+    The position of the first pattern of each ``(element, name)`` key in a sibling sequence
+
+    A merge only replaces patterns with ones of the same key and appends new ones, so the
+    sequence it makes extends the index of its base with a layer for the appended keys.  A
+    layer at least half the size of the one below is folded into it, which keeps lookups
+    logarithmic in the number of keys and the copying amortized over the merges.
+
+    >>> index = SiblingIndex({'a': 0, 'b': 1, 'c': 2}).extended({'d': 3})
+    >>> [ index.get(k) for k in 'abde' ], index.depth
+    ([0, 1, 3, None], 1)
+    >>> index.extended({'e': 4}).depth
+    0
+    '''
+
+    __slots__ = ('positions', 'parent', 'depth')
+
+    def __init__(self, positions, parent=None):
+        self.positions = positions
+        self.parent = parent
+        self.depth = 0 if None is parent else parent.depth + 1
+
+    def get(self, key):
+        index = self
+        while None is not index:
+            i = index.positions.get(key)
+            if None is not i:
+                return i
+            index = index.parent
+        return None
+
+    def extended(self, positions):
+        if not positions:
+            return self
+        ret = SiblingIndex(positions, self)
+        while None is not ret.parent and 2 * len(ret.positions) >= len(ret.parent.positions):
+            folded = dict(ret.parent.positions)
+            folded.update(ret.positions)
+            ret = SiblingIndex(folded, ret.parent.parent)
+        return ret
+
+    @classmethod
+    def of(cls, siblings, key):
+        '''
+        Build the index of ``siblings`` with the ``key`` function
+        '''
+
+        positions = {}
+        for i, e in enumerate(siblings):
+            k = key(e)
+            if None is not k:
+                positions.setdefault(k, i)
+        return cls(positions)
+
+
+class SiblingList(list):
+    '''
+    A list of sibling patterns in the dict form which keeps its :class:`SiblingIndex`
+
+    Modifying the list drops the index.  Renaming a pattern in place isn't noticed, except
+    when a merge finds it by its old key; modify the list as well (``l[i] = l[i]``) then.
+    '''
+
+    __slots__ = ('sibling_index', )
+
+    def __init__(self, *args):
+        super(SiblingList, self).__init__(*args)
+        self.sibling_index = None
+
+
+def _dropping_index(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args):
+        self.sibling_index = None
+        return method(self, *args)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ['__setitem__', '__delitem__', '__iadd__', '__imul__', 'append', 'extend',
+              'insert', 'pop', 'remove', 'clear', 'sort', 'reverse']:
+    setattr(SiblingList, _name, _dropping_index(_name))
+
+
+class SiblingTuple(tuple):
+    '''
+    A tuple of sibling :class:`Node` patterns which keeps its :class:`SiblingIndex`
+    '''
+
+    sibling_index = None
+
+
+class Node(object):
+    '''
+    A pattern: ``element`` is its kind, ``name`` is set for elements and attributes, and
+    ``child`` is a :class:`Node`, a tuple of them or None
+    '''
+
+    __slots__ = ('element', 'name', 'child')
+
+    def __init__(self, element, name=None, child=None):
+        self.element = KINDS.get(element) or sys.intern(element)
+        self.name = name
+        self.child = child
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return (self.element == other.element and self.name == other.name and
+                self.child == other.child)
+
+    __hash__ = None
+
+    def __repr__(self):
+        args = [repr(self.element)]
+        if self.name is not None or self.child is not None:
+            args.append(repr(self.name))
+        if self.child is not None:
+            args.append(repr(self.child))
+        return 'Node({})'.format(', '.join(args))
+
+
+def to_nodes(pattern):
+    '''
+    Convert a pattern in the dict form into :class:`Node` objects
+
+    >>> to_nodes({'name': 'a', 'element': 'attribute', 'child': {'element': 'text'}})
+    Node('attribute', 'a', Node('text'))
+    '''
+
+    def convert(pattern):
+        if isinstance(pattern, Node):
+            return pattern
+        if isinstance(pattern, dict):
+            child = pattern.get('child')
+            return Node(pattern['element'], pattern.get('name'),
+                        None if child is None else (yield convert(child)))
+        if isinstance(pattern, (list, tuple)):
+            ret = []
+            for e in pattern:
+                ret.append((yield convert(e)))
+            return SiblingTuple(ret)
+        raise RngYamlParseError("what is {} of type {}", pprint.pformat(pattern), type(pattern))
+
+    return _trampoline(convert(pattern))
+
+
+def to_dicts(pattern):
+    '''
+    Convert :class:`Node` objects back into the dict form
+
+    >>> to_dicts(Node('optional', None, Node('element', 'a', (Node('empty'),))))
+    {'element': 'optional', 'child': {'name': 'a', 'element': 'element', 'child': [{'element': 'empty'}]}}
+    '''  # noqa: E501
+
+    def convert(pattern):
+        if isinstance(pattern, dict):
+            return pattern
+        if isinstance(pattern, Node):
+            ret = {}
+            if pattern.name is not None:
+                ret['name'] = pattern.name
+            ret['element'] = pattern.element
+            if pattern.child is not None:
+                ret['child'] = yield convert(pattern.child)
+            return ret
+        if isinstance(pattern, (list, tuple)):
+            ret = SiblingList()
+            for e in pattern:
+                ret.append((yield convert(e)))
+            return ret
+        raise RngYamlParseError("what is {} of type {}", pprint.pformat(pattern), type(pattern))
+
+    return _trampoline(convert(pattern))
+
+
+class NodePatterns(object):
+    '''
+    How :func:`yaxml._merge_siblings` reads and builds :class:`Node` patterns
+    '''
+
+    pattern_type = Node
+    siblings_type = tuple
+    indexed = SiblingTuple
+
+    @staticmethod
+    def key(e):
+        return None if e.name is None else (e.element, e.name)
+
+    @staticmethod
+    def child(e):
+        return e.child
+
+    @staticmethod
+    def with_child(e, child):
+        return Node(e.element, e.name, child)
+
+
+def merged_nodes(base, new, default_merge_mode=DISJOINT):  # noqa: C901
+    '''
+    :func:`yaxml.merged_rngyamls` for :class:`Node` trees
+    '''
+
+    def merge_siblings(path, base, new, merge_mode):
+        return _merge_siblings(NodePatterns, path, base, new, merge_mode)
+
+    def merge(path, base, new, merge_mode):
+        if isinstance(base, tuple):
+            return (yield merge_siblings(path, base, new, merge_mode))
+        if not isinstance(base, Node):
+            raise Exception("{}: what is {}".format(
+                _format_path(path), pprint.pformat(base)))
+        assert isinstance(new, Node), "{}: base is a Node but new is: {}".format(
+            _format_path(path), pprint.pformat(new))
+
+        if INTERLEAVE in (base.element, new.element):
+            if INTERLEAVE != base.element:
+                base = Node(INTERLEAVE, None, (base, ))
+            child = base.child if isinstance(base.child, tuple) else SiblingTuple((base.child, ))
+            return Node(INTERLEAVE, base.name, (yield merge_siblings(
+                path, child, new.child if INTERLEAVE == new.element else new, merge_mode)))
+        if ATTRIBUTE == base.element and ATTRIBUTE == new.element:
+            if DISJOINT == merge_mode:
+                assert base.name != new.name, "{}: {!r} and {!r} aren't disjoint".format(
+                    _format_path(path), base, new)
+            return base
+
+        if DISJOINT == merge_mode:
+            assert base.element == new.element and (
+                base.name is None or new.name is None or base.name == new.name), \
+                "{}: {!r} and {!r} aren't disjoint".format(_format_path(path), base, new)
+        name = new.name if base.name is None else base.name
+        child = base.child
+        if new.child is not None:
+            if child is None:
+                child = new.child
+            else:
+                if isinstance(new.child, tuple) and not isinstance(child, tuple):
+                    child = (child, )
+                child = yield merge((path, 'child'), child, new.child, merge_mode)
+        if name is base.name and child is base.child:
+            return base
+        return Node(base.element, name, child)
+
+    return _trampoline(merge(None, base, new, default_merge_mode))
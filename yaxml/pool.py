@@ -0,0 +1,216 @@
+'''
+A pool of long-lived validator processes
+
+Each worker keeps its compiled schemas (through :data:`yaxml.schema_cache`) and takes documents
+over a pipe, so a validation costs neither a process spawn nor a temporary file.  Workers
+validate with the in-process engines (``lxml``, which is libxml2 as in ``xmllint``, or the pure
+Python one), and a worker which dies is replaced.  Exceptions raised in a worker are raised in
+the caller as they are, or as :class:`ValidatorWorkerError` if they don't survive pickling.
+
+The pipes of a pool belong to the process which created it: a forked child (of
+``multiprocessing`` or ``concurrent.futures``) starts without a pool and builds its own if it
+needs one, instead of reading the answers meant for its parent.
+
+The pool is used by ``run_validator(..., backend='pool')``, and by ``backend='auto'`` once
+:func:`configure` (or ``$YAXML_VALIDATOR_POOL_SIZE``) gives it a non-zero size.
+'''
+
+import os
+import pickle
+import atexit
+import threading
+import multiprocessing
+import concurrent.futures
+
+from . import Exc, run_validator, SchemaCache
+
+POOL_SIZE_ENV = 'YAXML_VALIDATOR_POOL_SIZE'
+
+pool_size = int(os.environ.get(POOL_SIZE_ENV) or 0)
+pool_backend = 'auto'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ValidatorWorkerError(Exc):
+    def __init__(self, fmt, *args):
+        super(ValidatorWorkerError, self).__init__(fmt, *args)
+
+
+def _picklable(e):
+    '''
+    ``e`` if it can be sent back from a worker, or else a :class:`ValidatorWorkerError` with
+    its message, so that the worker doesn't die sending it
+    '''
+
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        return ValidatorWorkerError('{}: {}', type(e).__name__, e)
+
+
+def _worker_main(conn, backend):
+    global pool_size, _pool
+    pool_size = 0
+    _pool = None
+    schemas = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if None is msg:
+            return
+        if 'schema' == msg[0]:
+            schemas[msg[1]] = msg[2]
+            continue
+        data, schema_key = msg[1], msg[2]
+        try:
+            ret = ('ok', run_validator(data, schemas.get(schema_key), backend))
+        except Exception as e:
+            ret = ('error', _picklable(e))
+        conn.send(ret)
+
+
+class _Worker(object):
+    def __init__(self, backend):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, backend), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.schemas = set()
+
+    def validate(self, data, schema):
+        key = None
+        if None is not schema:
+            key = SchemaCache.key(schema)
+            if key not in self.schemas:
+                self.conn.send(('schema', key, schema))
+                self.schemas.add(key)
+        self.conn.send(('validate', data, key))
+        status, ret = self.conn.recv()
+        if 'error' == status:
+            raise ret
+        return ret
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ValidatorPool(object):
+    '''
+    ``size`` worker processes running :func:`yaxml.run_validator` with ``backend``, usable by
+    the process ``pid`` which created it
+    '''
+
+    def __init__(self, size, backend='auto'):
+        assert size > 0, "invalid pool size {!r}".format(size)
+        assert backend not in ('pool', 'xmllint'), \
+            "workers must validate in process, not with {!r}".format(backend)
+        self.pid = os.getpid()
+        self.size = size
+        self.backend = backend
+        self.restarts = 0
+        self._idle = [ _Worker(backend) for _ in range(size) ]
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle:
+                assert not self._closed, "the validator pool is closed"
+                self._cond.wait()
+            return self._idle.pop()
+
+    def _release(self, worker):
+        with self._cond:
+            if self._closed:
+                worker.close()
+                return
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def run_validator(self, data, schema=None):
+        worker = self._acquire()
+        try:
+            for attempt in range(2):
+                try:
+                    return worker.validate(data, schema)
+                except (EOFError, OSError):
+                    if attempt:
+                        raise
+                    worker.close()
+                    worker = _Worker(self.backend)
+                    with self._cond:
+                        self.restarts += 1
+        finally:
+            self._release(worker)
+
+    def map(self, documents, schema=None):
+        '''
+        Validate ``documents`` on all workers at once; returns the results in input order
+        '''
+
+        with concurrent.futures.ThreadPoolExecutor(self.size) as executor:
+            return list(executor.map(lambda d: self.run_validator(d, schema), documents))
+
+    def close(self):
+        if os.getpid() != self.pid:
+            # the workers are still serving the process which created them
+            return
+        with self._cond:
+            self._closed = True
+            for worker in self._idle:
+                worker.close()
+            self._idle = []
+            self._cond.notify_all()
+
+
+def configure(size, backend='auto'):
+    '''
+    Replace the shared pool with one of ``size`` workers, or shut it down if ``size`` is 0
+    '''
+
+    global pool_size, pool_backend, _pool
+    with _pool_lock:
+        pool_size = size
+        pool_backend = backend
+        old, _pool = _pool, None
+    if old:
+        old.close()
+
+
+def active():
+    return pool_size > 0
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if None is _pool or os.getpid() != _pool.pid:
+            _pool = ValidatorPool(pool_size or os.cpu_count() or 1, pool_backend)
+        return _pool
+
+
+def _forget_pool():
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+def shutdown():
+    configure(0)
+
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_forget_pool)
@@ -0,0 +1,1070 @@
+'''
+A pure-Python RELAX NG validator based on James Clark's derivative algorithm
+
+http://www.thaiopensource.com/relaxng/derivative.html
+
+Only single-document grammars are supported; ``include`` and ``externalRef`` raise
+:class:`RelaxNGNotSupported` so that callers can fall back to ``xmllint``, and so do the
+datatypes whose validity depends on the rest of the document or its DTD (``ID``, ``IDREF``,
+``ENTITY``, ``NOTATION`` and their lists).  Otherwise the results follow ``xmllint``'s, down to
+the ranges of date and time fields and the syntax of ``anyURI``.
+'''
+
+import re
+import decimal
+import xml.etree.ElementTree as ET
+
+from . import Exc
+
+RNG_NS = 'http://relaxng.org/ns/structure/1.0'
+XSD_DATATYPES = 'http://www.w3.org/2001/XMLSchema-datatypes'
+
+_RNG = '{' + RNG_NS + '}'
+
+
+class RelaxNGSchemaError(Exc):
+    def __init__(self, fmt, *args):
+        super(RelaxNGSchemaError, self).__init__(fmt, *args)
+
+
+class RelaxNGNotSupported(RelaxNGSchemaError):
+    def __init__(self, fmt, *args):
+        super(RelaxNGNotSupported, self).__init__(fmt, *args)
+
+
+def split_qname(tag):
+    '''
+    >>> split_qname('{urn:x}a')
+    ('urn:x', 'a')
+    >>> split_qname('a')
+    ('', 'a')
+    '''
+
+    if tag[:1] == '{':
+        ns, local = tag[1: ].split('}', 1)
+        return (ns, local)
+    return ('', tag)
+
+
+def is_whitespace(s):
+    return not s or s.isspace()
+
+
+#
+# Patterns
+#
+
+class Pattern(object):
+    __slots__ = ('kind', 'p1', 'p2', 'nullable')
+
+    def __init__(self, kind, p1, p2, nullable):
+        self.kind = kind
+        self.p1 = p1
+        self.p2 = p2
+        self.nullable = nullable
+
+    def __repr__(self):
+        if self.p1 is None:
+            return '<{}>'.format(self.kind)
+        return '<{} {!r} {!r}>'.format(self.kind, self.p1, self.p2)
+
+
+class ElementContent(object):
+    '''
+    Holder for the content pattern of an ``element``, filled in lazily to allow recursion
+    '''
+
+    __slots__ = ('pattern', 'source')
+
+    def __init__(self, source):
+        self.pattern = None
+        self.source = source
+
+
+class PatternBuilder(object):
+    '''
+    Hash-consing constructors for :class:`Pattern`, so that structurally equal patterns are
+    the same object and derivatives can be memoized by identity
+    '''
+
+    def __init__(self):
+        self._table = {}
+        self.empty = Pattern('empty', None, None, True)
+        self.not_allowed = Pattern('notAllowed', None, None, False)
+        self.text = Pattern('text', None, None, True)
+
+    def _intern(self, kind, p1, p2, nullable):
+        key = (kind, p1, p2)
+        p = self._table.get(key)
+        if p is None:
+            p = self._table.setdefault(key, Pattern(kind, p1, p2, nullable))
+        return p
+
+    def choice(self, p1, p2):
+        if p1 is self.not_allowed or p1 is p2:
+            return p2
+        if p2 is self.not_allowed:
+            return p1
+        if p1 is self.empty and p2.nullable:
+            return p2
+        if p2 is self.empty and p1.nullable:
+            return p1
+        return self._intern('choice', p1, p2, p1.nullable or p2.nullable)
+
+    def group(self, p1, p2):
+        if p1 is self.not_allowed or p2 is self.not_allowed:
+            return self.not_allowed
+        if p1 is self.empty:
+            return p2
+        if p2 is self.empty:
+            return p1
+        return self._intern('group', p1, p2, p1.nullable and p2.nullable)
+
+    def interleave(self, p1, p2):
+        if p1 is self.not_allowed or p2 is self.not_allowed:
+            return self.not_allowed
+        if p1 is self.empty:
+            return p2
+        if p2 is self.empty:
+            return p1
+        return self._intern('interleave', p1, p2, p1.nullable and p2.nullable)
+
+    def after(self, p1, p2):
+        if p1 is self.not_allowed or p2 is self.not_allowed:
+            return self.not_allowed
+        return self._intern('after', p1, p2, False)
+
+    def one_or_more(self, p):
+        if p is self.not_allowed or p is self.empty:
+            return p
+        return self._intern('oneOrMore', p, None, p.nullable)
+
+    def list(self, p):
+        if p is self.not_allowed:
+            return p
+        return self._intern('list', p, None, False)
+
+    def data(self, dt):
+        return self._intern('data', dt, None, False)
+
+    def data_except(self, dt, p):
+        if p is self.not_allowed:
+            return self.data(dt)
+        return self._intern('dataExcept', dt, p, False)
+
+    def value(self, dt, value):
+        return self._intern('value', dt, value, False)
+
+    def attribute(self, nc, p):
+        if p is self.not_allowed:
+            return p
+        return self._intern('attribute', nc, p, False)
+
+    def element(self, nc, content):
+        return self._intern('element', nc, content, False)
+
+    def fold(self, op, ps):
+        '''
+        Combine ``ps`` with the associative ``op`` into a balanced tree, keeping the depth
+        logarithmic in the number of siblings
+        '''
+
+        if not ps:
+            return self.empty
+        while len(ps) > 1:
+            ps = [ op(ps[i], ps[i + 1]) if i + 1 < len(ps) else ps[i]
+                   for i in range(0, len(ps), 2) ]
+        return ps[0]
+
+
+#
+# Name classes: ('name', ns, local) | ('anyName', except) | ('nsName', ns, except)
+#               | ('choice', nc1, nc2)
+#
+
+def name_class_contains(nc, qn):
+    kind = nc[0]
+    if 'name' == kind:
+        return nc[1] == qn[0] and nc[2] == qn[1]
+    elif 'anyName' == kind:
+        return nc[1] is None or not name_class_contains(nc[1], qn)
+    elif 'nsName' == kind:
+        return nc[1] == qn[0] and (nc[2] is None or not name_class_contains(nc[2], qn))
+    elif 'choice' == kind:
+        return name_class_contains(nc[1], qn) or name_class_contains(nc[2], qn)
+    raise RelaxNGSchemaError("unknown name class {!r}", nc)
+
+
+def name_class_str(nc):
+    kind = nc[0]
+    if 'name' == kind:
+        return nc[2] if not nc[1] else '{{{}}}{}'.format(nc[1], nc[2])
+    elif 'choice' == kind:
+        return name_class_str(nc[1]) + '|' + name_class_str(nc[2])
+    return kind
+
+
+#
+# Datatypes
+#
+
+_NAME_START = (
+    'A-Z_a-z\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u02FF\u0370-\u037D\u037F-\u1FFF\u200C-\u200D'
+    '\u2070-\u218F\u2C00-\u2FEF\u3001-\uD7FF\uF900-\uFDCF\uFDF0-\uFFFD')
+_NAME_CHAR = _NAME_START + '\\-.0-9\u00B7\u0300-\u036F\u203F-\u2040'
+_NCNAME = '[{}][{}]*'.format(_NAME_START, _NAME_CHAR)
+
+_YEAR = r'(?P<year>-?([1-9][0-9]{4,}|[0-9]{4}))'
+_MONTH = r'(?P<month>[0-9]{2})'
+_DAY = r'(?P<day>[0-9]{2})'
+_TIME = r'(?P<hour>[0-9]{2}):(?P<minute>[0-9]{2}):(?P<second>[0-9]{2}(\.[0-9]+)?)'
+_TZ = r'(Z|[+-](?P<tzhour>[0-9]{2}):(?P<tzminute>[0-9]{2}))?'
+
+_XSD_DATES = {
+    'dateTime': _YEAR + '-' + _MONTH + '-' + _DAY + 'T' + _TIME + _TZ,
+    'date': _YEAR + '-' + _MONTH + '-' + _DAY + _TZ,
+    'time': _TIME + _TZ,
+    'gYearMonth': _YEAR + '-' + _MONTH + _TZ,
+    'gYear': _YEAR + _TZ,
+    'gMonthDay': '--' + _MONTH + '-' + _DAY + _TZ,
+    'gDay': '---' + _DAY + _TZ,
+    'gMonth': '--' + _MONTH + _TZ,
+}
+
+_DAYS_IN_MONTH = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# characters libxml2 replaces before parsing an anyURI, so that they're always allowed
+_URI_LENIENT = re.compile(r"[\x00-\x20<>\"{}|\\^`'\x7f-\U0010FFFF]")
+_URI_CHAR = r"([-A-Za-z0-9._~!$&'()*+,;=_]|%[0-9A-Fa-f]{2})"
+_URI_PCHAR = '({}|[:@])'.format(_URI_CHAR)
+_URI_SEGMENT = _URI_PCHAR + '*'
+_URI_AUTHORITY = r'(({0}|:)*@)?(\[[0-9A-Za-z:.]+\]|{0}*)(:[0-9]*)?'.format(_URI_CHAR)
+_URI_TAIL = r'(\?({0}|[/?])*)?(#({0}|[/?])*)?'.format(_URI_PCHAR)
+_XSD_ANY_URI = re.compile(
+    '([A-Za-z][A-Za-z0-9+.-]*:(//{auth}(/{seg})*|/?({pchar}+(/{seg})*)?)'
+    '|//{auth}(/{seg})*|/({pchar}+(/{seg})*)?|({char}|@)+(/{seg})*|){tail}'.format(
+        auth=_URI_AUTHORITY, seg=_URI_SEGMENT, pchar=_URI_PCHAR, char=_URI_CHAR,
+        tail=_URI_TAIL))
+
+_XSD_LEXICAL = {
+    'string': None,
+    'normalizedString': None,
+    'token': None,
+    'language': r'[a-zA-Z]{1,8}(-[a-zA-Z0-9]{1,8})*',
+    'Name': '[{}:][{}:]*'.format(_NAME_START, _NAME_CHAR),
+    'NCName': _NCNAME,
+    'QName': '({0}:)?{0}'.format(_NCNAME),
+    'NMTOKEN': '[{}:]+'.format(_NAME_CHAR),
+    'NMTOKENS': '[{0}:]+( [{0}:]+)*'.format(_NAME_CHAR),
+    'boolean': r'true|false|1|0',
+    'decimal': r'[+-]?(\d+(\.\d*)?|\.\d+)',
+    'float': r'[+-]?(\d+(\.\d*)?|\.\d+)([Ee][+-]?\d+)?|-?INF|NaN',
+    'double': r'[+-]?(\d+(\.\d*)?|\.\d+)([Ee][+-]?\d+)?|-?INF|NaN',
+    'duration': r'-?P(?=\d|T[\d.])(\d+Y)?(\d+M)?(\d+D)?'
+                r'(T(?=[\d.])(\d+H)?(\d+M)?((\d+(\.\d*)?|\.\d+)S)?)?',
+    'hexBinary': r'([0-9a-fA-F]{2})*',
+    'base64Binary': r'(([A-Za-z0-9+/] ?){4})*(([A-Za-z0-9+/] ?){2}([AEIMQUYcgkosw048] ?)= ?'
+                    r'|[A-Za-z0-9+/] ?[AQgw] ?= ?=)?',
+}
+
+# whether these are valid depends on the rest of the document (unique IDs, references to them)
+# or on its DTD
+_XSD_CONTEXTUAL = ('ID', 'IDREF', 'IDREFS', 'ENTITY', 'ENTITIES', 'NOTATION')
+
+_XSD_INTEGERS = {
+    'integer': (None, None),
+    'nonPositiveInteger': (None, 0),
+    'negativeInteger': (None, -1),
+    'long': (-2**63, 2**63 - 1),
+    'int': (-2**31, 2**31 - 1),
+    'short': (-2**15, 2**15 - 1),
+    'byte': (-2**7, 2**7 - 1),
+    'nonNegativeInteger': (0, None),
+    'unsignedLong': (0, 2**64 - 1),
+    'unsignedInt': (0, 2**32 - 1),
+    'unsignedShort': (0, 2**16 - 1),
+    'unsignedByte': (0, 2**8 - 1),
+    'positiveInteger': (1, None),
+}
+
+_XSD_LISTS = ('NMTOKENS', )
+_XSD_NUMERIC = ('decimal', 'float', 'double') + tuple(_XSD_INTEGERS)
+_XSD_RANGE_FACETS = ('minInclusive', 'minExclusive', 'maxInclusive', 'maxExclusive')
+_XSD_LENGTH_FACETS = ('length', 'minLength', 'maxLength')
+
+
+def _is_leap_year(year):
+    return 0 == year % 4 and (0 != year % 100 or 0 == year % 400)
+
+
+def _date_in_range(m):
+    '''
+    Whether the fields of a match of :data:`_XSD_DATES` are within their ranges
+
+    >>> _date_in_range(re.fullmatch(_XSD_DATES['date'], '2020-02-29'))
+    True
+    >>> _date_in_range(re.fullmatch(_XSD_DATES['date'], '2019-02-29'))
+    False
+    >>> _date_in_range(re.fullmatch(_XSD_DATES['time'], '24:00:00'))
+    True
+    '''
+
+    f = dict((k, v) for k, v in m.groupdict().items() if v is not None)
+    year, month, day = [ int(f[k]) if k in f else None for k in ('year', 'month', 'day') ]
+    if 0 == year or month is not None and not 1 <= month <= 12:
+        return False
+    if day is not None:
+        days = 31 if month is None else _DAYS_IN_MONTH[month - 1]
+        if 2 == month and year is not None and not _is_leap_year(year):
+            days = 28
+        if not 1 <= day <= days:
+            return False
+    if 'hour' in f:
+        hour, minute, second = int(f['hour']), int(f['minute']), decimal.Decimal(f['second'])
+        if not (hour < 24 and minute < 60 and second < 60 or
+                24 == hour and 0 == minute and 0 == second):
+            return False
+    if 'tzhour' in f:
+        tzhour, tzminute = int(f['tzhour']), int(f['tzminute'])
+        if not (tzhour < 14 and tzminute < 60 or 14 == tzhour and 0 == tzminute):
+            return False
+    return True
+
+
+def _xsd_regex(pattern):
+    '''
+    Translate the XML Schema regex dialect to Python's ``re`` where they differ
+    '''
+
+    if re.search(r'\\[pPIC]', pattern):
+        raise RelaxNGNotSupported("unsupported regex construct in {!r}", pattern)
+    pattern = pattern.replace(r'\i', '[{}:]'.format(_NAME_START))
+    pattern = pattern.replace(r'\c', '[{}:]'.format(_NAME_CHAR))
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise RelaxNGNotSupported("cannot compile pattern {!r}: {}", pattern, e)
+
+
+class Datatype(object):
+    def __init__(self, library, name, params=()):  # noqa: C901
+        self.library = library
+        self.name = name
+        self.params = params
+
+        if '' == library:
+            if name not in ('string', 'token'):
+                raise RelaxNGSchemaError("unknown builtin datatype {!r}", name)
+            if params:
+                raise RelaxNGSchemaError("builtin datatype {!r} takes no params", name)
+            self._lexical = None
+            self._collapse = 'token' == name
+            self._replace = False
+            self._checks = []
+            return
+        if XSD_DATATYPES != library:
+            raise RelaxNGNotSupported("unsupported datatype library {!r}", library)
+
+        if name in _XSD_CONTEXTUAL:
+            raise RelaxNGNotSupported(
+                "datatype {!r} is not supported by the python backend", name)
+        if name in _XSD_INTEGERS:
+            lexical = r'[+-]?\d+'
+        elif name in _XSD_DATES or 'anyURI' == name:
+            lexical = None
+        elif name in _XSD_LEXICAL:
+            lexical = _XSD_LEXICAL[name]
+        else:
+            raise RelaxNGSchemaError("unknown datatype {!r}", name)
+        self._lexical = re.compile(lexical) if lexical else None
+        self._collapse = name not in ('string', 'normalizedString')
+        self._replace = 'normalizedString' == name
+        self._checks = []
+        if name in _XSD_INTEGERS:
+            lo, hi = _XSD_INTEGERS[name]
+            self._checks.append(lambda v: (lo is None or lo <= int(v)) and
+                                (hi is None or int(v) <= hi))
+        elif name in _XSD_DATES:
+            rx = re.compile(_XSD_DATES[name])
+            self._checks.append(lambda v: None is not rx.fullmatch(v) and
+                                _date_in_range(rx.fullmatch(v)))
+        elif 'anyURI' == name:
+            self._checks.append(
+                lambda v: None is not _XSD_ANY_URI.fullmatch(_URI_LENIENT.sub('_', v)))
+        for pname, pvalue in params:
+            self._checks.append(self._facet(pname, pvalue))
+
+    def _facet(self, pname, pvalue):
+        if 'pattern' == pname:
+            rx = _xsd_regex(pvalue)
+            return lambda v: rx.fullmatch(v) is not None
+        if pname in _XSD_LENGTH_FACETS:
+            n = int(pvalue.strip())
+            length = self._length
+            if 'length' == pname:
+                return lambda v: length(v) == n
+            if 'minLength' == pname:
+                return lambda v: length(v) >= n
+            return lambda v: length(v) <= n
+        if pname in _XSD_RANGE_FACETS and self.name in _XSD_NUMERIC:
+            bound = self._number(pvalue.strip())
+            number = self._number
+            return {
+                'minInclusive': lambda v: number(v) >= bound,
+                'minExclusive': lambda v: number(v) > bound,
+                'maxInclusive': lambda v: number(v) <= bound,
+                'maxExclusive': lambda v: number(v) < bound,
+            }[pname]
+        if 'totalDigits' == pname and self.name in _XSD_NUMERIC:
+            n = int(pvalue.strip())
+            return lambda v: len(v.lstrip('+-').replace('.', '').strip('0') or '0') <= n
+        if 'fractionDigits' == pname and self.name in _XSD_NUMERIC:
+            n = int(pvalue.strip())
+            return lambda v: len(v.partition('.')[2].rstrip('0')) <= n
+        raise RelaxNGNotSupported("unsupported facet {!r} for datatype {!r}", pname, self.name)
+
+    def _length(self, v):
+        if self.name in _XSD_LISTS:
+            return len(v.split())
+        if 'hexBinary' == self.name:
+            return len(v) // 2
+        if 'base64Binary' == self.name:
+            s = v.replace(' ', '')
+            return len(s) * 3 // 4 - s.count('=')
+        return len(v)
+
+    def _number(self, v):
+        if self.name in ('float', 'double'):
+            return float(v.replace('INF', 'inf'))
+        return decimal.Decimal(v)
+
+    def normalize(self, s):
+        if self._collapse:
+            return ' '.join(s.split())
+        if self._replace:
+            return s.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+        return s
+
+    def allows(self, s, nsmap=None):
+        '''
+        Whether ``s`` is a value of this datatype; the prefix of a ``QName`` must be declared in
+        ``nsmap``, the namespace declarations in scope, if it's given
+        '''
+
+        v = self.normalize(s)
+        if self._lexical is not None and self._lexical.fullmatch(v) is None:
+            return False
+        if 'QName' == self.name and None is not nsmap and ':' in v:
+            if v.split(':', 1)[0] not in nsmap:
+                return False
+        try:
+            return all(check(v) for check in self._checks)
+        except (ValueError, ArithmeticError):
+            return False
+
+    def equal(self, s1, s2):
+        v1 = self.normalize(s1)
+        v2 = self.normalize(s2)
+        if v1 == v2:
+            return True
+        try:
+            if self.name in _XSD_NUMERIC and XSD_DATATYPES == self.library:
+                return self._number(v1) == self._number(v2)
+            if 'boolean' == self.name and XSD_DATATYPES == self.library:
+                return v1 in ('true', '1') and v2 in ('true', '1') or \
+                    v1 in ('false', '0') and v2 in ('false', '0')
+        except (ValueError, ArithmeticError):
+            pass
+        return False
+
+    def __repr__(self):
+        return '<data {}>'.format(self.name)
+
+
+#
+# Schema parsing and simplification
+#
+
+class _Grammar(object):
+    def __init__(self, parent):
+        self.parent = parent
+        self.start = []
+        self.defines = {}
+        self.compiled = {}
+
+    def add(self, table_key, combine, pattern):
+        entries = self.start if table_key is None else self.defines.setdefault(table_key, [])
+        entries.append((combine, pattern))
+
+
+class _Context(object):
+    __slots__ = ('ns', 'datatype_library', 'nsmap', 'grammar')
+
+    def __init__(self, ns, datatype_library, nsmap, grammar):
+        self.ns = ns
+        self.datatype_library = datatype_library
+        self.nsmap = nsmap
+        self.grammar = grammar
+
+    def derive(self, el, nsmap):
+        ns = el.get('ns', self.ns)
+        dtl = el.get('datatypeLibrary', self.datatype_library)
+        return _Context(ns, dtl, nsmap, self.grammar)
+
+    def with_grammar(self, grammar):
+        return _Context(self.ns, self.datatype_library, self.nsmap, grammar)
+
+
+def parse_with_nsmaps(source):
+    '''
+    Parse the XML document ``source`` into its root element and a dict mapping each element to
+    the namespace declarations in scope there, ``{prefix: uri}``
+    '''
+
+    parser = ET.XMLPullParser(events=('start-ns', 'start', 'end'))
+    parser.feed(source)
+    parser.close()
+
+    nsmaps = {}
+    stack = [{'xml': 'http://www.w3.org/XML/1998/namespace'}]
+    pending = {}
+    root = None
+    for event, obj in parser.read_events():
+        if 'start-ns' == event:
+            pending[obj[0]] = obj[1]
+        elif 'start' == event:
+            if root is None:
+                root = obj
+            if pending:
+                nsmap = dict(stack[-1])
+                nsmap.update(pending)
+                pending = {}
+            else:
+                nsmap = stack[-1]
+            nsmaps[obj] = nsmap
+            stack.append(nsmap)
+        else:
+            stack.pop()
+    return root, nsmaps
+
+
+class _SchemaParser(object):
+    def __init__(self, nsmaps):
+        self._nsmaps = nsmaps
+        self.builder = PatternBuilder()
+        self._elements = {}
+        self._pending = []
+        self._expanding = set()
+        self.uses_qnames = False
+
+    #
+    # XML -> intermediate form: ('ref', grammar, name) and the structural tuples below
+    #
+
+    def _rng_children(self, el):
+        return [ c for c in el if isinstance(c.tag, str) and c.tag.startswith(_RNG) ]
+
+    def _local(self, el):
+        return el.tag[len(_RNG): ]
+
+    def _resolve_qname(self, qname, ctx, default_ns):
+        qname = qname.strip()
+        if ':' in qname:
+            prefix, local = qname.split(':', 1)
+            if prefix not in ctx.nsmap:
+                raise RelaxNGSchemaError("undeclared namespace prefix {!r}", prefix)
+            return (ctx.nsmap[prefix], local)
+        return (default_ns, qname)
+
+    def _name_class(self, el, ctx):
+        ctx = ctx.derive(el, self._nsmaps.get(el, ctx.nsmap))
+        kind = self._local(el)
+        if 'name' == kind:
+            ns, local = self._resolve_qname(el.text or '', ctx, ctx.ns or '')
+            return ('name', ns, local)
+        if kind in ('anyName', 'nsName'):
+            exc = None
+            for c in self._rng_children(el):
+                if 'except' != self._local(c):
+                    raise RelaxNGSchemaError("unexpected {!r} in {}", self._local(c), kind)
+                exc = self._name_class_choice(self._rng_children(c), ctx)
+            if 'anyName' == kind:
+                return ('anyName', exc)
+            return ('nsName', ctx.ns or '', exc)
+        if 'choice' == kind:
+            return self._name_class_choice(self._rng_children(el), ctx)
+        raise RelaxNGSchemaError("expecting name, anyName, nsName or choice : got {}", kind)
+
+    def _name_class_choice(self, els, ctx):
+        if not els:
+            raise RelaxNGSchemaError("empty name class choice")
+        ncs = [ self._name_class(c, ctx) for c in els ]
+        nc = ncs[0]
+        for n in ncs[1: ]:
+            nc = ('choice', nc, n)
+        return nc
+
+    def parse(self, root):
+        ctx = _Context('', '', self._nsmaps.get(root, {}), None)
+        return self._pattern(root, ctx)
+
+    def _patterns(self, els, ctx):
+        return [ self._pattern(c, ctx) for c in els ]
+
+    def _pattern(self, el, ctx):  # noqa: C901
+        if not el.tag.startswith(_RNG):
+            raise RelaxNGSchemaError("expecting a RELAX NG pattern, got {}", el.tag)
+        ctx = ctx.derive(el, self._nsmaps.get(el, ctx.nsmap))
+        kind = self._local(el)
+        children = self._rng_children(el)
+        if kind in ('element', 'attribute'):
+            if el.get('name') is not None:
+                # unlike elements, attributes only take the ns attribute given on themselves
+                default_ns = ctx.ns if 'element' == kind else el.get('ns', '')
+                nc = ('name', ) + self._resolve_qname(el.get('name'), ctx, default_ns)
+            else:
+                if not children:
+                    raise RelaxNGSchemaError("{} has no name class", kind)
+                nc = self._name_class(children[0], ctx)
+                children = children[1: ]
+            if 'element' == kind:
+                if not children:
+                    raise RelaxNGSchemaError("element {} has no content", name_class_str(nc))
+                return ('element', nc, ('group', self._patterns(children, ctx)))
+            if len(children) > 1:
+                raise RelaxNGSchemaError("attribute {} has multiple children",
+                                         name_class_str(nc))
+            content = self._pattern(children[0], ctx) if children else ('text', )
+            return ('attribute', nc, content)
+        elif kind in ('group', 'interleave', 'choice'):
+            if not children:
+                raise RelaxNGSchemaError("{} is empty", kind)
+            return (kind, self._patterns(children, ctx))
+        elif kind in ('optional', 'zeroOrMore', 'oneOrMore', 'list', 'mixed'):
+            if not children:
+                raise RelaxNGSchemaError("{} is empty", kind)
+            return (kind, ('group', self._patterns(children, ctx)))
+        elif kind in ('empty', 'text', 'notAllowed'):
+            return (kind, )
+        elif kind in ('ref', 'parentRef'):
+            grammar = ctx.grammar if 'ref' == kind else ctx.grammar and ctx.grammar.parent
+            if grammar is None:
+                raise RelaxNGSchemaError("{} {!r} outside of a grammar", kind, el.get('name'))
+            return ('ref', grammar, el.get('name', '').strip())
+        elif 'data' == kind:
+            params = []
+            exc = None
+            for c in children:
+                if 'param' == self._local(c):
+                    params.append((c.get('name', '').strip(), c.text or ''))
+                elif 'except' == self._local(c):
+                    exc = ('choice', self._patterns(self._rng_children(c), ctx))
+            dt = self._datatype(ctx.datatype_library, el.get('type', '').strip(), params)
+            return ('data', dt, exc)
+        elif 'value' == kind:
+            if el.get('type') is None:
+                dt = self._datatype('', 'token', ())
+            else:
+                dt = self._datatype(ctx.datatype_library, el.get('type').strip(), ())
+            if 'QName' == dt.name:
+                raise RelaxNGNotSupported("QName values are not supported by the python backend")
+            return ('value', dt, el.text or '')
+        elif 'grammar' == kind:
+            grammar = _Grammar(ctx.grammar)
+            self._grammar_content(el, ctx.with_grammar(grammar), grammar)
+            if not grammar.start:
+                raise RelaxNGSchemaError("grammar has no start")
+            return ('ref', grammar, None)
+        elif kind in ('externalRef', 'include'):
+            raise RelaxNGNotSupported("{} is not supported by the python backend", kind)
+        raise RelaxNGSchemaError("unexpected pattern {!r}", kind)
+
+    def _grammar_content(self, el, ctx, grammar):
+        for c in self._rng_children(el):
+            cctx = ctx.derive(c, self._nsmaps.get(c, ctx.nsmap))
+            kind = self._local(c)
+            combine = c.get('combine')
+            if 'start' == kind:
+                patterns = self._rng_children(c)
+                if 1 != len(patterns):
+                    raise RelaxNGSchemaError("start must contain exactly one pattern")
+                grammar.add(None, combine, self._pattern(patterns[0], cctx))
+            elif 'define' == kind:
+                body = ('group', self._patterns(self._rng_children(c), cctx))
+                grammar.add(c.get('name', '').strip(), combine, body)
+            elif 'div' == kind:
+                self._grammar_content(c, cctx, grammar)
+            elif 'include' == kind:
+                raise RelaxNGNotSupported("include is not supported by the python backend")
+            else:
+                raise RelaxNGSchemaError("unexpected {!r} in grammar", kind)
+
+    def _datatype(self, library, name, params):
+        if 'QName' == name:
+            self.uses_qnames = True
+        return Datatype(library, name, tuple(params))
+
+    #
+    # intermediate form -> Pattern
+    #
+
+    def compile(self, node):
+        p = self._compile(node)
+        while self._pending:
+            content = self._pending.pop()
+            content.pattern = self._compile(content.source)
+            content.source = None
+        return p
+
+    def _compile(self, node):  # noqa: C901
+        b = self.builder
+        kind = node[0]
+        if 'element' == kind:
+            key = id(node)
+            if key not in self._elements:
+                content = ElementContent(node[2])
+                self._pending.append(content)
+                self._elements[key] = (node, b.element(node[1], content))
+            return self._elements[key][1]
+        elif 'attribute' == kind:
+            return b.attribute(node[1], self._compile(node[2]))
+        elif 'group' == kind:
+            return b.fold(b.group, [ self._compile(n) for n in node[1] ])
+        elif 'interleave' == kind:
+            return b.fold(b.interleave, [ self._compile(n) for n in node[1] ])
+        elif 'choice' == kind:
+            return b.fold(b.choice, [ self._compile(n) for n in node[1] ])
+        elif 'optional' == kind:
+            return b.choice(self._compile(node[1]), b.empty)
+        elif 'zeroOrMore' == kind:
+            return b.choice(b.one_or_more(self._compile(node[1])), b.empty)
+        elif 'oneOrMore' == kind:
+            return b.one_or_more(self._compile(node[1]))
+        elif 'list' == kind:
+            return b.list(self._compile(node[1]))
+        elif 'mixed' == kind:
+            return b.interleave(self._compile(node[1]), b.text)
+        elif 'empty' == kind:
+            return b.empty
+        elif 'text' == kind:
+            return b.text
+        elif 'notAllowed' == kind:
+            return b.not_allowed
+        elif 'data' == kind:
+            if node[2] is None:
+                return b.data(node[1])
+            return b.data_except(node[1], self._compile(node[2]))
+        elif 'value' == kind:
+            return b.value(node[1], node[2])
+        elif 'ref' == kind:
+            return self._compile_ref(node[1], node[2])
+        raise RelaxNGSchemaError("unexpected node {!r}", kind)
+
+    def _compile_ref(self, grammar, name):
+        if name in grammar.compiled:
+            return grammar.compiled[name]
+        entries = grammar.start if name is None else grammar.defines.get(name)
+        if not entries:
+            raise RelaxNGSchemaError("reference to undefined pattern {!r}", name)
+        key = (id(grammar), name)
+        if key in self._expanding:
+            raise RelaxNGSchemaError("recursive reference to {!r} outside an element", name)
+        self._expanding.add(key)
+
+        combines = set(c for c, _ in entries if c)
+        if len(combines) > 1 or len(entries) - sum(1 for c, _ in entries if c) > 1:
+            raise RelaxNGSchemaError("conflicting combine for {!r}", name or 'start')
+        b = self.builder
+        op = b.interleave if 'interleave' in combines else b.choice
+        p = b.fold(op, [ self._compile(body) for _, body in entries ])
+
+        self._expanding.discard(key)
+        grammar.compiled[name] = p
+        return p
+
+
+#
+# Derivatives
+#
+
+class RelaxNG(object):
+    '''
+    A compiled RELAX NG schema
+
+    >>> rng = RelaxNG('<element name="a" xmlns="http://relaxng.org/ns/structure/1.0"><text/>'
+    ...               '</element>')
+    >>> rng.validate(ET.fromstring('<a>x</a>'))
+    (True, '')
+    >>> rng.validate(ET.fromstring('<b/>'))
+    (False, 'element b: Relax-NG validity error : Did not expect element b there')
+    '''
+
+    def __init__(self, source):
+        if isinstance(source, ET.ElementTree):
+            source = source.getroot()
+        if ET.iselement(source):
+            source = ET.tostring(source)
+        try:
+            root, nsmaps = parse_with_nsmaps(source)
+        except ET.ParseError as e:
+            raise RelaxNGSchemaError("schema is not well-formed: {}", e)
+        parser = _SchemaParser(nsmaps)
+        self._b = parser.builder
+        self.start = parser.compile(parser.parse(root))
+        # whether validate() needs the namespace declarations of the document
+        self.uses_qnames = parser.uses_qnames
+        self._open_memo = {}
+        self._close_memo = {}
+        self._end_memo = {}
+
+    def validate(self, root, nsmaps=None):
+        '''
+        Validate an ``ET.Element`` and return ``(ok, error_message)``
+
+        ``nsmaps`` maps the elements to the namespace declarations in scope, as
+        :func:`parse_with_nsmaps` returns, for resolving the prefixes of ``QName`` values;
+        without it they're only checked lexically.  The document is walked on an explicit
+        stack, so its depth is only limited by memory.
+        '''
+
+        if isinstance(root, ET.ElementTree):
+            root = root.getroot()
+        errors = []
+        p = self._element_deriv(self.start, root, nsmaps, errors)
+        if p.nullable:
+            return (True, '')
+        if not errors:
+            errors.append("element {}: Relax-NG validity error : Expecting a different root "
+                          "element".format(root.tag))
+        return (False, errors[0])
+
+    def _error(self, errors, el, fmt, *args):
+        if not errors:
+            errors.append("element {}: Relax-NG validity error : {}".format(
+                el.tag, fmt.format(*args)))
+
+    def _element_deriv(self, p, root, nsmaps, errors):  # noqa: C901
+        '''
+        The derivative of ``p`` with respect to the element ``root`` and its descendants
+        '''
+
+        not_allowed = self._b.not_allowed
+        # [(element, nsmap, iterator over its children)] for the open elements
+        stack = []
+        el = root
+        while None is not el:
+            nsmap = nsmaps.get(el) if nsmaps else None
+            p = self._open_element(p, el, nsmap, errors)
+            if p is not_allowed:
+                return p
+            if len(el):
+                if not is_whitespace(el.text):
+                    p = self._text_content(p, el.text, el, nsmap, errors)
+                    if p is not_allowed:
+                        return p
+                stack.append((el, nsmap, iter(el)))
+            else:
+                p = self._leaf_content(p, el, nsmap, errors)
+                if p is not_allowed:
+                    return p
+                p = self._close_element(p, el, stack, errors)
+                if p is not_allowed:
+                    return p
+
+            # the next element to open, closing those which have no more children
+            el = None
+            while stack and None is el:
+                parent, _, children = stack[-1]
+                el = next((c for c in children if isinstance(c.tag, str)), None)
+                if None is el:
+                    stack.pop()
+                    p = self._close_element(p, parent, stack, errors)
+                    if p is not_allowed:
+                        return p
+        return p
+
+    def _open_element(self, p, el, nsmap, errors):
+        not_allowed = self._b.not_allowed
+        p1 = self.start_tag_open_deriv(p, split_qname(el.tag))
+        if p1 is not_allowed:
+            self._error(errors, el, "Did not expect element {} there", el.tag)
+            return p1
+        for k, v in el.attrib.items():
+            p1 = self.att_deriv(p1, split_qname(k), v, nsmap)
+            if p1 is not_allowed:
+                self._error(errors, el, "Invalid attribute {} for element {}", k, el.tag)
+                return p1
+        p1 = self.start_tag_close_deriv(p1)
+        if p1 is not_allowed:
+            self._error(errors, el, "Element {} failed to validate attributes", el.tag)
+        return p1
+
+    def _leaf_content(self, p, el, nsmap, errors):
+        s = el.text or ''
+        p1 = self.text_deriv(p, s, nsmap)
+        if is_whitespace(s):
+            return self._b.choice(p, p1)
+        if p1 is self._b.not_allowed:
+            self._error(errors, el, "Element {} has invalid text content", el.tag)
+        return p1
+
+    def _text_content(self, p, s, el, nsmap, errors):
+        p = self.text_deriv(p, s, nsmap)
+        if p is self._b.not_allowed:
+            self._error(errors, el, "Element {} has extra text content", el.tag)
+        return p
+
+    def _close_element(self, p, el, stack, errors):
+        '''
+        Close ``el`` and match its tail within its parent, the last of ``stack``
+        '''
+
+        p = self.end_tag_deriv(p)
+        if p is self._b.not_allowed:
+            self._error(errors, el, "Element {} has missing or extra content", el.tag)
+            return p
+        if stack and not is_whitespace(el.tail):
+            parent, nsmap, _ = stack[-1]
+            p = self._text_content(p, el.tail, parent, nsmap, errors)
+        return p
+
+    def text_deriv(self, p, s, nsmap=None):  # noqa: C901
+        b = self._b
+        kind = p.kind
+        if 'choice' == kind:
+            return b.choice(self.text_deriv(p.p1, s, nsmap), self.text_deriv(p.p2, s, nsmap))
+        elif 'interleave' == kind:
+            return b.choice(b.interleave(self.text_deriv(p.p1, s, nsmap), p.p2),
+                            b.interleave(p.p1, self.text_deriv(p.p2, s, nsmap)))
+        elif 'group' == kind:
+            q = b.group(self.text_deriv(p.p1, s, nsmap), p.p2)
+            return b.choice(q, self.text_deriv(p.p2, s, nsmap)) if p.p1.nullable else q
+        elif 'after' == kind:
+            return b.after(self.text_deriv(p.p1, s, nsmap), p.p2)
+        elif 'oneOrMore' == kind:
+            return b.group(self.text_deriv(p.p1, s, nsmap), b.choice(p, b.empty))
+        elif 'text' == kind:
+            return p
+        elif 'value' == kind:
+            return b.empty if p.p1.equal(p.p2, s) else b.not_allowed
+        elif 'data' == kind:
+            return b.empty if p.p1.allows(s, nsmap) else b.not_allowed
+        elif 'dataExcept' == kind:
+            ok = p.p1.allows(s, nsmap) and not self.text_deriv(p.p2, s, nsmap).nullable
+            return b.empty if ok else b.not_allowed
+        elif 'list' == kind:
+            q = p.p1
+            for word in s.split():
+                q = self.text_deriv(q, word, nsmap)
+                if q is b.not_allowed:
+                    break
+            return b.empty if q.nullable else b.not_allowed
+        return b.not_allowed
+
+    def _apply_after(self, f, p):
+        b = self._b
+        if 'after' == p.kind:
+            return b.after(p.p1, f(p.p2))
+        elif 'choice' == p.kind:
+            return b.choice(self._apply_after(f, p.p1), self._apply_after(f, p.p2))
+        return b.not_allowed
+
+    def start_tag_open_deriv(self, p, qn):
+        key = (p, qn)
+        q = self._open_memo.get(key)
+        if q is None:
+            q = self._open_memo[key] = self._start_tag_open_deriv(p, qn)
+        return q
+
+    def _start_tag_open_deriv(self, p, qn):  # noqa: C901
+        b = self._b
+        kind = p.kind
+        if 'choice' == kind:
+            return b.choice(self.start_tag_open_deriv(p.p1, qn),
+                            self.start_tag_open_deriv(p.p2, qn))
+        elif 'element' == kind:
+            if name_class_contains(p.p1, qn):
+                return b.after(p.p2.pattern, b.empty)
+            return b.not_allowed
+        elif 'interleave' == kind:
+            p1, p2 = p.p1, p.p2
+            return b.choice(
+                self._apply_after(lambda x: b.interleave(x, p2), self.start_tag_open_deriv(p1, qn)),
+                self._apply_after(lambda x: b.interleave(p1, x), self.start_tag_open_deriv(p2, qn)))
+        elif 'oneOrMore' == kind:
+            rest = b.choice(p, b.empty)
+            return self._apply_after(lambda x: b.group(x, rest),
+                                     self.start_tag_open_deriv(p.p1, qn))
+        elif 'group' == kind:
+            p2 = p.p2
+            x = self._apply_after(lambda x: b.group(x, p2), self.start_tag_open_deriv(p.p1, qn))
+            if p.p1.nullable:
+                return b.choice(x, self.start_tag_open_deriv(p2, qn))
+            return x
+        elif 'after' == kind:
+            p2 = p.p2
+            return self._apply_after(lambda x: b.after(x, p2),
+                                     self.start_tag_open_deriv(p.p1, qn))
+        return b.not_allowed
+
+    def att_deriv(self, p, qn, value, nsmap=None):  # noqa: C901
+        b = self._b
+        kind = p.kind
+        if 'after' == kind:
+            return b.after(self.att_deriv(p.p1, qn, value, nsmap), p.p2)
+        elif 'choice' == kind:
+            return b.choice(self.att_deriv(p.p1, qn, value, nsmap),
+                            self.att_deriv(p.p2, qn, value, nsmap))
+        elif 'group' == kind:
+            return b.choice(b.group(self.att_deriv(p.p1, qn, value, nsmap), p.p2),
+                            b.group(p.p1, self.att_deriv(p.p2, qn, value, nsmap)))
+        elif 'interleave' == kind:
+            return b.choice(b.interleave(self.att_deriv(p.p1, qn, value, nsmap), p.p2),
+                            b.interleave(p.p1, self.att_deriv(p.p2, qn, value, nsmap)))
+        elif 'oneOrMore' == kind:
+            return b.group(self.att_deriv(p.p1, qn, value, nsmap), b.choice(p, b.empty))
+        elif 'attribute' == kind:
+            if name_class_contains(p.p1, qn) and self._value_match(p.p2, value, nsmap):
+                return b.empty
+        return b.not_allowed
+
+    def _value_match(self, p, s, nsmap):
+        return (p.nullable and is_whitespace(s)) or self.text_deriv(p, s, nsmap).nullable
+
+    def start_tag_close_deriv(self, p):
+        q = self._close_memo.get(p)
+        if q is None:
+            q = self._close_memo[p] = self._start_tag_close_deriv(p)
+        return q
+
+    def _start_tag_close_deriv(self, p):
+        b = self._b
+        kind = p.kind
+        if 'after' == kind:
+            return b.after(self.start_tag_close_deriv(p.p1), p.p2)
+        elif 'choice' == kind:
+            return b.choice(self.start_tag_close_deriv(p.p1), self.start_tag_close_deriv(p.p2))
+        elif 'group' == kind:
+            return b.group(self.start_tag_close_deriv(p.p1), self.start_tag_close_deriv(p.p2))
+        elif 'interleave' == kind:
+            return b.interleave(self.start_tag_close_deriv(p.p1),
+                                self.start_tag_close_deriv(p.p2))
+        elif 'oneOrMore' == kind:
+            return b.one_or_more(self.start_tag_close_deriv(p.p1))
+        elif 'attribute' == kind:
+            return b.not_allowed
+        return p
+
+    def end_tag_deriv(self, p):
+        q = self._end_memo.get(p)
+        if q is None:
+            q = self._end_memo[p] = self._end_tag_deriv(p)
+        return q
+
+    def _end_tag_deriv(self, p):
+        b = self._b
+        if 'choice' == p.kind:
+            return b.choice(self.end_tag_deriv(p.p1), self.end_tag_deriv(p.p2))
+        elif 'after' == p.kind:
+            return p.p2 if p.p1.nullable else b.not_allowed
+        return b.not_allowed
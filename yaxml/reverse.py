@@ -0,0 +1,162 @@
+'''
+Convert XML back into the YAML :func:`yaxml.load_yaml_as_xml` reads
+
+The XML is read with ``ET.iterparse`` and every element is dropped as soon as it's been written,
+so memory use follows the nesting depth.  Since the children of an element are only known as
+they come, an element with child elements becomes a sequence: an item with its attributes (if
+any) followed by a single-entry mapping per child::
+
+    Root:
+    - _version: '2'
+    - Service:
+        _enabled: true
+    - Service: {}
+
+An element without children becomes a mapping of its attributes.  Attribute values are strings
+except ``true`` and ``false``, which are written as booleans, and integers written the way
+``str()`` would, so that converting the result gives back the same elements and attributes.
+'''
+
+import io
+import re
+import xml.etree.ElementTree as ET
+
+import yaml as pyyaml
+
+from . import Exc, is_filepath
+from .relaxng import is_whitespace
+from .stream import is_binary_stream
+
+YAML_DUMPER = getattr(pyyaml, 'CSafeDumper', pyyaml.SafeDumper)
+
+STR_TAG = 'tag:yaml.org,2002:str'
+BOOL_TAG = 'tag:yaml.org,2002:bool'
+INT_TAG = 'tag:yaml.org,2002:int'
+
+_INT_RE = re.compile('0|-?[1-9][0-9]*')
+
+
+class NotRepresentable(Exc):
+    def __init__(self, fmt, *args):
+        super(NotRepresentable, self).__init__(fmt, *args)
+
+
+class _Scalars(object):
+    '''
+    Builds the scalar events, quoting the strings a plain scalar wouldn't load back as
+    '''
+
+    def __init__(self):
+        self._resolver = pyyaml.resolver.Resolver()
+        self._plain = {}
+
+    def string(self, value):
+        plain = self._plain.get(value)
+        if plain is None:
+            plain = STR_TAG == self._resolver.resolve(pyyaml.ScalarNode, value, (True, False))
+            if len(self._plain) < 4096:
+                self._plain[value] = plain
+        return pyyaml.ScalarEvent(None, STR_TAG, (plain, True), value)
+
+    def attribute_value(self, value):
+        if value in ('true', 'false'):
+            return pyyaml.ScalarEvent(None, BOOL_TAG, (True, False), value)
+        if _INT_RE.fullmatch(value):
+            return pyyaml.ScalarEvent(None, INT_TAG, (True, False), value)
+        return self.string(value)
+
+
+def _open_source(source):
+    if hasattr(source, 'read'):
+        return source
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if is_filepath(source):
+        return source
+    return io.StringIO(source)
+
+
+def xml_to_yaml_events(source, attribute_prefix='_', encoding=None):  # noqa: C901
+    '''
+    Parse the XML ``source`` (a path, a file object or the document itself) and yield the
+    PyYAML events of its YAML form, in a stream encoded with ``encoding`` if it's given
+    '''
+
+    scalars = _Scalars()
+    # [element, opened]: opened once the element is known to have children
+    stack = []
+    last = None
+
+    def check_text(text, where):
+        if text and not is_whitespace(text):
+            raise NotRepresentable("text {!r} in {} can't be represented", text, where)
+
+    def attributes(attrib):
+        yield pyyaml.MappingStartEvent(None, None, True)
+        for k, v in attrib.items():
+            yield scalars.string(attribute_prefix + k)
+            yield scalars.attribute_value(v)
+        yield pyyaml.MappingEndEvent()
+
+    yield pyyaml.StreamStartEvent(encoding=encoding)
+    for event, e in ET.iterparse(_open_source(source), ('start', 'end')):
+        if None is not last:
+            check_text(last.tail, 'the tail of ' + last.tag)
+            last = None
+        if 'start' == event:
+            if attribute_prefix == e.tag[ :len(attribute_prefix)]:
+                raise NotRepresentable(
+                    "element {} would be read back as an attribute", e.tag)
+            if not stack:
+                yield pyyaml.DocumentStartEvent()
+            elif not stack[-1][1]:
+                parent = stack[-1][0]
+                check_text(parent.text, parent.tag)
+                stack[-1][1] = True
+                yield pyyaml.SequenceStartEvent(None, None, True)
+                if len(parent.attrib):
+                    yield from attributes(parent.attrib)
+            yield pyyaml.MappingStartEvent(None, None, True)
+            yield scalars.string(e.tag)
+            stack.append([e, False])
+        else:
+            _, opened = stack.pop()
+            if opened:
+                yield pyyaml.SequenceEndEvent()
+            else:
+                check_text(e.text, e.tag)
+                yield from attributes(e.attrib)
+            yield pyyaml.MappingEndEvent()
+            if stack:
+                # drop the element so that memory use doesn't grow with the document; its tail
+                # may or may not have been parsed yet
+                check_text(e.tail, 'the tail of ' + e.tag)
+                e.clear()
+                stack[-1][0].remove(e)
+                last = e
+            else:
+                yield pyyaml.DocumentEndEvent()
+    yield pyyaml.StreamEndEvent()
+
+
+def dump_xml_as_yaml(source, out=None, attribute_prefix='_', encoding='utf-8', dumper=None):
+    '''
+    Convert the XML ``source`` (a path, a file object or the document itself) into YAML
+    written to ``out``, a text or binary stream, or returned as a string if it's None
+
+    ``load_yaml_as_xml(dump_xml_as_yaml(xml), attribute_prefix)`` gives back the elements and
+    attributes of ``xml``; text other than whitespace between elements can't be represented
+    and raises :class:`NotRepresentable`.
+
+    >>> print(dump_xml_as_yaml('<r a="1" b="x"><c d="true"/><c/></r>'), end='')
+    r:
+    - _a: 1
+      _b: x
+    - c:
+        _d: true
+    - c: {}
+    '''
+
+    binary = None is not out and is_binary_stream(out)
+    events = xml_to_yaml_events(source, attribute_prefix, encoding if binary else None)
+    return pyyaml.emit(events, out, dumper or YAML_DUMPER, allow_unicode=True)
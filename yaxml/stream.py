@@ -0,0 +1,363 @@
+'''
+Convert YAML to XML straight from PyYAML's event stream, without building the intermediate
+Python objects or an ``ElementTree``, so that memory use follows the nesting depth and the keys
+of the mappings being written
+
+The output matches ``ET.tostring(load_yaml_as_xml(source).getroot(), 'unicode')`` except that
+attributes must precede child elements within a mapping, and anchors on (and merge keys into)
+mappings and sequences and ``{uri}name`` names aren't supported; all of them raise
+:class:`StreamingNotSupported`.  Names and attribute values are checked as they're read, the
+way ``validate='names'`` checks the tree, and fail with the same ``AssertionError``.
+Duplicate keys, which ``load_yaml_as_xml`` resolves by keeping the last value, can't be taken
+back once written and raise it as well.  Telling them apart takes a set of the keys of every
+open mapping; with ``check_duplicates=False`` only the nesting depth is kept, and the element
+of a duplicate key is written once per occurrence (an attribute still takes the last value).
+'''
+
+import io
+
+import yaml as pyyaml
+
+from . import Exc, YAML_LOADER, XML_ILLEGAL_CHAR_RE, check_xml_name
+
+
+class StreamingNotSupported(Exc):
+    def __init__(self, fmt, *args):
+        super(StreamingNotSupported, self).__init__(fmt, *args)
+
+
+MERGE_TAG = 'tag:yaml.org,2002:merge'
+
+_COLLECTION_STARTS = (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)
+_COLLECTION_ENDS = (pyyaml.MappingEndEvent, pyyaml.SequenceEndEvent)
+
+
+class _Scalars(object):
+    '''
+    Resolves and constructs scalars exactly as ``loader`` would, and keeps track of anchors
+    '''
+
+    def __init__(self, loader):
+        self._loader = loader('')
+        self._anchors = {}
+
+    def construct(self, event):
+        if isinstance(event, pyyaml.AliasEvent):
+            if event.anchor not in self._anchors:
+                raise StreamingNotSupported(
+                    "alias *{} doesn't refer to a scalar or an attribute value", event.anchor)
+            return self._anchors[event.anchor]
+        tag = event.tag
+        if tag is None or '!' == tag:
+            tag = self._loader.resolve(pyyaml.ScalarNode, event.value, event.implicit)
+        if MERGE_TAG == tag:
+            raise StreamingNotSupported("merge key {!r}", event.value)
+        node = pyyaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+        value = (tag, self._loader.construct_document(node))
+        if event.anchor:
+            self._anchors[event.anchor] = value
+        return value
+
+    def construct_value(self, event, events):
+        '''
+        Build the Python object starting with ``event``, for attribute values
+        '''
+
+        if not isinstance(event, _COLLECTION_STARTS):
+            return self.construct(event)[1]
+        anchor = event.anchor
+        root = [] if isinstance(event, pyyaml.SequenceStartEvent) else {}
+        stack = [(root, None)]
+        for event in events:
+            container, key = stack[-1]
+            if isinstance(event, _COLLECTION_ENDS):
+                stack.pop()
+                if not stack:
+                    break
+                continue
+            if isinstance(container, dict) and key is None:
+                stack[-1] = (container, self.construct(event)[1])
+                continue
+            if isinstance(event, _COLLECTION_STARTS):
+                value = [] if isinstance(event, pyyaml.SequenceStartEvent) else {}
+            else:
+                value = self.construct(event)[1]
+            if isinstance(container, dict):
+                container[key] = value
+                stack[-1] = (container, None)
+            else:
+                container.append(value)
+            if isinstance(event, _COLLECTION_STARTS):
+                stack.append((value, None))
+        if anchor:
+            self._anchors[anchor] = (None, root)
+        return root
+
+
+class _Element(object):
+    __slots__ = ('tag', 'attrib', 'started', 'parent')
+
+    def __init__(self, tag, parent):
+        self.tag = tag
+        self.attrib = {}
+        self.started = False
+        self.parent = parent
+
+    def path(self):
+        tags = []
+        e = self
+        while e.parent is not None:
+            tags.append(e.tag)
+            e = e.parent
+        return '/' + ''.join('/' + t for t in reversed(tags))
+
+
+class _Frame(object):
+    __slots__ = ('element', 'is_mapping', 'owner', 'key', 'keys')
+
+    def __init__(self, element, is_mapping, owner, check_duplicates):
+        self.element = element
+        self.is_mapping = is_mapping
+        self.owner = owner
+        self.key = None
+        self.keys = set() if is_mapping and check_duplicates else None
+
+
+def _check_name(name, what, path):
+    if '{' == name[ :1]:
+        raise StreamingNotSupported("namespace URI in the {} name {!r} at {}", what, name, path)
+    assert check_xml_name(name), "YAML yields an invalid XML: illegal {} name {!r} at {}".format(
+        what, name, path)
+
+
+def _expect(events, cls, what):
+    event = next(events)
+    if not isinstance(event, cls):
+        raise StreamingNotSupported("expected {}, but got {}", what, event)
+    return event
+
+
+def _check_content(scalars, event, path):
+    '''
+    Make sure that ``event`` starts a mapping or a sequence we can stream as element content
+    '''
+
+    if isinstance(event, _COLLECTION_STARTS):
+        if event.anchor:
+            raise StreamingNotSupported("anchor &{} on a collection at {}", event.anchor, path)
+        return
+    tag, value = scalars.construct(event)
+    if None is tag:
+        raise StreamingNotSupported("alias *{} to a collection at {}", event.anchor, path)
+    raise Exception("unexpected structure at {}: {} (of type {})".format(
+        path, value, type(value)))
+
+
+def yaml_to_xml_events(source, attribute_prefix='_', loader=None,  # noqa: C901
+                       check_duplicates=True):
+    '''
+    Yield ``('start', tag, attrib)`` and ``('end', tag, None)`` for the XML equivalent of the
+    YAML ``source`` (a string or a stream) as ``load_yaml_as_xml`` would build it
+    '''
+
+    events = iter(pyyaml.parse(source, Loader=loader or YAML_LOADER))
+    scalars = _Scalars(loader or YAML_LOADER)
+    _expect(events, pyyaml.StreamStartEvent, 'a stream')
+    _expect(events, pyyaml.DocumentStartEvent, 'a document')
+    event = next(events)
+    assert isinstance(event, pyyaml.MappingStartEvent), \
+        "invalid YAML: the top-level datatype must be a mapping (got {})".format(event)
+    event = next(events)
+    assert not isinstance(event, pyyaml.MappingEndEvent), (
+        "invalid YAML: the top-level mapping must contain a single entry (got 0 entries)")
+
+    root = _Element(str(scalars.construct(event)[1]), None)
+    _check_name(root.tag, 'element', '/')
+    event = next(events)
+    _check_content(scalars, event, '/')
+    stack = [_Frame(root, isinstance(event, pyyaml.MappingStartEvent), True, check_duplicates)]
+
+    for event in events:
+        frame = stack[-1]
+        element = frame.element
+        if isinstance(event, _COLLECTION_ENDS):
+            stack.pop()
+            if frame.owner:
+                if not element.started:
+                    yield ('start', element.tag, element.attrib)
+                yield ('end', element.tag, None)
+            if not stack:
+                break
+            continue
+
+        if frame.is_mapping and frame.key is None:
+            if isinstance(event, _COLLECTION_STARTS):
+                raise StreamingNotSupported("complex mapping key at {}", element.path())
+            key = scalars.construct(event)[1]
+            if None is not frame.keys:
+                if key in frame.keys:
+                    raise StreamingNotSupported("duplicate key {!r} at {}", key, element.path())
+                frame.keys.add(key)
+            frame.key = key
+            continue
+
+        if not frame.is_mapping:
+            _check_content(scalars, event, element.path())
+            stack.append(_Frame(element, isinstance(event, pyyaml.MappingStartEvent), False,
+                                check_duplicates))
+            continue
+
+        key, frame.key = frame.key, None
+        if attribute_prefix == key[ :len(attribute_prefix)]:
+            if element.started:
+                raise StreamingNotSupported("attribute {!r} after child elements at {}",
+                                            key, element.path())
+            v = scalars.construct_value(event, events)
+            s = str(v)
+            if isinstance(v, bool):
+                s = s.lower()
+            name = key[len(attribute_prefix): ]
+            _check_name(name, 'attribute', element.path())
+            assert not XML_ILLEGAL_CHAR_RE.search(s), (
+                "YAML yields an invalid XML: illegal character in the attribute {!r} at {}".format(
+                    name, element.path()))
+            element.attrib[name] = s
+            continue
+
+        child = _Element(key, element)
+        _check_name(str(key), 'element', element.path())
+        _check_content(scalars, event, child.path())
+        if not element.started:
+            element.started = True
+            yield ('start', element.tag, element.attrib)
+        stack.append(_Frame(child, isinstance(event, pyyaml.MappingStartEvent), True,
+                            check_duplicates))
+
+    event = next(events)
+    assert isinstance(event, pyyaml.MappingEndEvent), (
+        "invalid YAML: the top-level mapping must contain a single entry "
+        "(got more than 1 entries)")
+    _expect(events, pyyaml.DocumentEndEvent, 'the end of the document')
+    _expect(events, pyyaml.StreamEndEvent, 'a single document')
+
+
+def escape_attrib(s):
+    '''
+    Escape an attribute value the same way as ``ET.tostring``
+
+    >>> escape_attrib('a<"&">\\n')
+    'a&lt;&quot;&amp;&quot;&gt;&#10;'
+    '''
+
+    if '&' in s:
+        s = s.replace('&', '&amp;')
+    if '<' in s:
+        s = s.replace('<', '&lt;')
+    if '>' in s:
+        s = s.replace('>', '&gt;')
+    if '"' in s:
+        s = s.replace('"', '&quot;')
+    if '\r' in s:
+        s = s.replace('\r', '&#13;')
+    if '\n' in s:
+        s = s.replace('\n', '&#10;')
+    if '\t' in s:
+        s = s.replace('\t', '&#09;')
+    return s
+
+
+def serialize_xml_events(events):
+    '''
+    Turn the output of :func:`yaml_to_xml_events` into pieces of XML text
+    '''
+
+    pending = None
+    for kind, tag, attrib in events:
+        if 'start' == kind:
+            if pending:
+                yield pending + '>'
+            pending = '<' + tag + ''.join(
+                ' {}="{}"'.format(k, escape_attrib(v)) for k, v in attrib.items())
+        elif pending:
+            yield pending + ' />'
+            pending = None
+        else:
+            yield '</' + tag + '>'
+
+
+def stream_yaml_as_xml(source, target, attribute_prefix='_', loader=None, check_duplicates=True):
+    '''
+    Convert the YAML ``source`` into XML, sending it to ``target`` as it's parsed
+
+    ``target`` is either a parser target like ``ET.TreeBuilder`` (``start()``, ``end()`` and
+    ``close()``, whose result is returned), a parser like ``ET.XMLPullParser`` (``feed()``) or a
+    text stream (``write()``).  See the module docstring for ``check_duplicates``.
+    '''
+
+    events = yaml_to_xml_events(source, attribute_prefix, loader, check_duplicates)
+    if hasattr(target, 'start'):
+        for kind, tag, attrib in events:
+            if 'start' == kind:
+                target.start(tag, attrib)
+            else:
+                target.end(tag)
+        return target.close() if hasattr(target, 'close') else None
+
+    write = target.feed if hasattr(target, 'feed') else target.write
+    for piece in serialize_xml_events(events):
+        write(piece)
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def dump_yaml_as_xml(source, out, attribute_prefix='_', loader=None, encoding='utf-8',
+                     xml_declaration=False, chunk_size=CHUNK_SIZE, check_duplicates=True):
+    '''
+    Convert the YAML ``source`` and write the XML to ``out`` in chunks of about ``chunk_size``
+    characters as it's produced, without holding the whole document in memory
+
+    ``out`` can be a text stream, a binary stream or a socket (``sendall()``); for the latter
+    two the output is encoded with ``encoding``, using character references where needed.
+    Names and characters are checked as in :func:`yaml_to_xml_events`, so nothing malformed
+    is written, but the chunks before a failing one may have been.
+    '''
+
+    if hasattr(out, 'sendall'):
+        binary, write = True, out.sendall
+    else:
+        binary, write = is_binary_stream(out), out.write
+
+    def flush(pieces):
+        chunk = ''.join(pieces)
+        write(chunk.encode(encoding, 'xmlcharrefreplace') if binary else chunk)
+
+    pieces = []
+    if xml_declaration:
+        pieces.append("<?xml version='1.0' encoding='{}'?>\n".format(encoding))
+    size = 0
+    events = yaml_to_xml_events(source, attribute_prefix, loader, check_duplicates)
+    for piece in serialize_xml_events(events):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            flush(pieces)
+            pieces = []
+            size = 0
+    if pieces:
+        flush(pieces)
+
+
+def is_binary_stream(out):
+    '''
+    >>> is_binary_stream(io.BytesIO())
+    True
+    >>> is_binary_stream(io.StringIO())
+    False
+    '''
+
+    if isinstance(out, io.TextIOBase):
+        return False
+    if isinstance(out, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return 'b' in getattr(out, 'mode', '')
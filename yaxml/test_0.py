@@ -1,7 +1,17 @@
+import io
+import asyncio
+import os
+import shutil
+import socket
+import threading
 import xml.etree.ElementTree as ET
 import xml.dom.minidom as dom
 from pprint import pprint as pp, pformat as pf  # noqa: F401
 from copy import deepcopy as dcp
+from xml.sax.saxutils import quoteattr
+
+import yaml
+import pytest
 
 import yaxml
 
@@ -21,6 +31,193 @@ def test_validate():
                           yaxml.relaxng_in_relaxng.DATA)
 
 
+ADDRESS_BOOK_RNG = '''
+<element name="addressBook" xmlns="http://relaxng.org/ns/structure/1.0"
+    datatypeLibrary="http://www.w3.org/2001/XMLSchema-datatypes">
+  <zeroOrMore>
+    <element name="card">
+      <attribute name="id"><data type="int"/></attribute>
+      <interleave>
+        <element name="name"><text/></element>
+        <optional><element name="email"><text/></element></optional>
+      </interleave>
+    </element>
+  </zeroOrMore>
+</element>
+'''
+
+
+def test_validate_backends():
+    docs = [
+        '<addressBook/>',
+        '<addressBook><card id="1"><name>x</name></card></addressBook>',
+        '<addressBook><card id="1"><email>e</email><name>x</name></card></addressBook>',
+        '<addressBook><card id="x"><name>x</name></card></addressBook>',
+        '<addressBook><card><name>x</name></card></addressBook>',
+        '<addressBook><card id="1"><email>e</email></card></addressBook>',
+        '<addressBook><card id="1"><name>x</name><name>y</name></card></addressBook>',
+        '<addressBook>text</addressBook>',
+        '<addressbook/>',
+        '<addressBook>',
+    ]
+    backends = ['python'] + (['lxml'] if yaxml.lxml_etree else [])
+    for doc in docs:
+        expected = yaxml.run_validator(doc, ADDRESS_BOOK_RNG, 'xmllint')[0]
+        for backend in backends:
+            rc, err = yaxml.run_validator(doc, ADDRESS_BOOK_RNG, backend)
+            assert expected == rc, (backend, doc, err)
+
+    for backend in ['python', 'xmllint']:
+        assert yaxml.validate(yaxml.relaxng_in_relaxng.DATA, yaxml.relaxng_in_relaxng.DATA,
+                              backend)
+        assert not yaxml.validate('<foo>', backend=backend)
+        assert yaxml.XMLLINT_BAD_SCHEMA == yaxml.run_validator(
+            '<foo/>', '<element xmlns="http://relaxng.org/ns/structure/1.0"><empty/></element>',
+            backend)[0]
+
+
+NAMESPACE_ERRORS = [
+    '<p:a/>', '<a p:x="1"/>', '<a xmlns:p=""/>', '<p:a xmlns:p=""/>', '<xmlns:a/>',
+    '<a xmlns:p="urn:u" xmlns:q="urn:u" p:x="1" q:x="2"/>', '<a xmlns:xml="urn:x"/>',
+    '<a xmlns:xmlns="urn:x"/>', '<a xmlns="relative"/>', '<p:a><b/></p:a>',
+    '<a b="1" b="2"/>', '<p:a>', '<p:a>' * 258 + '</p:a>' * 258, '<a><!--x--></a>',
+    '<a>' * 257 + '<!--x-->' + '</a>' * 257,
+]
+
+
+@pytest.mark.skipif(not shutil.which('xmllint'), reason='xmllint is not installed')
+def test_backends_match_xmllint_on_namespace_errors():
+    backends = ['python', 'auto'] + ([] if None is yaxml.lxml_etree else ['lxml'])
+    empty = '<element name="a" xmlns="http://relaxng.org/ns/structure/1.0"><empty/></element>'
+    for schema in [None, empty]:
+        for doc in NAMESPACE_ERRORS:
+            expected = yaxml.run_validator(doc, schema, 'xmllint')[0]
+            assert [expected] * len(backends) == [
+                yaxml.run_validator(doc, schema, b)[0] for b in backends ], (schema, doc)
+    assert yaxml.validate('<p:a/>')
+    assert '<p:a />' == ET.tostring(
+        yaxml.load_yaml_as_xml('p:a: {}', validate='full').getroot(), 'unicode')
+
+
+XSD_VALUES = {
+    'date': ['2020-02-29', '2019-02-29', '2020-13-45', '2020-04-31', '0000-01-01', '-0004-02-29',
+             '02020-01-01', '2020-01-01+14:00', '2020-01-01+14:01', '2020-01-01-13:59'],
+    'dateTime': ['2020-12-31T24:00:00', '2020-01-01T24:00:01', '2020-01-01T23:59:60',
+                 '2020-01-01T12:00:00.5Z', '2020-01-01T12:00:00+00:60'],
+    'time': ['24:00:00.000', '23:60:00', '00:00:00+13:60'],
+    'gYearMonth': ['2020-12', '2020-13', '0000-01'],
+    'gYear': ['2020', '-0000', '12020'],
+    'gMonthDay': ['--02-29', '--02-30', '--13-01'],
+    'gDay': ['---31', '---32', '---00'],
+    'gMonth': ['--12', '--00'],
+    'duration': ['P1Y', 'PT.5S', 'PT0.S', 'P1.S', 'PT', 'P'],
+    'anyURI': ['http://u@h:8/p?q#f', 'a b', '%41', '%4', 'a#b#c', '::', 'http://[x', '\\'],
+    'QName': ['a:b', 'c:b', 'xml:b', 'xmlns:b', 'b'],
+    'int': ['2147483648', '-2147483648', '+1'],
+    'boolean': ['1', 'TRUE'],
+}
+
+
+@pytest.mark.skipif(not shutil.which('xmllint'), reason='xmllint is not installed')
+def test_python_backend_matches_xmllint():
+    def check(schema, docs):
+        for doc in docs:
+            expected = yaxml.run_validator(doc, schema, 'xmllint')[0]
+            assert expected == yaxml.run_validator(doc, schema, 'python')[0], (schema, doc)
+
+    rng = '<element name="a" xmlns="http://relaxng.org/ns/structure/1.0" {}>{}</element>'
+    docs = ['<q:a xmlns:q="urn:q" q:x="1"/>', '<q:a xmlns:q="urn:q" x="1"/>',
+            '<a xmlns:q="urn:q" q:x="1"/>', '<a x="1"/>']
+    for ns, attribute in [
+            ('', '<attribute name="x" ns="urn:q"/>'),
+            ('ns="urn:q"', '<attribute name="x"/>'),
+            ('ns="urn:q"', '<attribute><name>x</name></attribute>'),
+            ('ns="urn:q"', '<attribute name="q:x" xmlns:q="urn:q"/>')]:
+        check(rng.format(ns, attribute), docs)
+
+    xsd = 'datatypeLibrary="http://www.w3.org/2001/XMLSchema-datatypes"'
+    for datatype, values in XSD_VALUES.items():
+        schema = rng.format(xsd, '<attribute name="v"><data type="{}"/></attribute>'.format(
+            datatype))
+        check(schema, [ '<a xmlns:c="urn:c" v={} />'.format(quoteattr(v)) for v in values ])
+
+    recursive = '''
+<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+  <start><ref name="a"/></start>
+  <define name="a"><element name="a"><optional><ref name="a"/></optional></element></define>
+</grammar>
+'''
+    deep = [ '<a>' * n + '</a>' * n for n in [yaxml.XMLLINT_DEPTH_MAX, 2000] ]
+    check(recursive, deep)
+    check(None, deep)
+
+    # the walk itself isn't limited by the depth
+    compiled = yaxml.relaxng.RelaxNG(recursive)
+    assert compiled.validate(ET.fromstring('<a>' * 5000 + '</a>' * 5000))[0]
+    assert not compiled.validate(ET.fromstring('<a>' * 5000 + '<b/>' + '</a>' * 5000))[0]
+
+    for datatype in ['ID', 'IDREF', 'ENTITY', 'NOTATION']:
+        try:
+            yaxml.relaxng.RelaxNG(rng.format(xsd, '<data type="{}"/>'.format(datatype)))
+            assert False
+        except yaxml.relaxng.RelaxNGNotSupported:
+            pass
+
+
+def test_schema_cache(tmp_path):
+    cache = yaxml.schema_cache
+    cache.clear()
+    for backend in ['python', 'xmllint']:
+        assert yaxml.validate('<addressBook/>', ADDRESS_BOOK_RNG, backend)
+        assert yaxml.validate('<addressBook/>', ADDRESS_BOOK_RNG, backend)
+    assert (2, 2, 2) == cache.info()[ :2] + (cache.info().currsize, )
+
+    path = tmp_path / 'a.rng'
+    path.write_text(ADDRESS_BOOK_RNG)
+    assert yaxml.validate('<addressBook/>', str(path), 'python')
+    assert yaxml.validate('<addressBook/>', str(path), 'python')
+    assert (3, 3) == cache.info()[ :2]
+    path.write_text(ADDRESS_BOOK_RNG.replace('addressBook', 'book'))
+    os.utime(str(path), ns=(0, 0))
+    assert not yaxml.validate('<addressBook/>', str(path), 'python')
+    assert (3, 4) == cache.info()[ :2]
+
+    cache.maxsize = 1
+    assert yaxml.validate('<addressBook/>', ADDRESS_BOOK_RNG + ' ', 'python')
+    assert 1 == cache.info().currsize
+    cache.maxsize = 64
+
+
+def test_validate_many(tmp_path):
+    path = tmp_path / 'card.xml'
+    path.write_text('<addressBook><card id="1"><name>x</name></card></addressBook>')
+    docs = [
+        '<addressBook/>',
+        '<addressBook>',
+        str(path),
+        '<addressBook><card id="x"><name>x</name></card></addressBook>',
+        str(path),
+        '<addressbook/>',
+    ]
+    expected = [ yaxml.run_validator(d, ADDRESS_BOOK_RNG, 'xmllint')[0] for d in docs ]
+    assert [0, 4, 0, 3, 0, 3] == expected
+    for backend in ['python', 'xmllint']:
+        results = yaxml.validate_many(docs, ADDRESS_BOOK_RNG, backend)
+        assert expected == [ rc for rc, _ in results ]
+        assert all(bool(rc) == bool(err) for rc, err in results), results
+
+    assert [0, 4] == [ rc for rc, _ in yaxml.validate_many(docs[ :2], backend='xmllint') ]
+
+    # namespace errors and warnings don't make a document fail, nor does a missing file pass
+    docs = ['<a:b/>', '<a xmlns="relative"/>', '<a b="1" b="2"/>', '<a/>',
+            str(tmp_path / 'missing.xml')]
+    for schema in [None, '<element name="a" xmlns="http://relaxng.org/ns/structure/1.0">'
+                         '<empty/></element>']:
+        expected = [ yaxml.run_validator(d, schema, 'xmllint')[0] for d in docs ]
+        assert expected == [ rc for rc, _ in yaxml.validate_many(docs, schema, 'xmllint') ]
+    assert [0, 0, 4, 0, 4] == [ rc for rc, _ in yaxml.validate_many(docs, backend='xmllint') ]
+
+
 def test_load_yaml_as_xml():
     xml = yaxml.load_yaml_as_xml('''
 Root:
@@ -34,6 +231,14 @@ Root:
             xml.getroot(), 'unicode'))
 
 
+def test_load_yaml_as_xml_loaders():
+    source = 'Root:\n    Foo:\n        - Bar: {_a: on}\n        - Bar: {_a: 0x10}\n'
+    expected = '<Root><Foo><Bar a="true" /><Bar a="16" /></Foo></Root>'
+    for loader in [None, yaml.SafeLoader, getattr(yaml, 'CSafeLoader', yaml.SafeLoader)]:
+        xml = yaxml.load_yaml_as_xml(source, loader=loader)
+        assert expected == ET.tostring(xml.getroot(), 'unicode')
+
+
 SIMPLE = '''
 schema:
     addressBook: true
@@ -749,3 +954,849 @@ schema:
             'element': 'text'
         }
     } == more
+
+
+def test_merge_rngyamls_siblings():
+    def schema(names, attr):
+        return yaxml.load_rngyaml('schema:\n    r:\n' + ''.join(
+            '        e{}:\n            _{}: true\n'.format(n, attr) for n in names), False)
+
+    y0 = schema(range(0, 2000), 'a')
+    yaxml.merge_rngyamls(y0, schema(range(1000, 3000), 'b'))
+    siblings = y0['child']['child']
+    assert 3000 == len(siblings)
+    assert ['a', 'b'] == [ c['name'] for c in siblings[1500]['child'] ]
+    assert 'b' == siblings[2500]['child']['name']
+
+    try:
+        yaxml.merge_rngyamls(y0, schema([1500], 'a'))
+        assert False
+    except AssertionError as e:
+        assert str(e).startswith("/child/e1500: ")
+
+    y1 = schema([1, 2], 'c')
+    yaxml.merge_rngyamls(y0, y1, yaxml.OVERWRITE_QUIET)
+    assert y1['child']['child'][0] == y0['child']['child'][1]
+
+
+def test_merged_rngyamls():
+    base = yaxml.load_rngyaml('schema:\n    r:\n' + ''.join(
+        '        e{}:\n            _a: true\n'.format(i) for i in range(1000)), False)
+    base0 = dcp(base)
+    overlay = yaxml.load_rngyaml('''
+schema:
+    r:
+        e5:
+            _b: true
+        new:
+            _c: true
+    ''', False)
+
+    merged = yaxml.merged_rngyamls(base, overlay)
+    assert base0 == base
+    assert dcp(merged) == yaxml.merge_rngyamls(dcp(base), overlay)
+
+    siblings, merged_siblings = base['child']['child'], merged['child']['child']
+    assert 1001 == len(merged_siblings)
+    assert ['a', 'b'] == [ c['name'] for c in merged_siblings[5]['child'] ]
+    assert siblings[5]['child'] is merged_siblings[5]['child'][0]
+    assert all(b is m for b, m in zip(siblings[6: ], merged_siblings[6: ]))
+    assert overlay['child']['child'][1] is merged_siblings[-1]
+
+    again = yaxml.merged_rngyamls(merged, overlay, yaxml.OVERWRITE_QUIET)
+    assert overlay['child']['child'][0] is again['child']['child'][5]
+
+    # modifying a list in place drops the index it keeps, so later merges see the change
+    merged_siblings.reverse()
+    again = yaxml.merged_rngyamls(merged, overlay, yaxml.OVERWRITE_QUIET)
+    assert ['new'] + [ 'e{}'.format(i) for i in range(999, -1, -1) ] == \
+        [ c['name'] for c in again['child']['child'] ]
+    assert overlay['child']['child'][0] is again['child']['child'][-6]
+
+    # a pattern renamed in place is seen once a merge looks its old name up
+    assert 'e997' == again['child']['child'][3]['name']
+    again['child']['child'][3]['name'] = 'renamed'
+    merged = yaxml.merged_rngyamls(again, yaxml.load_rngyaml(
+        'schema:\n    r:\n        e997: {_z: true}\n        renamed: {_z: true}\n', False),
+        yaxml.OVERWRITE_QUIET)
+    siblings = merged['child']['child']
+    assert 1002 == len(siblings)
+    assert [('renamed', 'z'), ('e997', 'z')] == [
+        (c['name'], c['child']['name']) for c in (siblings[3], siblings[-1]) ]
+
+
+def test_merged_rngyamls_scaling(monkeypatch):
+    overlay = yaxml.load_rngyaml('schema:\n    r:\n' + ''.join(
+        '        e{}:\n            _b: true\n'.format(i) for i in range(0, 20, 2)), False)
+    keys = []
+    for patterns in [yaxml._DictPatterns, yaxml.pattern.NodePatterns]:
+        key = patterns.key
+        monkeypatch.setattr(patterns, 'key', staticmethod(lambda e, key=key: keys.append(e) or
+                                                          key(e)))
+
+    for to in [lambda p: p, yaxml.to_nodes]:
+        counts = []
+        for size in [100, 10000]:
+            base = to(yaxml.load_rngyaml('schema:\n    r:\n' + ''.join(
+                '        e{}:\n            _a: true\n'.format(i) for i in range(size)), False))
+            yaxml.merged_rngyamls(base, to(overlay))
+            del keys[:]
+            merged = yaxml.merged_rngyamls(base, to(overlay))
+            merged = yaxml.merged_rngyamls(merged, to(overlay), yaxml.OVERWRITE_QUIET)
+            counts.append(len(keys))
+        # the base is indexed by the first merge, and the rest only look the overlay up
+        assert counts[0] == counts[1] < 100, counts
+
+
+def test_pattern_nodes():
+    y0 = yaxml.load_rngyaml(ZERO_OR_MORE)
+    n0 = yaxml.to_nodes(y0)
+    assert isinstance(n0, yaxml.Node) and yaxml.pattern.ELEMENT is n0.element
+    assert y0 == yaxml.to_dicts(n0)
+    assert ET.tostring(yaxml.compile_rngyaml_to_rng(y0)) == \
+        ET.tostring(yaxml.compile_rngyaml_to_rng(n0))
+
+    y1 = yaxml.load_rngyaml('''
+schema:
+    r:
+        a*:
+            p: true
+        c:
+            _x: true
+    ''')
+    merged = yaxml.merged_rngyamls(n0, y1)
+    assert yaxml.merged_rngyamls(y0, y1) == yaxml.to_dicts(merged)
+    a0, b0 = n0.child.child
+    assert b0 is merged.child.child[1]
+    assert yaxml.to_dicts(n0) == y0
+
+    try:
+        yaxml.merged_rngyamls(merged, yaxml.to_nodes(y1))
+        assert False
+    except AssertionError as e:
+        assert "have a common attr 'x'" in str(e)
+
+
+def test_deep_documents():
+    depth = 3000
+    nested = '{{e{}: ' * depth + '{{_x: 1, _y: 1}}' + '}}' * depth
+    nested = nested.format(*range(depth))
+
+    e = yaxml.load_yaml_as_xml('r: ' + nested).getroot()
+    for i in range(depth):
+        e, = e
+        assert 'e{}'.format(i) == e.tag
+    assert {'x': '1', 'y': '1'} == e.attrib
+
+    y0 = yaxml.load_rngyaml('schema:\n    r: ' + nested, False)
+    nested = nested.replace('_x', '_z').replace('_y', '_w')
+    y1 = yaxml.load_rngyaml('schema:\n    r: ' + nested, False)
+    merged = yaxml.merged_rngyamls(y0, y1)
+    for m in [merged, yaxml.merged_rngyamls(yaxml.to_nodes(y0), y1)]:
+        e = yaxml.compile_rngyaml_to_rng(m)
+        for i in range(depth):
+            e, = e
+        assert ['x', 'y', 'z', 'w'] == [ a.get('name') for a in e ]
+
+    try:
+        yaxml.merged_rngyamls(merged, y1)
+        assert False
+    except AssertionError as e:
+        assert str(e).startswith('/child/child/child/')
+
+
+def test_rngyaml_validator():
+    schema = '''
+schema:
+    r:
+        a*:
+            _x: true
+            _y?: false
+        b?: false
+        c: 3
+'''
+    v = yaxml.RngYamlValidator(schema)
+    assert [('//r/c', '3')] == v.extra_checks
+
+    documents = [
+        {'r': {'c': {}}},
+        {'r': [{'a': {'_x': 1}}, {'c': {}}, {'a': {'_x': 'x', '_y': ' '}}]},
+        {'r': {'b': {}, 'c': [], 'a': {'_x': True}}},
+        {'r': {}},
+        {'r': {'c': {}, 'd': {}}},
+        {'r': {'c': {}, 'a': {'_y': ''}}},
+        {'r': {'c': {}, 'a': {'_x': 1, '_y': 'y'}}},
+        {'r': {'c': {'_z': 0}}},
+        {'r': {'c': 'text'}},
+        {'s': {'c': {}}},
+        {'r': {'c': {}}, 's': {}},
+    ]
+    rng = yaxml.relaxng.RelaxNG(yaxml.compile_rngyaml_to_rng(yaxml.load_rngyaml(schema)))
+    for doc in documents:
+        ok, err = v.validate(doc)
+        try:
+            expected = rng.validate(yaxml.load_yaml_as_xml(yaml.safe_dump(doc)))[0]
+        except Exception:
+            expected = False
+        assert expected == ok, doc
+        assert ok or err.startswith('/'), err
+
+    assert (False, '/r/a: attribute x is missing') == v.validate({'r': {'c': {}, 'a': {}}})
+    assert v.is_valid({'r': {'c': {}}})
+    assert yaxml.RngYamlValidator(yaxml.load_rngyaml(schema)).is_valid({'r': {'c': {}}})
+
+
+def test_rngyaml_matcher():
+    schema = '''
+schema:
+    r:
+        a*:
+            _x: true
+            _y?: false
+        b?: false
+        c: 3
+'''
+    m = yaxml.RngYamlMatcher(schema)
+    v = yaxml.RngYamlValidator(schema)
+    assert [('//r/c', '3')] == m.extra_checks
+    assert 0 < m.state_count()
+    for doc in [
+        {'r': {'c': {}}},
+        {'r': [{'a': {'_x': 1}}, {'c': {}}, {'a': {'_x': 'x', '_y': ' '}}]},
+        {'r': {'b': {}, 'c': [], 'a': {'_x': True}}},
+        {'r': {}},
+        {'r': {'c': {}, 'd': {}}},
+        {'r': {'c': {}, 'a': {'_y': ''}}},
+        {'r': {'c': {'_z': 0}}},
+        {'r': {'c': 'text'}},
+        {'s': {'c': {}}},
+    ]:
+        assert v.is_valid(doc) == m.is_valid(doc), doc
+    assert (False, '/r: unexpected element d') == m.validate({'r': {'c': {}, 'd': {}}})
+    assert (False, '/r/a: attribute x is missing') == m.validate({'r': {'c': {}, 'a': {}}})
+
+    # the first a may match either element pattern
+    m = yaxml.RngYamlMatcher('schema: {r: [{a?: {_x?: true}}, {a*: {_y?: true}}]}', eager_states=0)
+    assert 0 == m.state_count()
+    assert m.is_valid({'r': [{'a': {}}]})
+    assert m.is_valid({'r': [{'a': {'_x': 1}}, {'a': {}}, {'a': {'_y': 1}}]})
+    assert not m.is_valid({'r': [{'a': {'_y': 1}}, {'a': {'_x': 1}}]})
+    assert 0 < m.state_count()
+
+
+def test_value_checks():
+    schema = '''
+schema:
+    Root:
+        Port*:
+            _number: 're:[0-9]+'
+        Mode?:
+            _kind: fast
+            _debug?: true
+        Ask?:
+            _q: What?
+        Note?: hello
+'''
+    assert [('//Root/Port/@number', 're:[0-9]+'), ('//Root/Mode/@kind', 'fast'),
+            ('//Root/Ask/@q', 'What?'), ('//Root/Note', 'hello')] == \
+        yaxml.parse_rngyaml(schema)[1]
+    checks = yaxml.compile_value_checks(schema)
+    assert checks is yaxml.compile_value_checks(schema)
+    assert 'fast' == checks.children['Root'].children['Mode'].attributes['kind'][0]
+
+    xml = yaxml.load_yaml_as_xml(
+        'Root: [{Port: {_number: 80}}, {Port: {_number: 8080}}, {Mode: {_kind: fast}}]',
+        checks=schema)
+    assert None is checks.check_tree(xml.getroot())
+
+    # the items of a list merge into one element, which is checked once they all are
+    for doc in [
+        'Root: {Mode: [{_kind: slow}, {_kind: fast}]}',
+        'Root: {Ask: {_q: What?}}',
+    ]:
+        xml = yaxml.load_yaml_as_xml(doc, checks=checks)
+        assert None is checks.check_tree(xml.getroot())
+
+    for doc, err in [
+        ('Root: [{Port: {_number: 80}}, {Port: {_number: 8x}}]',
+         "/Root/Port: attribute number='8x' doesn't match 're:[0-9]+'"),
+        ('Root: {Mode: {_kind: slow, _debug: true}}',
+         "/Root/Mode: attribute kind='slow' doesn't match 'fast'"),
+        ('Root: {Mode: [{_kind: fast}, {_kind: slow}]}',
+         "/Root/Mode: attribute kind='slow' doesn't match 'fast'"),
+        ('Root: {Ask: {_q: Why?}}',
+         "/Root/Ask: attribute q='Why?' doesn't match 'What?'"),
+        ('Root: {Ask: {_q: W}}',
+         "/Root/Ask: attribute q='W' doesn't match 'What?'"),
+    ]:
+        try:
+            yaxml.load_yaml_as_xml(doc, checks=checks)
+            assert False, doc
+        except AssertionError as e:
+            assert str(e).endswith(err), e
+        assert err == checks.check_tree(yaxml.load_yaml_as_xml(doc).getroot())
+    assert "/Root/Note: text 'bye' doesn't match 'hello'" == checks.check_tree(
+        ET.fromstring('<Root><Note>bye</Note></Root>'))
+
+    try:
+        yaxml.compile_value_checks('schema: {Root: {_x: "re:[0-9"}}')
+        assert False
+    except Exception as e:
+        assert str(e).startswith("invalid regular expression 're:[0-9'"), e
+
+
+def test_dump_xml_as_yaml(tmp_path):
+    xml = (
+        '<Root version="2" name="null">'
+        '<Service enabled="true" port="8080" id="01" note="a: b&#10;c" />'
+        '<Service enabled="false"><Endpoint host="h" /><Endpoint host="yes" /></Service>'
+        '<true />'
+        '</Root>')
+    y = yaxml.dump_xml_as_yaml(xml)
+    assert xml == ET.tostring(yaxml.load_yaml_as_xml(y).getroot(), 'unicode')
+    assert {'_version': 2, '_name': 'null'} == yaml.safe_load(y)['Root'][0]
+    assert {'_enabled': True, '_port': 8080, '_id': '01', '_note': 'a: b\nc'} == \
+        yaml.safe_load(y)['Root'][1]['Service']
+
+    # from a pretty-printed file, with another prefix, to a binary stream
+    path = tmp_path / 'a.xml'
+    tree = ET.ElementTree(ET.fromstring(xml))
+    ET.indent(tree)
+    tree.write(str(path))
+    out = io.BytesIO()
+    yaxml.dump_xml_as_yaml(str(path), out, attribute_prefix='@')
+    assert xml == ET.tostring(yaxml.load_yaml_as_xml(
+        out.getvalue().decode('utf-8'), attribute_prefix='@').getroot(), 'unicode')
+
+    for bad in ['<r>text<a /></r>', '<r><a />text</r>', '<r><_a /></r>']:
+        try:
+            yaxml.dump_xml_as_yaml(bad)
+            assert False, bad
+        except yaxml.reverse.NotRepresentable:
+            pass
+
+
+def test_convert_tree(tmp_path):
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'a.yaml').write_text('Root:\n    Foo:\n        _x: 1\n')
+    (src / 'sub' / 'b.yml').write_text('Root:\n    Bar: {}\n')
+    (src / 'ignored.txt').write_text('Root: {}\n')
+    schema = 'schema:\n    Root:\n        Foo?:\n            _x: true\n'
+
+    for workers in [1, 2]:
+        results = sorted(yaxml.convert_tree(str(src), str(dst), workers=workers))
+        assert [str(dst / 'a.xml'), str(dst / 'sub' / 'b.xml')] == [ r.dst for r in results ]
+        assert [1 == workers] * 2 == [ r.changed for r in results ]
+        assert [None, None] == [ r.error for r in results ]
+    assert b'<Root><Foo x="1" /></Root>' == (dst / 'a.xml').read_bytes()
+
+    results = sorted(yaxml.convert_tree(str(src), str(dst), schema, workers=1))
+    assert [False, False] == [ r.changed for r in results ]
+    assert None is results[0].error
+    assert results[1].error
+    assert ['a.xml', 'sub'] == sorted(os.listdir(str(dst)))
+    assert 0o666 & ~yaxml.tree._UMASK == (dst / 'a.xml').stat().st_mode & 0o777
+
+    # more files than the jobs kept in flight
+    many = tmp_path / 'many'
+    many.mkdir()
+    for i in range(20):
+        (many / 'f{:02}.yaml'.format(i)).write_text('R{}: {{}}\n'.format(i))
+    results = sorted(yaxml.convert_tree(str(many), str(tmp_path / 'out'), workers=2))
+    assert [ str(tmp_path / 'out' / 'f{:02}.xml'.format(i)) for i in range(20) ] == [
+        r.dst for r in results ]
+    assert b'<R19 />' == (tmp_path / 'out' / 'f19.xml').read_bytes()
+
+    (src / 'a.yml').write_text('Other: {}\n')
+    for workers in [1, 2]:
+        with pytest.raises(yaxml.tree.OutputCollision) as e:
+            list(yaxml.convert_tree(str(src), str(dst), workers=workers))
+        assert str(dst / 'a.xml') == e.value.dst
+        assert [str(src / 'a.yaml'), str(src / 'a.yml')] == e.value.srcs
+    assert b'<Root><Foo x="1" /></Root>' == (dst / 'a.xml').read_bytes()
+
+
+def test_iter_yaml_as_xml():
+    source = '''
+Log:
+    Sink: {_host: a, _port: 514}
+---
+Log:
+    Sink: {_host: b}
+---
+'''
+    trees = yaxml.iter_yaml_as_xml(io.StringIO(source))
+    assert not isinstance(trees, list)
+    assert ['a', 'b'] == [ t.getroot().find('Sink').get('host') for t in trees ]
+    assert [b'<Log><Sink host="a" port="514" /></Log>', b'<Log><Sink host="b" /></Log>'] == \
+        list(yaxml.iter_yaml_as_xml(source, serialize=True))
+
+    documents = yaxml.iter_yaml_as_xml('A: {}\n---\n[]\n')
+    assert b'<A />' == ET.tostring(next(documents).getroot())
+    try:
+        next(documents)
+        assert False
+    except AssertionError as e:
+        assert 'document #1' in str(e)
+
+    y = {'A': {'_x': True}}
+    assert b'<A x="true" />' == ET.tostring(yaxml.yaml_object_as_xml(y).getroot())
+    assert {'A': {'_x': True}} == y
+
+
+def test_load_yaml_as_xml_sources(tmp_path):
+    import mmap
+    path = tmp_path / 'a.yaml'
+    path.write_bytes('Root:\n    A: {_x: \u00e9}\n'.encode('utf-8'))
+    expected = '<Root><A x="\u00e9" /></Root>'
+
+    def convert(source):
+        return ET.tostring(yaxml.load_yaml_as_xml(source).getroot(), 'unicode')
+
+    assert expected == convert(str(path))
+    assert expected == convert(path.read_bytes())
+    with open(str(path)) as fp:
+        assert expected == convert(fp)
+    with open(str(path), 'rb') as fp:
+        assert expected == convert(fp)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            assert expected == convert(m)
+    assert [expected.encode('utf-8')] == list(yaxml.iter_yaml_as_xml(str(path), serialize=True))
+
+    try:
+        yaxml.load_yaml_as_xml(io.StringIO('[]'))
+        assert False
+    except AssertionError as e:
+        assert "'<StringIO>'" in str(e)
+
+
+def test_is_filepath(tmp_path, monkeypatch):
+    path = tmp_path / 'a.yaml'
+    path.write_text('Root: {}\n')
+    probes = []
+    exists = os.path.exists
+    monkeypatch.setattr(os.path, 'exists', lambda s: probes.append(s) or exists(s))
+
+    inline = 'Root: {A: {_x: 1}}'
+    for _ in range(3):
+        assert yaxml.is_filepath(str(path))
+        assert not yaxml.is_filepath(inline)
+        assert not yaxml.is_filepath('<Root><A x="1" /></Root>')
+        assert not yaxml.is_filepath('Root:\n    A: {}\n')
+    assert [str(path), inline] * 3 == probes
+
+    del probes[:]
+    assert not yaxml.is_filepath(yaxml.Text(str(path)))
+    assert yaxml.is_filepath(yaxml.Path(str(tmp_path / 'later.yaml')))
+    assert [] == probes
+
+    # the filesystem isn't cached: files created or removed later are seen as such
+    later = tmp_path / 'later.yaml'
+    assert not yaxml.is_filepath(str(later))
+    later.write_text('Root: {}\n')
+    assert yaxml.is_filepath(str(later))
+    later.unlink()
+    assert not yaxml.is_filepath(str(later))
+    assert b'<Root />' == ET.tostring(yaxml.load_yaml_as_xml(yaxml.Path(str(path))).getroot())
+    assert b'<x />' == ET.tostring(yaxml.load_yaml_as_xml(yaxml.Text('x: {}')).getroot())
+
+
+def test_cli(tmp_path, capsys, monkeypatch):
+    from yaxml.__main__ import main
+    schema = tmp_path / 'schema.yaml'
+    schema.write_text('schema:\n    Root:\n        Foo?:\n            _x: "re:[0-9]+"\n')
+    (tmp_path / 'a.yaml').write_text('Root:\n    Foo:\n        _x: 1\n')
+    (tmp_path / 'b.yaml').write_text('Root:\n    Bar: {}\n')
+    (tmp_path / 'c.yaml').write_text('Root:\n    Foo:\n        _x: y\n')
+    a, b, c = [ str(tmp_path / n) for n in ['a.yaml', 'b.yaml', 'c.yaml'] ]
+
+    monkeypatch.setattr('sys.stdin', io.StringIO('Root: {A: {_b: 1}}\n'))
+    assert 0 == main(['convert'])
+    assert '<Root><A b="1" /></Root>\n' == capsys.readouterr().out
+
+    assert 0 == main(['convert', a, b])
+    assert '<Root><Foo x="1" /></Root>\n<Root><Bar /></Root>\n' == capsys.readouterr().out
+
+    assert 1 == main(['validate', '-s', str(schema), a, b, c])
+    err = capsys.readouterr().err.splitlines()
+    assert [b, c] == [ e.split(': ')[0] for e in err ]
+    assert "x='y' doesn't match" in err[1]
+
+    assert 1 == main(['convert', '-s', str(schema), '-d', str(tmp_path / 'out'), a, b])
+    assert str(tmp_path / 'out' / 'a.xml') + '\n' == capsys.readouterr().out
+    assert not (tmp_path / 'out' / 'b.xml').exists()
+
+    monkeypatch.setattr('sys.stdin', io.StringIO('A: {}\n---\nB: {}\n'))
+    assert 0 == main(['convert', '-d', str(tmp_path / 'multi')])
+    assert ['stdin-1.xml', 'stdin.xml'] == sorted(os.listdir(str(tmp_path / 'multi')))
+    capsys.readouterr()
+
+    # inputs are read as bytes, whatever the locale's encoding, and their own is detected
+    (tmp_path / 'u8.yaml').write_bytes('Root: {\u00c4: {_b: \u00fc}}\n'.encode('utf-8'))
+    (tmp_path / 'u16.yaml').write_bytes('Root: {\u00c4: {_b: \u00fc}}\n'.encode('utf-16'))
+    monkeypatch.setattr('sys.stdin', io.TextIOWrapper(
+        io.BytesIO('Root: {\u00c4: {}}\n'.encode('utf-8')), encoding='ascii'))
+    assert 0 == main(['convert', str(tmp_path / 'u8.yaml'), str(tmp_path / 'u16.yaml'), '-'])
+    assert ['<Root><\u00c4 b="\u00fc" /></Root>'] * 2 + ['<Root><\u00c4 /></Root>'] == \
+        capsys.readouterr().out.splitlines()
+
+    # outputs are never written twice, whichever way the names collide
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'a.yaml').write_text('Other: {}\n')
+    (tmp_path / 'm.yaml').write_text('A: {}\n---\nB: {}\n')
+    (tmp_path / 'm-1.yaml').write_text('Other: {}\n')
+    sub_a, m, m_1 = [ str(tmp_path / n) for n in ['sub/a.yaml', 'm.yaml', 'm-1.yaml'] ]
+    out = tmp_path / 'collide'
+    assert 1 == main(['convert', '-d', str(out), a, sub_a, m, m_1])
+    outerr = capsys.readouterr()
+    assert [ str(out / n) for n in ['a.xml', 'm.xml', 'm-1.xml'] ] == outerr.out.splitlines()
+    assert [sub_a, m_1] == [ e.split(': ')[0] for e in outerr.err.splitlines() ]
+    assert 'written for document 2 of ' + m in outerr.err
+    assert ['Root', 'A', 'B'] == [
+        ET.parse(str(out / n)).getroot().tag for n in ['a.xml', 'm.xml', 'm-1.xml'] ]
+
+    assert 0 == main(['compile-schema', str(schema)])
+    assert capsys.readouterr().out.startswith('<element name="Root"')
+    assert 2 == main(['validate', '-s', str(tmp_path / 'missing.yaml'), a])
+
+
+def test_tree_watcher(tmp_path):
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'a.yaml').write_text('Root:\n    Foo:\n        _x: 1\n')
+    (src / 'sub' / 'b.yml').write_text('Root:\n    Bar: {}\n')
+    schema = tmp_path / 'schema.yaml'
+    schema.write_text('schema:\n    Root:\n        Foo?:\n            _x: true\n')
+
+    def dsts(results):
+        return sorted(os.path.relpath(r.dst, str(dst)) for r in results)
+
+    w = yaxml.TreeWatcher(str(src), str(dst), str(schema))
+    results = w.scan()
+    assert ['a.xml', os.path.join('sub', 'b.xml')] == dsts(results)
+    assert [None, 'b.yml'] == [ r.error and os.path.basename(r.src) for r in sorted(results) ]
+    assert [] == w.scan()
+
+    # touched but not changed: hashed and skipped
+    os.utime(str(src / 'a.yaml'), ns=(0, 0))
+    assert [] == w.scan()
+    (src / 'sub' / 'b.yml').write_text('Root: {}\n')
+    assert [(os.path.join('sub', 'b.xml'), True, None)] == [
+        (os.path.relpath(r.dst, str(dst)), r.changed, r.error) for r in w.scan() ]
+
+    # a new watcher picks the manifest up
+    w = yaxml.TreeWatcher(str(src), str(dst), str(schema))
+    assert [] == w.scan()
+
+    text = 'schema:\n    Root:\n        Foo?:\n            _x: \'re:[0-9]\'\n'
+    schema.write_text(text)
+    assert ['a.xml', os.path.join('sub', 'b.xml')] == dsts(w.scan())
+    schema.write_text('schema: [')
+    assert [str(schema)] == [ r.src for r in w.scan() if r.error ]
+    assert [] == w.scan()
+    schema.write_text(text)
+    assert [] == w.scan()
+
+    # colliding outputs hold everything back until one of them goes
+    (src / 'a.yml').write_text('Root: {}\n')
+    results = w.scan()
+    assert [('a.xml', 'a.yaml'), ('a.xml', 'a.yml')] == [
+        (os.path.basename(r.dst), os.path.basename(r.src)) for r in results ]
+    assert all( r.error for r in results )
+    (src / 'a.yml').unlink()
+    assert [] == w.scan()
+
+    (src / 'a.yaml').unlink()
+    assert ['a.xml'] == dsts(w.scan())
+    assert not (dst / 'a.xml').exists()
+
+    stop = threading.Event()
+    stop.set()
+    assert [] == list(yaxml.watch_tree(str(src), str(dst), str(schema), stop=stop))
+
+
+def test_validator_pool_across_fork(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for i in range(40):
+        (src / 'f{:02}.yaml'.format(i)).write_text(
+            'Root:\n    {}: {{_x: 1}}\n'.format('Bad' if i % 3 else 'Foo'))
+    schema = 'schema:\n    Root:\n        Foo?:\n            _x: true\n'
+    yaxml.pool.configure(2, 'python')
+    try:
+        # the parent's pool is busy while the tree workers start
+        assert 0 == yaxml.run_validator('<a/>')[0]
+        results = sorted(yaxml.convert_tree(str(src), str(tmp_path / 'dst'), schema, workers=4))
+        assert [ bool(i % 3) for i in range(40) ] == [ bool(r.error) for r in results ]
+        assert sorted( 'f{:02}.xml'.format(i) for i in range(0, 40, 3) ) == sorted(
+            os.listdir(str(tmp_path / 'dst')))
+        assert [0, 3] == [ yaxml.run_validator(d, ADDRESS_BOOK_RNG)[0] for d in [
+            '<addressBook/>', '<addressBook><card/></addressBook>'] ]
+
+        # files are validated in process, in the tree workers as well as here
+        rng = yaxml.tree.compile_schema(schema)
+        yaxml.pool.configure(2, 'python')
+        assert [False, True] == [ bool(r.error) for r in [
+            yaxml.tree.convert_file(str(src / n), str(tmp_path / 'one.xml'), rng)
+            for n in ['f00.yaml', 'f01.yaml'] ] ]
+        assert None is yaxml.pool._pool
+    finally:
+        yaxml.pool.shutdown()
+
+
+def test_stream_yaml_as_xml():
+    source = '''
+Root:
+    _a: "x<&\\"y\\n"
+    _b: [1, {c: 2}]
+    _c: &s 0x1f
+    _d: *s
+    List:
+        - {_x: 1}
+        - E: {}
+        - E: {_y: no}
+        - [ {F: {}}, {G: []} ]
+    Empty: {}
+'''
+    expected = ET.tostring(yaxml.load_yaml_as_xml(source).getroot(), 'unicode')
+
+    out = io.StringIO()
+    yaxml.stream_yaml_as_xml(source, out)
+    assert expected == out.getvalue()
+
+    root = yaxml.stream_yaml_as_xml(source, ET.TreeBuilder())
+    assert expected == ET.tostring(root, 'unicode')
+
+    parser = ET.XMLPullParser(['end'])
+    yaxml.stream_yaml_as_xml(io.StringIO(source), parser)
+    assert ['E', 'E', 'F', 'G', 'List', 'Empty', 'Root'] == [
+        e.tag for _, e in parser.read_events()]
+
+    dup = 'Root:\n    _x: 1\n    _x: 2\n    A: {}\n    A: {_y: 3}\n'
+    for source in ['Root:\n    A: {}\n    _x: 1\n', 'Root:\n    A: &x {}\n', dup]:
+        try:
+            yaxml.stream_yaml_as_xml(source, io.StringIO())
+            assert False, source
+        except yaxml.stream.StreamingNotSupported:
+            pass
+
+    for source in ['"1a": {}', 'a: {"b c": {}}', 'a: {_x: "\\x01"}', 'a: {"_b c": 1}']:
+        with pytest.raises(AssertionError):
+            yaxml.load_yaml_as_xml(source)
+        with pytest.raises(AssertionError):
+            yaxml.stream_yaml_as_xml(source, io.StringIO())
+    with pytest.raises(yaxml.stream.StreamingNotSupported):
+        yaxml.stream_yaml_as_xml('a: {"{urn:x}b": {}}', io.StringIO())
+    out = io.StringIO()
+    yaxml.stream_yaml_as_xml('p:a: {_q:x: 1, é: {}}', out)
+    assert '<p:a q:x="1"><é /></p:a>' == out.getvalue()
+
+    out = io.StringIO()
+    yaxml.stream_yaml_as_xml(dup, out, check_duplicates=False)
+    assert '<Root x="2"><A /><A y="3" /></Root>' == out.getvalue()
+
+
+def test_dump_yaml_as_xml():
+    source = 'Root:\n    Item:\n' + ''.join(
+        '        - I{}: {{_v: "é{}"}}\n'.format(i, i) for i in range(100))
+    expected = ET.tostring(yaxml.load_yaml_as_xml(source).getroot(), 'unicode')
+
+    out = io.StringIO()
+    yaxml.dump_yaml_as_xml(source, out, chunk_size=100)
+    assert expected == out.getvalue()
+
+    out = io.BytesIO()
+    yaxml.dump_yaml_as_xml(source, out, chunk_size=100)
+    assert expected.encode('utf-8') == out.getvalue()
+
+    out = io.BytesIO()
+    yaxml.dump_yaml_as_xml(source, out, encoding='us-ascii', xml_declaration=True)
+    assert ET.tostring(yaxml.load_yaml_as_xml(source).getroot(), 'us-ascii',
+                       xml_declaration=True) == out.getvalue()
+
+    a, b = socket.socketpair()
+    with a, b:
+        yaxml.dump_yaml_as_xml('Root: {_v: 1}', a)
+        a.shutdown(socket.SHUT_WR)
+        assert b'<Root v="1" />' == b.recv(100)
+
+    # nothing malformed is written, whatever the target and wherever the error is
+    for bad in ['"1a": {}', 'I x: {}', 'I90: {_v: "\\x01"}', 'I90: {"_v w": 1}',
+                'I90: {"_v\\x01": 1}']:
+        source = 'Root:\n    Item:\n' + ''.join(
+            '        - {}\n'.format(bad if 90 == i else 'I{}: {{_v: {}}}'.format(i, i))
+            for i in range(100))
+        with pytest.raises(AssertionError):
+            yaxml.load_yaml_as_xml(source)
+        for out in [io.StringIO(), io.BytesIO()]:
+            with pytest.raises(AssertionError):
+                yaxml.dump_yaml_as_xml(source, out, chunk_size=100)
+            assert '<I90' not in str(out.getvalue())
+        for target in [io.StringIO(), ET.TreeBuilder(), ET.XMLPullParser()]:
+            with pytest.raises(AssertionError):
+                yaxml.stream_yaml_as_xml(source, target, check_duplicates=False)
+        a, b = socket.socketpair()
+        with a, b:
+            with pytest.raises(AssertionError):
+                yaxml.dump_yaml_as_xml(source, a, chunk_size=100)
+            a.shutdown(socket.SHUT_WR)
+            sent = b''
+            while True:
+                chunk = b.recv(65536)
+                if not chunk:
+                    break
+                sent += chunk
+            assert sent.startswith(b'<Root><Item><I0 v="0" />') and b'<I90' not in sent
+
+
+def test_load_yaml_as_xml_validate_modes():
+    # (source, whether xmllint accepts its XML): namespace errors don't fail it
+    sources = [
+        ('Root: {é-1.x: {}}', True),
+        ('Root: {1a: {}}', False),
+        ('Root: {a b: {}}', False),
+        ('Root: {_1a: 1}', False),
+        ('Root: {p:x: {}}', True),
+        ('p:a: {}', True),
+        ('a: {_p:x: 1}', True),
+        ('a: {"_xmlns:p": "", b: {}}', True),
+        ('Root: {p:1a: {}}', True),
+        ('Root: {_xmlns:p: "urn:p", p:x: {_p:y: 1, _xml:lang: en}}', True),
+        ('Root: {_xmlns: "urn:d", x: {}}', True),
+        ('Root: {_a: "\\x01"}', False),
+        ('Root: {_a: "\\t<&>"}', True),
+        ('Root: {"{urn:x}a": {}}', True),
+        ('Root: {"{urn:x}a b": {}}', False),
+        ('Root: {_xmlns:p: "urn:p", _xmlns:q: "urn:p", x: {_p:a: 1, _q:a: 2}}', True),
+        ('Root: {_xmlns:p: "urn:p", _p:a: 1, "_{urn:p}a": 2}', True),
+        ('Root: {_xmlns:p: ""}', True),
+        ('Root: {_xmlns:xml: "urn:x"}', True),
+        ('Root: {_xmlns:xmlns: "u"}', True),
+        ('Root: {_xmlns:p: "http://www.w3.org/2000/xmlns/"}', True),
+    ]
+    xmllint = shutil.which('xmllint')
+    for source, accepted in sources:
+        xml = ET.tostring(yaxml.load_yaml_as_xml(source, validate='none').getroot(), 'unicode')
+        if xmllint:
+            assert accepted == (0 == yaxml.run_validator(xml, None, 'xmllint')[0]), source
+        try:
+            names = ET.tostring(yaxml.load_yaml_as_xml(source).getroot(), 'unicode')
+        except AssertionError:
+            names = None
+        assert (xml if accepted else None) == names, source
+
+
+def test_rngyaml_cache(tmp_path, monkeypatch):
+    cache = yaxml.RngYamlCache(str(tmp_path), max_entries=2)
+    expected = load_rngyaml(ZERO_OR_MORE)
+    y = yaxml.load_rngyaml(ZERO_OR_MORE, cache=cache)
+    assert expected == y
+    y['child'] = None
+    assert expected == yaxml.load_rngyaml(ZERO_OR_MORE, cache=cache)
+    assert (1, 1) == (cache.hits, cache.misses)
+
+    cache2 = yaxml.RngYamlCache(str(tmp_path), max_entries=2)
+    assert expected == cache2.load_rngyaml(ZERO_OR_MORE)
+    assert ET.tostring(yaxml.compile_rngyaml_to_rng(expected), 'unicode') == \
+        cache2.load_rng(ZERO_OR_MORE)
+    assert (2, 0) == (cache2.hits, cache2.misses)
+
+    for source in [SIMPLE, ELEM_DIC, ATTR_ONLY]:
+        cache2.load_rngyaml(source, False)
+    assert 2 == len(cache2.entries())
+    cache2.invalidate(ATTR_ONLY)
+    assert 1 == len(cache2.entries())
+    cache2.invalidate()
+    assert [] == cache2.entries()
+    cache2.load_rngyaml(SIMPLE)
+    assert 4 == cache2.misses
+
+    # entries of another format are neither found nor read back
+    path, = [ p for _, _, p in cache2.entries() ]
+    monkeypatch.setattr(yaxml.cache, 'CACHE_FORMAT', yaxml.cache.CACHE_FORMAT + 1)
+    cache3 = yaxml.RngYamlCache(str(tmp_path))
+    assert cache3._path(cache3.key(SIMPLE)) != path
+    assert None is cache3._read(os.path.basename(path)[ :-len(cache3.SUFFIX)])
+    cache3.load_rngyaml(SIMPLE)
+    assert (0, 1) == (cache3.hits, cache3.misses)
+
+    # so are those of another yaxml version or loaded with another loader
+    key = cache3.key(SIMPLE)
+    assert key == cache3.key(SIMPLE, yaxml.YAML_LOADER)
+    assert key != cache3.key(SIMPLE, yaml.BaseLoader)
+    monkeypatch.setattr(yaxml.cache, '__version__', yaxml.__version__ + '.1')
+    assert key != cache3.key(SIMPLE)
+    assert None is cache3._read(key)
+    cache3.load_rngyaml(SIMPLE)
+    assert (0, 2) == (cache3.hits, cache3.misses)
+
+
+def test_asyncio_api():
+    docs = [
+        '<addressBook/>',
+        '<addressBook>',
+        '<addressBook><card id="1"><name>x</name></card></addressBook>',
+        '<addressBook><card id="x"><name>x</name></card></addressBook>',
+    ]
+
+    async def main():
+        yaxml.aio.set_validation_concurrency(2)
+        results = await asyncio.gather(*[
+            yaxml.arun_validator(d, ADDRESS_BOOK_RNG, backend)
+            for backend in ['python', 'xmllint'] for d in docs ])
+        xml = await yaxml.aload_yaml_as_xml('Root: {_a: 1}', validate='full')
+        ok = await yaxml.avalidate(ET.tostring(xml.getroot(), 'unicode'), backend='xmllint')
+        return [ rc for rc, _ in results ], ET.tostring(xml.getroot(), 'unicode'), ok
+
+    concurrency = yaxml.aio.validation_concurrency
+    try:
+        rcs, xml, ok = asyncio.run(main())
+    finally:
+        yaxml.aio.set_validation_concurrency(concurrency)
+    assert [0, 4, 0, 3] * 2 == rcs
+    assert '<Root a="1" />' == xml
+    assert ok
+
+
+def test_validator_pool():
+    docs = [
+        '<addressBook/>',
+        '<addressBook>',
+        '<addressBook><card id="1"><name>x</name></card></addressBook>',
+        '<addressBook><card id="x"><name>x</name></card></addressBook>',
+    ] * 3
+    yaxml.pool.configure(2, 'python')
+    try:
+        assert 'pool' == yaxml.select_backend('auto')
+        assert [0, 4, 0, 3] * 3 == [ rc for rc, _ in yaxml.validate_many(docs, ADDRESS_BOOK_RNG) ]
+        assert yaxml.validate(docs[0], ADDRESS_BOOK_RNG)
+
+        pool = yaxml.pool.get_pool()
+        pool._idle[-1].process.kill()
+        pool._idle[-1].process.join()
+        assert [0, 4, 0, 3] == [ yaxml.run_validator(d, ADDRESS_BOOK_RNG)[0] for d in docs[ :4] ]
+        assert 1 == pool.restarts
+
+        # exceptions come back without taking the worker down
+        for _ in range(3):
+            with pytest.raises(yaxml.relaxng.RelaxNGNotSupported):
+                yaxml.run_validator(docs[0], '<externalRef href="x.rng" '
+                                    'xmlns="http://relaxng.org/ns/structure/1.0"/>')
+        assert 1 == pool.restarts
+    finally:
+        yaxml.pool.shutdown()
+    assert 'pool' != yaxml.select_backend('auto')
+
+    class Unpicklable(Exception):
+        def __init__(self, message, detail):
+            super(Unpicklable, self).__init__(message)
+            self.detail = detail
+
+    e = Unpicklable('bad', lambda: None)
+    assert e is not yaxml.pool._picklable(e)
+    assert isinstance(yaxml.pool._picklable(e), yaxml.pool.ValidatorWorkerError)
+    assert 'Unpicklable: bad' == str(yaxml.pool._picklable(e))
+    assert isinstance(yaxml.pool._picklable(OSError(2, 'x')), OSError)
@@ -0,0 +1,166 @@
+import os
+import os.path
+import tempfile
+import collections
+import concurrent.futures
+import xml.etree.ElementTree as ET
+
+from . import (
+    Exc, load_yaml_as_xml, load_rngyaml, compile_rngyaml_to_rng, run_validator, select_backend,
+    compile_value_checks)
+from . import pool
+
+YAML_SUFFIXES = ('.yaml', '.yml')
+
+# jobs submitted to the pool per worker ahead of the results read back
+JOBS_PER_WORKER = 4
+
+ConvertResult = collections.namedtuple('ConvertResult', ['src', 'dst', 'changed', 'error'])
+
+# mkstemp() creates files readable only by their owner; outputs get the mode open() would give
+_UMASK = os.umask(0o22)
+os.umask(_UMASK)
+
+
+class OutputCollision(Exc):
+    def __init__(self, dst, srcs):
+        super(OutputCollision, self).__init__(
+            '{} would all be converted to {}', ', '.join(srcs), dst)
+        self.dst = dst
+        self.srcs = srcs
+
+
+def find_yaml_files(src_dir):
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(YAML_SUFFIXES):
+                yield os.path.join(dirpath, filename)
+
+
+def xml_path_for(src, src_dir, dst_dir):
+    rel = os.path.relpath(src, src_dir)
+    return os.path.join(dst_dir, os.path.splitext(rel)[0] + '.xml')
+
+
+def tree_jobs(src_dir, dst_dir):
+    '''
+    The ``(src, dst)`` pair of every YAML file under ``src_dir``; raises
+    :class:`OutputCollision` if two of them (say ``a.yaml`` and ``a.yml``) map to one output
+    '''
+
+    jobs = []
+    srcs = {}
+    for src in find_yaml_files(src_dir):
+        dst = xml_path_for(src, src_dir, dst_dir)
+        srcs.setdefault(os.path.normcase(dst), []).append(src)
+        jobs.append((src, dst))
+    for src, dst in jobs:
+        if 1 < len(srcs[os.path.normcase(dst)]):
+            raise OutputCollision(dst, srcs[os.path.normcase(dst)])
+    return jobs
+
+
+def compile_schema(schema):
+    '''
+    Compile the RngYaml ``schema`` (a path or the document itself) to a RELAX NG string
+    '''
+
+    return ET.tostring(compile_rngyaml_to_rng(load_rngyaml(schema)), 'unicode')
+
+
+def write_if_changed(path, data):
+    try:
+        with open(path, 'rb') as fp:
+            if fp.read() == data:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(
+        '.tmp', os.path.basename(path) + '.', os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def convert_file(src, dst, rng=None, attribute_prefix='_', checks=None):
+    '''
+    Convert the YAML file ``src`` into the XML file ``dst``, optionally validating it against
+    the RELAX NG string ``rng`` and the :class:`yaxml.ValueChecks` ``checks``.  ``dst`` is
+    left untouched if its content wouldn't change.  Validation never goes through the
+    :mod:`yaxml.pool`, since this runs on a process pool of its own.
+    '''
+
+    try:
+        with open(src, 'rb') as fp:
+            xml = load_yaml_as_xml(fp, attribute_prefix, checks=checks)
+        data = ET.tostring(xml.getroot(), 'utf-8')
+        if rng:
+            rc, err = run_validator(data.decode('utf-8'), rng,
+                                    select_backend('auto', rng, use_pool=False))
+            if 0 != rc:
+                return ConvertResult(src, dst, False, err)
+        return ConvertResult(src, dst, write_if_changed(dst, data), None)
+    except Exception as e:
+        return ConvertResult(src, dst, False, '{}: {}'.format(type(e).__name__, e))
+
+
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+    # one validator pool per tree worker would multiply the processes
+    pool.configure(0)
+
+
+def _convert_in_worker(src, dst):
+    return convert_file(src, dst, *_worker_args)
+
+
+def convert_tree(src_dir, dst_dir, schema=None, workers=None, attribute_prefix='_'):
+    '''
+    Convert every YAML file under ``src_dir`` into an XML file at the same relative path
+    under ``dst_dir``, and yield a :class:`ConvertResult` for each file as it finishes
+
+    The optional RngYaml ``schema`` is compiled once, along with its value checks, and handed
+    to each worker once.  ``workers`` is the size of the process pool (``None`` for
+    ``os.cpu_count()``); ``1`` converts in this process.  Raises :class:`OutputCollision`
+    before converting anything if two files would be converted to the same output.
+    '''
+
+    jobs = tree_jobs(src_dir, dst_dir)
+    rng = compile_schema(schema) if schema else None
+    checks = compile_value_checks(schema) if schema else None
+
+    if 1 == workers:
+        for src, dst in jobs:
+            yield convert_file(src, dst, rng, attribute_prefix, checks)
+        return
+
+    max_pending = JOBS_PER_WORKER * (workers or os.cpu_count() or 1)
+    pending = set()
+    executor = concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(rng, attribute_prefix, checks))
+    try:
+        for src, dst in jobs:
+            pending.add(executor.submit(_convert_in_worker, src, dst))
+            if len(pending) < max_pending:
+                continue
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
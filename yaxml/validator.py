@@ -0,0 +1,273 @@
+'''
+Validate loaded YAML objects directly against an RngYaml pattern tree
+
+:class:`RngYamlValidator` reads a document the way :func:`yaxml.load_yaml_as_xml` would convert
+it (keys with the attribute prefix are attributes, other keys are child elements and lists
+repeat their items in place) and matches it against the patterns, without building any XML.
+'''
+
+from . import parse_rngyaml, to_nodes, Node, RngYamlParseError, _format_path, _trampoline
+from .relaxng import is_whitespace
+
+
+class _Element(object):
+    '''
+    The attributes and child elements of an element in a YAML document, in XML order
+    '''
+
+    __slots__ = ('attrib', 'children', 'error')
+
+    def __init__(self, value, attribute_prefix):
+        self.attrib = {}
+        self.children = []
+        self.error = None
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    if not isinstance(k, str):
+                        self.error = "what is the key {!r} of type {}".format(k, type(k))
+                    elif attribute_prefix == k[ :len(attribute_prefix)]:
+                        s = str(v)
+                        if isinstance(v, bool):
+                            s = s.lower()
+                        self.attrib[k[len(attribute_prefix): ]] = s
+                    else:
+                        self.children.append((k, v))
+            elif isinstance(value, list):
+                stack.extend(reversed(value))
+            else:
+                self.error = "unexpected structure: {} (of type {})".format(value, type(value))
+
+
+class RngYamlValidator(object):
+    '''
+    Checks YAML objects (as returned by :func:`yaxml.load_yaml`) against the RngYaml
+    ``schema``, a path, a string or a pattern tree as returned by :func:`yaxml.load_rngyaml`
+
+    ``element``, ``attribute``, ``interleave``, ``text``, ``empty`` and the ``*``, ``+`` and
+    ``?`` modifiers are supported.  The ``(path, value)`` pairs the schema's non-boolean
+    scalars leave behind are kept in :attr:`extra_checks`.
+
+    >>> v = RngYamlValidator('schema: {r: {a*: {_x: true}}}')
+    >>> v.validate({'r': [{'a': {'_x': 1}}, {'a': {'_x': 2}}]})
+    (True, '')
+    >>> v.validate({'r': {'a': {'_y': 1}}})
+    (False, '/r/a: attribute y is not allowed')
+    '''
+
+    def __init__(self, schema, attribute_prefix='_', loader=None):
+        if isinstance(schema, (dict, Node)):
+            self.extra_checks = []
+        else:
+            schema, self.extra_checks = parse_rngyaml(schema, loader)
+        self.pattern = to_nodes(schema)
+        self.attribute_prefix = attribute_prefix
+        self._attributes = {}
+        self._names = {}
+        self._check_schema()
+
+    def validate(self, obj):
+        '''
+        Check the YAML object ``obj`` and return ``(ok, error_message)``
+        '''
+
+        if not isinstance(obj, dict) or 1 != len(obj):
+            return (False, "/: the top-level datatype must be a mapping with a single entry")
+        (name, value), = obj.items()
+        errors = []
+        root = (str(name), value)
+        ends = _trampoline(self._match(self.pattern, [root], 0, (None, {}, errors)))
+        if 1 in ends:
+            return (True, '')
+        if not errors:
+            errors.append("/{}: unexpected root element".format(name))
+        return (False, errors[0])
+
+    def is_valid(self, obj):
+        return self.validate(obj)[0]
+
+    def _check_schema(self):
+        # like xmllint, reject schemas in which two operands of an interleave share a name or
+        # an element has two attributes of the same name
+        stack = [(None, self.pattern)]
+        while stack:
+            path, p = stack.pop()
+            if isinstance(p, tuple):
+                stack.extend((path, q) for q in p)
+                continue
+            if p is None:
+                continue
+            if 'interleave' == p.element:
+                seen = set()
+                for q in p.child if isinstance(p.child, tuple) else (p.child, ):
+                    names = self._element_names(q)
+                    if seen & names:
+                        raise RngYamlParseError("{}: element {} conflicts in interleave",
+                                                _format_path(path), min(seen & names))
+                    seen |= names
+            elif 'element' == p.element:
+                self._attribute_specs(p.child, (path, p.name))
+            stack.append(((path, p.name) if p.name is not None else path, p.child))
+
+    def _attribute_specs(self, pattern, path=None):
+        '''
+        ``{name: (required, child pattern)}`` for the attributes of an element's content
+        '''
+
+        specs = self._attributes.get(id(pattern))
+        if specs is not None:
+            return specs[1]
+        specs = {}
+        stack = [(pattern, True)]
+        while stack:
+            p, required = stack.pop()
+            if isinstance(p, tuple):
+                stack.extend((q, required) for q in p)
+            elif p is None or 'element' == p.element:
+                continue
+            elif 'attribute' == p.element:
+                if p.name in specs:
+                    raise RngYamlParseError("{}: duplicate attribute {}",
+                                            _format_path(path), p.name)
+                specs[p.name] = (required, p.child)
+            else:
+                stack.append((p.child, required and p.element in ('oneOrMore', 'interleave')))
+        self._attributes[id(pattern)] = (pattern, specs)
+        return specs
+
+    def _element_names(self, pattern):
+        '''
+        The names of the child elements ``pattern`` may match
+        '''
+
+        names = self._names.get(id(pattern))
+        if names is not None:
+            return names[1]
+        names = set()
+        stack = [pattern]
+        while stack:
+            p = stack.pop()
+            if isinstance(p, tuple):
+                stack.extend(p)
+            elif p is None:
+                continue
+            elif 'element' == p.element:
+                names.add(p.name)
+            elif 'attribute' != p.element:
+                stack.append(p.child)
+        names = frozenset(names)
+        self._names[id(pattern)] = (pattern, names)
+        return names
+
+    def _match(self, p, children, i, context):  # noqa: C901
+        '''
+        The set of positions ``j`` such that ``p`` matches ``children[i:j]``
+        '''
+
+        if isinstance(p, tuple):
+            positions = {i}
+            for q in p:
+                following = set()
+                for k in positions:
+                    following |= yield self._match(q, children, k, context)
+                positions = following
+                if not positions:
+                    break
+            return positions
+
+        kind = p.element
+        if 'element' == kind:
+            if i < len(children) and p.name == children[i][0]:
+                ok = yield self._check(p, children[i], context)
+                if ok:
+                    return {i + 1}
+            return set()
+        elif kind in ('attribute', 'text', 'empty'):
+            return {i}
+        elif 'optional' == kind:
+            return {i} | (yield self._match(p.child, children, i, context))
+        elif kind in ('zeroOrMore', 'oneOrMore'):
+            reached = {i} if 'zeroOrMore' == kind else set()
+            frontier = {i}
+            while frontier:
+                following = set()
+                for k in frontier:
+                    following |= yield self._match(p.child, children, k, context)
+                frontier = following - reached
+                reached |= following
+            return reached
+        elif 'interleave' == kind:
+            return (yield self._match_interleave(p, children, i, context))
+        raise Exception("{}: unsupported pattern {!r}".format(
+            _format_path(context[0]), kind))
+
+    def _match_interleave(self, p, children, i, context):
+        # the names of the operands are disjoint, so each child belongs to a single operand
+        operands = p.child if isinstance(p.child, tuple) else (p.child, )
+        owner = {}
+        for n, q in enumerate(operands):
+            for name in self._element_names(q):
+                owner[name] = n
+        subsequences = [ [] for _ in operands ]
+        ends = [i]
+        for child in children[i: ]:
+            n = owner.get(child[0])
+            if n is None:
+                break
+            subsequences[n].append(child)
+            ends.append(ends[-1] + 1)
+        matches = []
+        for q, sub in zip(operands, subsequences):
+            matches.append((yield self._match(q, sub, 0, context)))
+
+        positions = set()
+        counts = [0] * len(operands)
+        for k, j in enumerate(ends):
+            if k:
+                counts[owner[children[j - 1][0]]] += 1
+            if all(c in m for c, m in zip(counts, matches)):
+                positions.add(j)
+        return positions
+
+    def _check(self, p, child, context):
+        '''
+        Whether the ``(name, value)`` ``child`` is valid against the element pattern ``p``
+        '''
+
+        parent_path, checked, errors = context
+        key = (id(p), id(child))
+        ok = checked.get(key)
+        if ok is not None:
+            return ok
+        name, value = child
+        path = (parent_path, name)
+        element = _Element(value, self.attribute_prefix)
+        error = element.error
+        if error is None:
+            error = self._check_attributes(p, element)
+        if error is None:
+            ends = yield self._match(p.child, element.children, 0, (path, {}, errors))
+            if len(element.children) not in ends:
+                error = "unexpected or missing child elements {}".format(
+                    [ n for n, _ in element.children ])
+        if error is not None:
+            errors.append("{}: {}".format(_format_path(path), error))
+        checked[key] = ok = error is None
+        return ok
+
+    def _check_attributes(self, p, element):
+        specs = self._attribute_specs(p.child)
+        for name, value in element.attrib.items():
+            spec = specs.get(name)
+            if spec is None:
+                return "attribute {} is not allowed".format(name)
+            value_pattern = spec[1]
+            if isinstance(value_pattern, Node) and 'empty' == value_pattern.element and \
+                    not is_whitespace(value):
+                return "attribute {} must be empty".format(name)
+        for name, (required, _) in specs.items():
+            if required and name not in element.attrib:
+                return "attribute {} is missing".format(name)
+        return None
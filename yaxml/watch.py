@@ -0,0 +1,191 @@
+'''
+Keep a tree of XML files up to date with a tree of YAML files
+
+:class:`TreeWatcher` polls the source tree and keeps a manifest of the SHA-256 of every YAML
+file it converted and of the schema it validated against, so that only the files whose content
+(or whose schema) changed are converted again, across restarts too.  The schema is compiled once
+and kept in memory until its content changes.
+'''
+
+import os
+import os.path
+import json
+import time
+import hashlib
+
+from . import Path, is_filepath, compile_value_checks
+from .tree import (
+    tree_jobs, xml_path_for, compile_schema, convert_file, ConvertResult, OutputCollision)
+
+MANIFEST_NAME = '.yaxml-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class TreeWatcher(object):
+    '''
+    Converts the YAML files under ``src_dir`` into ``dst_dir`` like :func:`yaxml.convert_tree`,
+    on every :meth:`scan` only those which changed since the last one
+
+    The manifest is kept in ``manifest`` (``dst_dir/.yaxml-manifest.json`` by default).  The
+    files are only read when their size or mtime changed.
+    '''
+
+    def __init__(self, src_dir, dst_dir, schema=None, attribute_prefix='_', manifest=None):
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        # decided once, so that a schema file being replaced isn't taken for a document
+        self.schema = Path(schema) if schema and is_filepath(schema) else schema
+        self.attribute_prefix = attribute_prefix
+        self.manifest_path = manifest or os.path.join(dst_dir, MANIFEST_NAME)
+        self._rng = None
+        self._checks = None
+        self._schema_digest = None
+        self._schema_stat = None
+        self._stats = {}
+        self.files, manifest_schema = self._read_manifest()
+        if manifest_schema != self._check_schema():
+            self.files = {}
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return ({}, None)
+        if MANIFEST_VERSION != manifest.get('version'):
+            return ({}, None)
+        return (manifest.get('files') or {}, manifest.get('schema'))
+
+    def _write_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({'version': MANIFEST_VERSION, 'schema': self._schema_digest,
+                       'files': self.files}, fp, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def _check_schema(self):
+        '''
+        Recompile the schema if its content changed; returns its digest
+        '''
+
+        if not self.schema:
+            return None
+        if isinstance(self.schema, Path):
+            st = os.stat(self.schema)
+            stat = (st.st_mtime_ns, st.st_size)
+            if stat == self._schema_stat:
+                return self._schema_digest
+            self._schema_stat = stat
+            digest = file_digest(self.schema)
+        else:
+            digest = hashlib.sha256(self.schema.encode('utf-8')).hexdigest()
+        if digest != self._schema_digest:
+            self._rng = compile_schema(self.schema)
+            self._checks = compile_value_checks(self.schema)
+            self._schema_digest = digest
+        return digest
+
+    def _changed(self, src, rel):
+        '''
+        The new digest of ``src`` if it changed since it was last converted, or None
+        '''
+
+        st = os.stat(src)
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stats.get(rel) and rel in self.files:
+            return None
+        self._stats[rel] = stat
+        digest = file_digest(src)
+        if digest == self.files.get(rel):
+            return None
+        return digest
+
+    def scan(self):  # noqa: C901
+        '''
+        Convert the files which changed (all of them if the schema did) and remove the outputs
+        of the deleted ones; returns the :class:`yaxml.tree.ConvertResult` of each file handled
+
+        A schema which fails to compile is reported as a result with the schema as ``src``,
+        and the previous one stays in use.  Files which would be converted to the same output
+        are each reported as a failed result, and nothing is converted until they're renamed.
+        '''
+
+        old_digest = self._schema_digest
+        try:
+            if self._check_schema() != old_digest:
+                self.files = {}
+        except Exception as e:
+            # keep going with the schema compiled last
+            return [ConvertResult(self.schema, None, False, '{}: {}'.format(type(e).__name__, e))]
+        try:
+            jobs = tree_jobs(self.src_dir, self.dst_dir)
+        except OutputCollision as e:
+            return [ ConvertResult(src, e.dst, False, str(e)) for src in e.srcs ]
+        results = []
+        seen = set()
+        for src, dst in jobs:
+            rel = os.path.relpath(src, self.src_dir)
+            seen.add(rel)
+            try:
+                digest = self._changed(src, rel)
+            except OSError:
+                continue
+            if None is digest:
+                continue
+            results.append(convert_file(src, dst, self._rng, self.attribute_prefix,
+                                        self._checks))
+            # failed files are recorded as well and retried once they change
+            self.files[rel] = digest
+
+        results.extend(self._remove_deleted(seen))
+
+        if results or old_digest != self._schema_digest:
+            self._write_manifest()
+        return results
+
+    def _remove_deleted(self, seen):
+        results = []
+        for rel in sorted(set(self.files) - seen):
+            del self.files[rel]
+            self._stats.pop(rel, None)
+            src = os.path.join(self.src_dir, rel)
+            dst = xml_path_for(src, self.src_dir, self.dst_dir)
+            try:
+                os.remove(dst)
+            except FileNotFoundError:
+                pass
+            results.append(ConvertResult(src, dst, True, None))
+        return results
+
+    def watch(self, interval=1.0, stop=None):
+        '''
+        :meth:`scan` every ``interval`` seconds and yield the results, until the
+        ``threading.Event``-like ``stop`` is set
+        '''
+
+        while True:
+            yield from self.scan()
+            if None is not stop:
+                if stop.wait(interval):
+                    return
+            else:
+                time.sleep(interval)
+
+
+def watch_tree(src_dir, dst_dir, schema=None, interval=1.0, attribute_prefix='_', stop=None,
+               manifest=None):
+    '''
+    Same as ``TreeWatcher(src_dir, dst_dir, schema, ...).watch(interval, stop)``
+    '''
+
+    watcher = TreeWatcher(src_dir, dst_dir, schema, attribute_prefix, manifest)
+    return watcher.watch(interval, stop)